@@ -0,0 +1,305 @@
+import sys
+import struct
+import argparse
+from peephole import Inst, LABEL, RAW
+from errors import AssemblyError
+
+
+# Register numbers, by name ('$0'-'$31' work too)
+REGISTERS = {
+	'$zero': 0, '$at': 1, '$v0': 2, '$v1': 3, '$a0': 4, '$a1': 5, '$a2': 6, '$a3': 7,
+	'$t0': 8, '$t1': 9, '$t2': 10, '$t3': 11, '$t4': 12, '$t5': 13, '$t6': 14, '$t7': 15,
+	'$s0': 16, '$s1': 17, '$s2': 18, '$s3': 19, '$s4': 20, '$s5': 21, '$s6': 22, '$s7': 23,
+	'$t8': 24, '$t9': 25, '$k0': 26, '$k1': 27, '$gp': 28, '$sp': 29, '$fp': 30, '$ra': 31
+}
+REGISTERS.update({f'${idx}': idx for idx in range(32)})
+
+MASK = 0xffffffff
+
+# Encoding of each instruction: operands format, opcode, and function (or
+# 'rt' field for the REGIMM branches, 'rs' one for coprocessor moves)
+# Formats:
+#   'dst': rd, rs, rt     'dta': rd, rt, shift    'dts': rd, rt, rs
+#   'st': rs, rt          'd': rd                 's': rs
+#   'tsi': rt, rs, signed immediate               'tsu': rt, rs, unsigned one
+#   'ti': rt, unsigned immediate                  'tm': rt, offset(rs)
+#   'stb': rs, rt, label  'sb': rs, label         'j': label
+#   'tc': rt, coprocessor register                '': nothing
+ENCODINGS = {
+	'add': ('dst', 0, 0x20), 'addu': ('dst', 0, 0x21), 'sub': ('dst', 0, 0x22), 'subu': ('dst', 0, 0x23),
+	'and': ('dst', 0, 0x24), 'or': ('dst', 0, 0x25), 'xor': ('dst', 0, 0x26), 'nor': ('dst', 0, 0x27),
+	'slt': ('dst', 0, 0x2a), 'sltu': ('dst', 0, 0x2b),
+	'sll': ('dta', 0, 0x00), 'srl': ('dta', 0, 0x02), 'sra': ('dta', 0, 0x03),
+	'sllv': ('dts', 0, 0x04), 'srlv': ('dts', 0, 0x06), 'srav': ('dts', 0, 0x07),
+	'mult': ('st', 0, 0x18), 'multu': ('st', 0, 0x19), 'div': ('st', 0, 0x1a), 'divu': ('st', 0, 0x1b),
+	'mfhi': ('d', 0, 0x10), 'mflo': ('d', 0, 0x12),
+	'jr': ('s', 0, 0x08), 'jalr': ('s', 0, 0x09),
+	'addi': ('tsi', 0x08, 0), 'addiu': ('tsi', 0x09, 0), 'slti': ('tsi', 0x0a, 0), 'sltiu': ('tsi', 0x0b, 0),
+	'andi': ('tsu', 0x0c, 0), 'ori': ('tsu', 0x0d, 0), 'xori': ('tsu', 0x0e, 0), 'lui': ('ti', 0x0f, 0),
+	'lw': ('tm', 0x23, 0), 'sw': ('tm', 0x2b, 0),
+	'beq': ('stb', 0x04, 0), 'bne': ('stb', 0x05, 0), 'blez': ('sb', 0x06, 0), 'bgtz': ('sb', 0x07, 0),
+	'bltz': ('sb', 0x01, 0), 'bgez': ('sb', 0x01, 1),
+	'j': ('j', 0x02, 0), 'jal': ('j', 0x03, 0),
+	'mtc2': ('tc', 0x12, 0x04),
+	'nop': ('', 0, 0)
+}
+
+# Operands of each format
+OPERANDS = {
+	'dst': 3, 'dta': 3, 'dts': 3, 'st': 2, 'd': 1, 's': 1, 'tsi': 3, 'tsu': 3,
+	'ti': 2, 'tm': 2, 'stb': 3, 'sb': 2, 'j': 1, 'tc': 2, '': 0
+}
+
+# Object image: magic, then the entry address (ENTRYLESS without one) and
+# the number of words, symbols and relocations, all big-endian
+MAGIC = b'CBO1'
+HEADER = struct.Struct('>4sIIII')
+ENTRYLESS = 0xffffffff
+
+# Symbol (address and name length, then the name) and relocation (address
+# of the 'j' or 'jal' to patch and name length, then the name)
+SYMBOL = struct.Struct('>IH')
+
+FORMATS = ('flat', 'object')
+
+
+
+# Signed 32 bits value #
+def s32(value):
+	value &= MASK
+	return value - 0x100000000 if value & 0x80000000 else value
+
+
+# Real instructions of a pseudo-instruction #
+# 'li' is one or two of them depending on the constant, like an assembler
+# would expand it (only the first one goes in a delay slot)
+def expand(inst):
+	if inst.op == 'li':
+		value = s32(int(inst.args[1], 0))
+		if -0x8000 <= value <= 0x7fff:
+			return [Inst('addiu', (inst.args[0], '$zero', str(value)))]
+		if 0 <= value <= 0xffff:
+			return [Inst('ori', (inst.args[0], '$zero', str(value)))]
+		
+		high, low = (value >> 16) & 0xffff, value & 0xffff
+		if not low:
+			return [Inst('lui', (inst.args[0], str(high)))]
+		return [Inst('lui', (inst.args[0], str(high))), Inst('ori', (inst.args[0], inst.args[0], str(low)))]
+	
+	if inst.op == 'move':
+		return [Inst('addu', (inst.args[0], inst.args[1], '$zero'))]
+	
+	return [inst]
+
+
+
+class Assembler:
+	# Initialize assembler #
+	# Encodes 'asm' (lines of assembly, as the generators emit it) into
+	# machine words, the first one at 'base'
+	# 'out' are the words, 'labels' the address of each label and 'entry' the
+	# one of the '.entry' label (None without the directive)
+	# With 'extern', jumps to labels that are not defined are left for a
+	# linker, in 'relocations' as '(address, label)' (otherwise it's an error)
+	def __init__(self, code, asm, base=0, extern=False):
+		self.code = code
+		self.base = base
+		self.extern = extern
+		self.out = []
+		self.labels = {}
+		self.relocations = []
+		self.entry = None
+		self(asm)
+	
+	
+	# Assembles the lines #
+	# Two passes: the addresses of the labels, then the encoding
+	def __call__(self, asm):
+		insts = []
+		entry = None
+		for line in '\n'.join(asm).split('\n'):
+			inst = Inst.parse(line)
+			if inst.op == RAW:
+				words = line.split()
+				if words and words[0] == '.entry' and len(words) > 1:
+					entry = words[1]
+			
+			elif inst.op == LABEL:
+				self.labels[inst.args[0]] = self.base + 4 * len(insts)
+			
+			elif inst.op not in ENCODINGS and inst.op not in ('li', 'move'):
+				raise AssemblyError(f"Unknown instruction '{inst.op}'", line)
+			
+			else:
+				try:
+					insts += ((real, line) for real in expand(inst))
+				except (ValueError, IndexError):
+					raise AssemblyError(f"Bad operands of '{inst.op}'", line) from None
+		
+		if entry is not None:
+			if entry not in self.labels:
+				raise AssemblyError(f"Entry point '{entry}' not found")
+			self.entry = self.labels[entry]
+		
+		for inst, line in insts:
+			try:
+				self.out.append(self.encode(inst, self.base + 4 * len(self.out)))
+			except AssemblyError as e:
+				e.line = line
+				raise
+			except (ValueError, IndexError, KeyError):
+				raise AssemblyError(f"Bad operands of '{inst.op}'", line) from None
+	
+	
+	# Machine word of an instruction #
+	def encode(self, inst, address):
+		kind, opcode, function = ENCODINGS[inst.op]
+		args = inst.args
+		if len(args) != OPERANDS[kind]:
+			raise AssemblyError(f"Wrong number of operands of '{inst.op}'")
+		
+		reg = REGISTERS.__getitem__
+		match kind:
+			case 'dst':
+				return reg(args[1]) << 21 | reg(args[2]) << 16 | reg(args[0]) << 11 | function
+			
+			case 'dta':
+				return reg(args[1]) << 16 | reg(args[0]) << 11 | self.immediate(args[2], 0, 31) << 6 | function
+			
+			case 'dts':
+				return reg(args[2]) << 21 | reg(args[1]) << 16 | reg(args[0]) << 11 | function
+			
+			case 'st':
+				return reg(args[0]) << 21 | reg(args[1]) << 16 | function
+			
+			case 'd':
+				return reg(args[0]) << 11 | function
+			
+			# 'jalr' links in '$ra'
+			case 's':
+				return reg(args[0]) << 21 | (31 << 11 if inst.op == 'jalr' else 0) | function
+			
+			case 'tsi':
+				value = self.immediate(args[2], -0x8000, 0x7fff)
+				return opcode << 26 | reg(args[1]) << 21 | reg(args[0]) << 16 | value & 0xffff
+			
+			case 'tsu':
+				value = self.immediate(args[2], 0, 0xffff)
+				return opcode << 26 | reg(args[1]) << 21 | reg(args[0]) << 16 | value
+			
+			case 'ti':
+				return opcode << 26 | reg(args[0]) << 16 | self.immediate(args[1], 0, 0xffff)
+			
+			case 'tm':
+				offset, _, base = args[1].rstrip(')').partition('(')
+				value = self.immediate(offset or '0', -0x8000, 0x7fff)
+				return opcode << 26 | reg(base) << 21 | reg(args[0]) << 16 | value & 0xffff
+			
+			case 'stb':
+				return opcode << 26 | reg(args[0]) << 21 | reg(args[1]) << 16 | self.branch(args[2], address)
+			
+			case 'sb':
+				return opcode << 26 | reg(args[0]) << 21 | function << 16 | self.branch(args[1], address)
+			
+			case 'j':
+				return opcode << 26 | self.jump(args[0], address)
+			
+			case 'tc':
+				return opcode << 26 | function << 21 | reg(args[0]) << 16 | self.immediate(args[1].lstrip('$'), 0, 31) << 11
+			
+			case _:
+				return 0
+	
+	
+	# Immediate in a range #
+	def immediate(self, text, low, high):
+		value = int(text, 0)
+		if not low <= value <= high:
+			raise AssemblyError(f'Immediate {value} out of range ({low} to {high})')
+		return value
+	
+	
+	# Offset of a branch, in words from its delay slot #
+	def branch(self, label, address):
+		if label not in self.labels:
+			raise AssemblyError(f"Unknown label '{label}'")
+		
+		offset = (self.labels[label] - address - 4) >> 2
+		if not -0x8000 <= offset <= 0x7fff:
+			raise AssemblyError(f"Branch to '{label}' too far")
+		return offset & 0xffff
+	
+	
+	# Target field of a jump #
+	# Jumps stay in their 256 MB region, the 4 upper bits come from the delay
+	# slot address
+	def jump(self, label, address):
+		if label not in self.labels:
+			if not self.extern:
+				raise AssemblyError(f"Unknown label '{label}'")
+			self.relocations.append((address, label))
+			return 0
+		
+		target = self.labels[label]
+		if target >> 28 != (address + 4) >> 28:
+			raise AssemblyError(f"Jump to '{label}' out of its region")
+		return target >> 2 & 0x3ffffff
+	
+	
+	# Raw words, big-endian #
+	# Starts at 'base', so it has to be where the program starts too
+	def flat(self):
+		if self.relocations:
+			raise AssemblyError(f"Unknown label '{self.relocations[0][1]}'")
+		if self.entry is not None and self.entry != self.base:
+			raise AssemblyError('A flat image must start with its entry point')
+		return struct.pack(f'>{len(self.out)}I', *self.out)
+	
+	
+	# Object image #
+	# The words with the entry point, the symbols (every label) and the
+	# relocations, see MAGIC
+	def object(self):
+		entry = ENTRYLESS if self.entry is None else self.entry
+		data = [
+			HEADER.pack(MAGIC, entry, len(self.out), len(self.labels), len(self.relocations)),
+			struct.pack(f'>{len(self.out)}I', *self.out)
+		]
+		for name, address in (*self.labels.items(), *((name, address) for address, name in self.relocations)):
+			name = name.encode()
+			data += (SYMBOL.pack(address, len(name)), name)
+		
+		return b''.join(data)
+
+
+
+# Command line entry point #
+# Assembles files, writing the image next to each one
+def main(argv=None):
+	args = argparse.ArgumentParser(description='Assembles the MIPS assembly of the compiler into machine code.')
+	args.add_argument('files', nargs='+', help='assembly files')
+	args.add_argument('-f', '--format', choices=FORMATS, default='flat',
+	                  help="'flat' words, or an 'object' image with the entry point and symbols (default: flat)")
+	args.add_argument('--base', type=lambda text: int(text, 0), default=0, help='address of the first word (default: 0)')
+	args = args.parse_args(argv)
+	
+	status = 0
+	for fname in args.files:
+		output = fname.rsplit('.', 1)[0] + ('.bin' if args.format == 'flat' else '.o')
+		try:
+			with open(fname) as file:
+				code = file.read()
+			assembler = Assembler(code, code.split('\n'), args.base)
+			image = assembler.flat() if args.format == 'flat' else assembler.object()
+			with open(output, 'wb') as file:
+				file.write(image)
+		
+		except (OSError, AssemblyError) as e:
+			print(f'{fname}: FAILED: {e}')
+			status = 1
+	
+	return status
+
+
+if __name__ == '__main__':
+	sys.exit(main())
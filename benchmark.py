@@ -0,0 +1,298 @@
+import os
+import gc
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+from lexer import Lexer
+from parser import Parser
+from folder import Folder
+from generator import Generator
+from generator_ir import Generator as IRGenerator
+from lowering import Lowering
+from peephole import Peephole, SCHEDULED
+from scheduler import Scheduler
+
+
+# Phases timed, in pipeline order
+PHASES = ('lexer', 'parser', 'folder', 'generator', 'generator_ir', 'lowering', 'peephole', 'scheduler')
+
+# Sizes of the synthetic workloads
+SCALES = (1000, 10000, 100000)
+
+# Timings below this many seconds are noise, they are never flagged
+NOISE = 0.01
+
+# Growth over the linear one (10x the size, 10x the time) that is flagged,
+# when it's also NOISE seconds over the linear time
+SUPERLINEAR = 2.0
+
+# Runs of the workloads flagged as superlinear, measured again before failing
+CONFIRM = 5
+
+
+
+# Synthetic workloads #
+# Each one takes a scale and returns the source code
+
+# '1 + 2 + 3 + ...', one expression with 'n' operands
+def long_expression(n):
+	return 'int main() {\n\treturn ' + ' + '.join(str(i % 1000) for i in range(n)) + ';\n}\n'
+
+
+# '(0 - (1 - (2 - ... 1)))', 'n' levels of parentheses
+def deep_nesting(n):
+	return 'int main() {\n\treturn ' + ''.join(f'({i % 7} - ' for i in range(n)) + '1' + ')'*n + ';\n}\n'
+
+
+# 'n' small functions
+def many_functions(n):
+	return ''.join(f'int f{i}() {{\n\treturn {i} * 3 + 1;\n}}\n' for i in range(n)) + 'int main() {\n\treturn 0;\n}\n'
+
+
+# 'n' line and block comments around a tiny program
+# The lexer skips them while tokenizing, so they show in its time
+def heavy_comments(n):
+	comments = ''.join(f'// Line comment {i}\n/* Block\n * comment {i} */\n' for i in range(n))
+	return comments + 'int main() {\n\treturn 0; // The end\n}\n'
+
+
+WORKLOADS = {
+	'long': long_expression,
+	'deep': deep_nesting,
+	'functions': many_functions,
+	'comments': heavy_comments
+}
+
+
+
+# Times each phase on a source #
+# The generators get the AST before folding (everything here is constant,
+# so folding would leave them nothing to do), the folder its own copy
+def time_phases(code):
+	times = {}
+	clock = time.perf_counter
+	
+	start = clock()
+	lexer = Lexer(code)
+	times['lexer'] = clock() - start
+	
+	start = clock()
+	parser = Parser(code, lexer.out)
+	times['parser'] = clock() - start
+	
+	ast = Parser(code, lexer.out).out
+	start = clock()
+	Folder(code, ast)
+	times['folder'] = clock() - start
+	
+	start = clock()
+	generator = Generator(code, parser.out)
+	times['generator'] = clock() - start
+	
+	start = clock()
+	ir = IRGenerator(code, parser.out)
+	times['generator_ir'] = clock() - start
+	
+	start = clock()
+	Lowering(code, ir.mirror)
+	times['lowering'] = clock() - start
+	
+	start = clock()
+	peephole = Peephole(code, generator.out, SCHEDULED)
+	times['peephole'] = clock() - start
+	
+	start = clock()
+	Scheduler(code, peephole.out)
+	times['scheduler'] = clock() - start
+	
+	return times
+
+
+# Best time of each phase on some sources, over 'repeat' runs #
+# The time of a run is the sum over the sources
+# The garbage collector is off during the runs, like in 'timeit', or its
+# passes land on whichever phase happens to be running
+def measure(codes, repeat):
+	best = dict.fromkeys(PHASES, float('inf'))
+	for _ in range(repeat):
+		total = dict.fromkeys(PHASES, 0.0)
+		for code in codes:
+			gc.collect()
+			gc.disable()
+			try:
+				times = time_phases(code)
+			finally:
+				gc.enable()
+			
+			for phase, seconds in times.items():
+				total[phase] += seconds
+		
+		for phase in PHASES:
+			best[phase] = min(best[phase], total[phase])
+	
+	return best
+
+
+
+# Runs the benchmarks #
+# Returns the results, indexed by 'corpus' and '<workload>/<scale>'
+def run(workloads, scales, repeat, corpus='C', log=print):
+	results = {}
+	
+	sources = sorted(glob.glob(os.path.join(corpus, '**', '*.c'), recursive=True))
+	if sources and 'corpus' in workloads:
+		codes = []
+		for fname in sources:
+			with open(fname) as file:
+				codes.append(file.read())
+		
+		results['corpus'] = measure(codes, repeat)
+		log(row('corpus', results['corpus']))
+	
+	for name, make in WORKLOADS.items():
+		if name not in workloads:
+			continue
+		
+		for scale in scales:
+			key = f'{name}/{scale}'
+			results[key] = measure([make(scale)], repeat)
+			log(row(key, results[key]))
+	
+	return results
+
+
+# Table row, in milliseconds #
+def row(name, times):
+	return f'{name:<18}' + ''.join(f'{times[phase] * 1000:>13.2f}' for phase in PHASES)
+
+
+def header():
+	return f"{'ms':<18}" + ''.join(f'{phase:>13}' for phase in PHASES)
+
+
+
+# Phases that grow faster than the size of their workload #
+# Returns '(key, phase, growth)', the growth is 1 when linear
+def superlinear(results):
+	flagged = []
+	for name in WORKLOADS:
+		scales = sorted(int(key.split('/')[1]) for key in results if key.split('/')[0] == name)
+		for small, big in zip(scales, scales[1:]):
+			before = results[f'{name}/{small}']
+			after = results[f'{name}/{big}']
+			for phase in PHASES:
+				linear = before[phase] * (big / small)
+				if after[phase] - linear < NOISE:
+					continue
+				growth = after[phase] / max(linear, 1e-9)
+				if growth > SUPERLINEAR:
+					flagged.append((f'{name}/{big}', phase, growth))
+	
+	return flagged
+
+
+# Superlinear phases that still are when measured again #
+# The workloads flagged (and the smaller ones they are compared to) are
+# timed over 'repeat' runs, their results replaced by the new ones
+# Returns the phases flagged again, like 'superlinear'
+def confirm(results, flagged, repeat, log=print):
+	again = {}
+	for key, phase, growth in flagged:
+		name, big = key.split('/')
+		scales = sorted(int(other.split('/')[1]) for other in results if other.split('/')[0] == name)
+		small = scales[scales.index(int(big)) - 1]
+		for scale in (small, int(big)):
+			again.setdefault(f'{name}/{scale}', (name, scale))
+	
+	for key, (name, scale) in sorted(again.items()):
+		results[key] = measure([WORKLOADS[name](scale)], repeat)
+		log(row(key, results[key]))
+	
+	return [item for item in superlinear(results) if item[0] in again]
+
+
+# Phases slower than the baseline #
+# Returns '(key, phase, ratio)' for the ones over 'threshold' times slower
+def regressions(results, baseline, threshold):
+	flagged = []
+	for key, times in results.items():
+		for phase, seconds in times.items():
+			old = baseline.get(key, {}).get(phase)
+			if old is None or seconds < NOISE:
+				continue
+			ratio = seconds / max(old, 1e-9)
+			if ratio > threshold:
+				flagged.append((key, phase, ratio))
+	
+	return flagged
+
+
+
+# Command line entry point #
+# Returns the exit status, 1 if anything was flagged
+def main(argv=None):
+	args = argparse.ArgumentParser(description='Measures how long each compiler phase takes.')
+	args.add_argument('-w', '--workloads', default=','.join(('corpus', *WORKLOADS)),
+	                  help=f"comma separated (default: corpus,{','.join(WORKLOADS)})")
+	args.add_argument('-s', '--scales', default=','.join(map(str, SCALES)),
+	                  help=f"sizes of the synthetic workloads, comma separated (default: {','.join(map(str, SCALES))})")
+	args.add_argument('-r', '--repeat', type=int, default=3, help='runs of each benchmark, the best one counts (default: 3)')
+	args.add_argument('-o', '--output', metavar='FILE', help='save the results as JSON')
+	args.add_argument('-c', '--compare', metavar='FILE', help='compare with the results saved in FILE')
+	args.add_argument('-t', '--threshold', type=float, default=1.5,
+	                  help='slowdown over the baseline that counts as a regression (default: 1.5)')
+	args = args.parse_args(argv)
+	
+	workloads = set(args.workloads.split(','))
+	scales = [int(scale) for scale in args.scales.split(',')]
+	
+	print(header())
+	results = run(workloads, scales, args.repeat)
+	
+	# A single slow run is enough to look superlinear, so the flagged
+	# workloads are measured again with more runs before failing
+	flagged = superlinear(results)
+	if flagged:
+		print()
+		print(f'Measuring the superlinear workloads again ({max(args.repeat, CONFIRM)} runs):')
+		flagged = confirm(results, flagged, max(args.repeat, CONFIRM))
+	
+	if args.output:
+		with open(args.output, 'w') as file:
+			json.dump({
+				'python': platform.python_version(),
+				'platform': platform.platform(),
+				'repeat': args.repeat,
+				'results': results
+			}, file, indent='\t')
+	
+	status = 0
+	if flagged:
+		status = 1
+		print()
+		print('Superlinear growth:')
+		for key, phase, growth in flagged:
+			print(f'  {key} {phase}: {growth:.1f}x the linear time')
+	
+	if args.compare:
+		with open(args.compare) as file:
+			baseline = json.load(file)['results']
+		
+		flagged = regressions(results, baseline, args.threshold)
+		print()
+		if flagged:
+			status = 1
+			print(f'Regressions over {args.threshold}x the baseline:')
+			for key, phase, ratio in flagged:
+				print(f'  {key} {phase}: {ratio:.2f}x')
+		else:
+			print('No regressions over the baseline')
+	
+	return status
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import time
+import pickle
+import hashlib
+import tempfile
+import functools
+
+
+# Modules whose source is part of the compiler version: every one on the
+# way from the source to a cache entry or a unit
+MODULES = (
+	'lexer', 'parser', 'nodes', 'folder', 'errors', 'generator', 'generator_ir',
+	'lowering', 'selector', 'strength', 'peephole', 'scheduler', 'pipeline',
+	'compiler', 'cache', 'linker'
+)
+
+# Default size limit of the cache folder, in bytes
+MAX_SIZE = 256 * 1024 * 1024
+
+# Extension of the cache entries, anything else in the folder is left alone
+SUFFIX = '.entry'
+
+# Extension of the entries being written, and the age in seconds after which
+# one is left from a writer that died before renaming it
+TEMP = '.tmp'
+STALE = 60
+
+
+
+# Compiler version #
+# Hash of the compiler sources, so any change to the compiler invalidates
+# the entries made by the old one
+# Computed once, it's the version of the compiler that is loaded
+@functools.cache
+def compiler_version():
+	digest = hashlib.sha256()
+	folder = os.path.dirname(os.path.abspath(__file__))
+	for name in MODULES:
+		with open(os.path.join(folder, name + '.py'), 'rb') as file:
+			digest.update(file.read())
+	return digest.hexdigest()
+
+
+
+class Cache:
+	# Initialize compilation cache #
+	# Entries live in 'folder', one file each, named after the hash of the
+	# source, the compiler version and the options they were compiled with
+	# Once the folder grows past 'max_size' bytes, 'trim' removes the least
+	# recently used entries
+	# Writes are atomic (a temporary file renamed over the entry), so several
+	# processes can share the same folder
+	def __init__(self, folder, max_size=MAX_SIZE):
+		self.folder = folder
+		self.max_size = max_size
+		self.version = compiler_version()
+		os.makedirs(folder, exist_ok=True)
+	
+	
+	# Key of a source compiled with some options #
+	def key(self, code, **options):
+		digest = hashlib.sha256()
+		digest.update(self.version.encode())
+		digest.update(repr(sorted(options.items())).encode())
+		digest.update(code.encode())
+		return digest.hexdigest()
+	
+	
+	# Path of an entry, spread in subfolders by the first two hex digits #
+	def path(self, key):
+		return os.path.join(self.folder, key[:2], key + SUFFIX)
+	
+	
+	# Cached entry, or None on a miss #
+	# A hit touches the entry, marking it as recently used
+	def get(self, key):
+		path = self.path(key)
+		try:
+			with open(path, 'rb') as file:
+				entry = pickle.load(file)
+			os.utime(path)
+		
+		# Missing, evicted meanwhile, or unreadable (it's only a cache)
+		except (OSError, EOFError, pickle.UnpicklingError):
+			return None
+		
+		return entry
+	
+	
+	# Stores an entry #
+	def put(self, key, entry):
+		path = self.path(key)
+		folder = os.path.dirname(path)
+		os.makedirs(folder, exist_ok=True)
+		
+		fd, temp = tempfile.mkstemp(dir=folder, suffix=TEMP)
+		try:
+			with os.fdopen(fd, 'wb') as file:
+				pickle.dump(entry, file, pickle.HIGHEST_PROTOCOL)
+			os.replace(temp, path)
+		except BaseException:
+			os.unlink(temp)
+			raise
+	
+	
+	# Evicts the least recently used entries past the size limit #
+	# Temporary files older than STALE seconds are removed too
+	# Returns how many entries were removed
+	def trim(self):
+		entries = []
+		total = 0
+		stale = time.time() - STALE
+		for folder, _, files in os.walk(self.folder):
+			for name in files:
+				if not name.endswith((SUFFIX, TEMP)):
+					continue
+				path = os.path.join(folder, name)
+				try:
+					stat = os.stat(path)
+				except OSError:
+					continue
+				
+				# Left by a writer that died, unless it's still being written
+				if name.endswith(TEMP):
+					if stat.st_mtime < stale:
+						try:
+							os.unlink(path)
+						except OSError:
+							pass
+					continue
+				
+				entries.append((stat.st_mtime, stat.st_size, path))
+				total += stat.st_size
+		
+		removed = 0
+		entries.sort()
+		for mtime, size, path in entries:
+			if total <= self.max_size:
+				break
+			
+			# Another process may have removed it already
+			try:
+				os.unlink(path)
+				removed += 1
+			except OSError:
+				pass
+			total -= size
+		
+		return removed
@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+import socket
+import tempfile
+
+
+# Socket of the compile server, overridden by the 'CABRA_SOCKET' variable
+SOCKET = os.environ.get('CABRA_SOCKET') or os.path.join(tempfile.gettempdir(), f'cabra-{os.getuid()}.sock')
+
+
+
+# Compile client #
+# Takes the same arguments as 'compiler.py' and sends them to a running
+# 'server.py', printing what it sends back
+# The protocol is a line of JSON each way: the request is
+# '{"argv": [...], "cwd": "..."}', the answers '{"out": "..."}' (printed as
+# they come) and, at the end, '{"status": n}'
+# Without a server it compiles in this process instead
+def main(argv=None):
+	argv = sys.argv[1:] if argv is None else argv
+	try:
+		connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		connection.connect(SOCKET)
+	except OSError:
+		connection.close()
+		from compiler import main as compile_main
+		return compile_main(argv)
+	
+	with connection, connection.makefile('rwb') as stream:
+		stream.write(json.dumps({'argv': argv, 'cwd': os.getcwd()}).encode() + b'\n')
+		stream.flush()
+		
+		for line in stream:
+			answer = json.loads(line)
+			if 'status' in answer:
+				return answer['status']
+			print(answer['out'], end='', flush=True)
+	
+	print('Connection to the compile server lost')
+	return 1
+
+
+if __name__ == '__main__':
+	raise SystemExit(main())
@@ -1,6 +1,15 @@
-from lexer import Lexer
-from parser import Parser
-from generator import Generator
+import os
+import glob
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pipeline import STAGES, UNTIMED, compile_source
+from nodes import to_postfix
+from errors import CompileError, AssemblyError, LinkError
+from cache import Cache, MAX_SIZE
+from profiler import Profiler
+from assembler import Assembler
+from linker import Linker, make_unit, fresh, read_unit
 
 
 # Preprocessor
@@ -17,11 +26,11 @@ from generator import Generator
 
 # Parser
 
-# TODO: Give the file name to the parser
+# TODO: [OK] Give the file name to the parser
 # TODO: Comment the code
 # TODO: Primitive types
 # TODO: Function declaration without definition
-# TODO: Empty return statement
+# TODO: [OK] Empty return statement
 
 
 # Generator
@@ -29,55 +38,338 @@ from generator import Generator
 # TODO: [OK] Generate function exit without the 'return'
 
 
-# AST Printer #
-# Just prints the AST spitted by the parser
-def print_ast(ast, depth=0):
-	for node in ast:
-		print('  '*depth, end='')
-		print(*node[:-1], end='')
-		
-		# Panic (⁠٥⁠•⁠▽⁠•⁠)
-		if type(node[-1]) is not list:
-			# This should never be triggered unless during updates
-			# If this ever get triggered during normal usage, there's something wrong
-			print('\033[1;31mSomething is wrong with the parser\033[m')
-			exit(1)
+# Text of the warnings and errors of a compilation #
+def messages_text(messages):
+	return ''.join(message + '\n\n' for message in messages)
+
+
+# Output formats, and the extension of their files
+FORMATS = {
+	'asm': '.s',
+	'flat': '.bin',
+	'object': '.o'
+}
+
+# Extension of the translation units, compiled on their own to be linked
+UNIT = '.obj'
+
+
+
+# Compiles a source file #
+# Writes the assembly of 'fname' to 'output', using 'cache' (a Cache, or
+# None to always compile)
+# With 'fmt' 'flat' or 'object', the assembly is encoded by the assembler
+# and its image is written instead (see Assembler), the cache still holds
+# the assembly
+# With 'fmt' 'unit', 'output' is a translation unit to link (see
+# 'linker.make_unit'), kept as it is if it's up to date ('cached' is True
+# then)
+# With 'profile' ('time', or 'memory' to measure it too), each phase is
+# profiled
+# Returns '(log, cached, profile)', 'log' is the text of the warnings and of
+# the stages in 'dump', 'cached' is True on a cache hit, and 'profile' the
+# report of the Profiler (None without one)
+# The log is cached too, so warnings are still shown on a hit
+# 'executor' generates the functions in parallel (see 'compile_source')
+def compile_file(fname, output, pipeline='direct', dump=(), cache=None, profile=None, fmt='asm', executor=None):
+	with open(fname) as file:
+		code = file.read()
+	
+	# Dumps need every phase to run
+	unit = None
+	if fmt == 'unit' and not dump:
+		unit = read_unit(output)
+		if unit is not None and not fresh(unit, code, pipeline):
+			unit = None
+	
+	entry = None
+	if cache is not None and not dump and unit is None:
+		key = cache.key(code, pipeline=pipeline)
+		entry = cache.get(key)
+	
+	cached = entry is not None or unit is not None
+	profiler = Profiler(memory=profile == 'memory') if profile else None
+	if not cached:
+		# The tokens are only kept for the cache, the lexer streams them otherwise
+		store = cache is not None and not dump
+		result = compile_source(code, pipeline=pipeline, dump=dump, profile=profiler, executor=executor, fname=fname, tokens=store)
+		log = messages_text(result.messages)
+		for stage in STAGES:
+			if stage in result.dumps:
+				log += '\n' + f' {stage.upper()} '.center(71, '-') + '\n' + result.dumps[stage] + '\n'
 		
-		if node[-1]:
-			print(' {')
-			print_ast(node[-1], depth+1)
-			print('  '*depth+'}', end='')
+		entry = {
+			'tokens': result.tokens,
+			'ast': to_postfix(result.ast),
+			'asm': result.asm,
+			'log': log
+		}
+		if store:
+			cache.put(key, entry)
+	
+	# Machine code, or the unit to link
+	if unit is not None:
+		data = None
+	elif fmt == 'unit':
+		data = json.dumps(make_unit(fname, code, pipeline, entry['asm'], entry['ast'], entry['log'])).encode()
+	elif fmt == 'asm':
+		data = '\n'.join(entry['asm']).encode()
+	else:
+		with (UNTIMED if profiler is None else profiler.phase)('assembler') as record:
+			data, words = encode(code, entry['asm'], fmt)
+		if profiler is not None:
+			record['words'] = words
+			profiler.add(record)
+	
+	# Saves the output, a unit up to date is left alone
+	if data is not None:
+		write(output, data)
+	
+	if profiler is not None:
+		profile = profiler.report()
+		profile['cached'] = cached
+	return (entry or unit)['log'], cached, profile
+
+
+# Machine code of some assembly #
+# Returns the image in 'fmt' ('flat' or 'object') and its number of words
+def encode(code, asm, fmt):
+	assembler = Assembler(code, asm)
+	return assembler.flat() if fmt == 'flat' else assembler.object(), len(assembler.out)
+
+
+# Writes an output file, and its folders #
+def write(output, data):
+	directory = os.path.dirname(output)
+	if directory:
+		os.makedirs(directory, exist_ok=True)
+	with open(output, 'wb') as file:
+		file.write(data)
+
+
+# Links translation units into a program #
+# Reads the units at 'paths' and writes the program to 'output', in 'fmt'
+def link(paths, output, fmt):
+	units = []
+	for path in paths:
+		unit = read_unit(path)
+		if unit is None:
+			raise LinkError(f"Can't read the unit '{path}'")
+		units.append(unit)
+	
+	asm = Linker(units).out
+	data = '\n'.join(asm).encode() if fmt == 'asm' else encode('', asm, fmt)[0]
+	write(output, data)
+
+
+# Compiles a file in a worker #
+# Returns '(fname, output, error, log, cached, profile)', 'error' is None on
+# success
+def compile_job(job, executor=None):
+	fname, output, pipeline, dump, cache, profile, fmt = job
+	error = None
+	log = ''
+	cached = False
+	
+	try:
+		log, cached, profile = compile_file(fname, output, pipeline, dump, cache, profile, fmt, executor)
+	
+	except CompileError as e:
+		error = str(e)
+		log = messages_text(e.messages)
+	
+	# The generators emitted something that can't be encoded
+	except AssemblyError as e:
+		error = f'assembler: {e}'
+	
+	except OSError as e:
+		error = e.strerror or str(e)
+	
+	# A bug in the compiler only fails this file
+	except Exception as e:
+		error = f'internal error: {type(e).__name__}: {e}'
+	
+	# Nothing to profile
+	if error is not None:
+		profile = None
+	
+	return fname, output, error, log, cached, profile
+
+
+# Source files #
+# Inputs may be files, directories (every '.c' file inside them) or glob
+# patterns, duplicates are only compiled once
+def find_sources(inputs):
+	found = {}
+	for name in inputs:
+		if glob.has_magic(name):
+			matches = sorted(glob.glob(name, recursive=True))
+		else:
+			matches = [name]
 		
-		print()
-
-
-# Opens the selected file
-fname = 'c/test_4/less_equals_false.c'
-with open(fname) as file:
-	code = file.read()
-	
-print(code.replace('\t', '  '))
-
-# Token broker
-print()
-print(' LEXER '.center(71, '-'))
-lexer = Lexer(code)
-for tok in lexer.out:
-	print(tok)
-
-# AST synthesizer
-print()
-print(' PARSER '.center(71, '-'))
-parser = Parser(code, lexer.out)
-print_ast(parser.out)
-
-# Assembly generator
-print()
-print(' GENERATOR '.center(71, '-'))
-generator = Generator(code, parser.out)
-print('\n'.join(generator.out))
-
-# Saves the assembly output
-fname = 'c/a.s'
-with open(fname, 'w') as file:
-	file.write('\n'.join(generator.out))
+		for match in matches:
+			if os.path.isdir(match):
+				found.update(dict.fromkeys(sorted(glob.glob(os.path.join(match, '**', '*.c'), recursive=True))))
+			else:
+				found[match] = None
+	
+	return list(found)
+
+
+# Output path of each source #
+# Next to the source by default, or in 'out_dir' keeping the folders
+# below the ones the sources have in common
+def output_paths(sources, out_dir=None, extension='.s'):
+	paths = [os.path.splitext(fname)[0] + extension for fname in sources]
+	if out_dir is None or not sources:
+		return paths
+	
+	root = os.path.commonpath([os.path.dirname(os.path.abspath(fname)) for fname in sources])
+	return [os.path.join(out_dir, os.path.relpath(os.path.abspath(path), root)) for path in paths]
+
+
+# Stages of the '--dump' argument #
+def stages(text):
+	if text == 'all':
+		return STAGES
+	
+	names = tuple(name.strip() for name in text.split(','))
+	for name in names:
+		if name not in STAGES:
+			raise argparse.ArgumentTypeError(f"unknown stage '{name}'")
+	return names
+
+
+# Command line arguments #
+def arguments(prog=None):
+	args = argparse.ArgumentParser(prog, description='Compiles C source files to MIPS assembly or machine code.')
+	args.add_argument('inputs', nargs='+', help="source files, directories or glob patterns (like 'C/**/*.c')")
+	args.add_argument('-o', '--output-dir', help='folder for the output files (default: next to each source)')
+	args.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='worker processes (default: one per CPU)')
+	args.add_argument('--function-jobs', type=int, default=1, metavar='N',
+	                  help='worker processes generating the functions of a single file (default: 1, no workers); '
+	                       'only when the files are compiled by a single worker (-j 1, or one file), '
+	                       'the compile server ignores it')
+	args.add_argument('--pipeline', choices=('direct', 'ir'), default='direct', help='code generation pipeline')
+	args.add_argument('-f', '--format', choices=FORMATS, default='asm',
+	                  help="'asm' text, 'flat' machine code, or an 'object' image with the entry point and symbols (default: asm)")
+	args.add_argument('--link', metavar='PROGRAM',
+	                  help='compile each file to a unit (.obj) and link them into PROGRAM, in the --format; '
+	                       'units of unchanged files are reused')
+	args.add_argument('--dump', nargs='?', const='all', type=stages, metavar='STAGES',
+	                  help=f"print the output of these stages, comma separated (default: all of {', '.join(STAGES)})")
+	args.add_argument('--cache', metavar='DIR', help='reuse the results of unchanged sources, stored in DIR')
+	args.add_argument('--cache-size', type=int, default=MAX_SIZE // 2**20, metavar='MB',
+	                  help=f'size limit of the cache (default: {MAX_SIZE // 2**20})')
+	args.add_argument('--profile', metavar='FILE', help='save the time and counts of every phase, per file, as JSON')
+	args.add_argument('--profile-memory', action='store_true', help='with --profile, measure the memory peaks too (slow)')
+	return args
+
+
+# Jobs of the parsed arguments, and the cache they use #
+# Relative paths are taken from 'cwd'
+def prepare(args, cwd=''):
+	cache = None
+	if args.cache is not None:
+		cache = Cache(os.path.join(cwd, args.cache), args.cache_size * 2**20)
+	
+	out_dir = None if args.output_dir is None else os.path.join(cwd, args.output_dir)
+	sources = find_sources([os.path.join(cwd, name) for name in args.inputs])
+	dump = args.dump or ()
+	profile = args.profile and ('memory' if args.profile_memory else 'time')
+	fmt = 'unit' if args.link else args.format
+	extension = UNIT if args.link else FORMATS[args.format]
+	jobs = [(fname, output, args.pipeline, dump, cache, profile, fmt)
+	        for fname, output in zip(sources, output_paths(sources, out_dir, extension))]
+	return jobs, cache
+
+
+# Report of a compiled file, its warnings, dumps and why it failed #
+def report(fname, error, log):
+	text = ''
+	if log:
+		text += f'{fname}:\n{log}'
+		if not log.endswith('\n'):
+			text += '\n'
+	if error is not None:
+		text += f'{fname}: FAILED: {error}\n'
+	return text
+
+
+# Saves the profiles of the compiled files as JSON #
+# Files that came from the cache have no phases
+def write_profile(path, profiles):
+	with open(path, 'w') as file:
+		json.dump(profiles, file, indent='\t')
+
+
+# Last line of the output #
+# When linking, the files that were not compiled again are 'unchanged',
+# and not counted as compiled
+def summary(total, failed, hits, cache, link=None):
+	if link is not None:
+		return f'{total - failed - hits} compiled, {failed} failed, {hits} unchanged'
+	
+	text = f'{total - failed} compiled, {failed} failed'
+	if cache is not None:
+		text += f', {hits} from cache'
+	return text
+
+
+# Command line entry point #
+# Returns the exit status, 1 if any file failed
+def main(argv=None):
+	args = arguments().parse_args(argv)
+	jobs, cache = prepare(args)
+	if not jobs:
+		print('No source files found')
+		return 1
+	
+	# Few files are not worth starting the workers, a single one can have
+	# its functions generated by them instead
+	workers = max(1, min(args.jobs, len(jobs)))
+	if workers > 1 and args.function_jobs > 1:
+		print(f'Ignoring --function-jobs, the files are compiled by {workers} workers (use -j 1 to generate their functions in parallel)')
+	if workers == 1 and args.function_jobs > 1:
+		with ProcessPoolExecutor(max_workers=args.function_jobs) as executor:
+			results = [compile_job(job, executor) for job in jobs]
+	elif workers == 1:
+		results = map(compile_job, jobs)
+	else:
+		executor = ProcessPoolExecutor(max_workers=workers)
+		results = executor.map(compile_job, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+	
+	failed = hits = 0
+	profiles = {}
+	for fname, output, error, log, cached, profile in results:
+		hits += cached
+		failed += error is not None
+		print(report(fname, error, log), end='')
+		if profile is not None:
+			profiles[fname] = profile
+	
+	if workers > 1:
+		executor.shutdown()
+	
+	if cache is not None:
+		cache.trim()
+	if args.profile:
+		write_profile(args.profile, profiles)
+	print(summary(len(jobs), failed, hits, cache, args.link))
+	if failed:
+		return 1
+	
+	# The program, once every unit is there
+	if args.link is not None:
+		try:
+			link([job[1] for job in jobs], args.link, args.format)
+		except (LinkError, AssemblyError, OSError) as e:
+			print(f'{args.link}: FAILED: {e}')
+			return 1
+		print(f'Linked {args.link}')
+	
+	return 0
+
+
+if __name__ == '__main__':
+	raise SystemExit(main())
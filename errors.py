@@ -0,0 +1,66 @@
+# Compilation error #
+# Raised by the 'abort' of each phase, so a failing file can be reported
+# without stopping the whole program
+# 'messages' are the formatted warnings that came before it, and the error
+# itself last (the phases keep them in their own 'messages' instead of
+# printing them)
+class CompileError(Exception):
+	def __init__(self, msg, line, offset, messages=()):
+		super().__init__(msg)
+		self.msg = msg
+		self.line = line
+		self.offset = offset
+		self.messages = list(messages)
+	
+	
+	def __str__(self):
+		return f'{self.line}:{self.offset}: {self.msg}'
+	
+	
+	# Pickled with all its fields, so it can come back from a worker #
+	def __reduce__(self):
+		return (CompileError, (self.msg, self.line, self.offset, self.messages))
+
+
+
+# Simulation error #
+# Raised by the simulator when the program can't go on (unknown
+# instruction or label, unaligned access, overflow trap, step limit...)
+# 'line' is the line of assembly that caused it
+class SimulationError(Exception):
+	def __init__(self, msg, line=None):
+		super().__init__(msg)
+		self.msg = msg
+		self.line = line
+	
+	
+	def __str__(self):
+		if self.line is None:
+			return self.msg
+		return f'{self.msg}: {self.line.strip()}'
+
+
+
+# Assembly error #
+# Raised by the assembler on what it can't encode (unknown instruction or
+# label, immediate out of range, branch too far...)
+# 'line' is the line of assembly that caused it
+class AssemblyError(Exception):
+	def __init__(self, msg, line=None):
+		super().__init__(msg)
+		self.msg = msg
+		self.line = line
+	
+	
+	def __str__(self):
+		if self.line is None:
+			return self.msg
+		return f'{self.msg}: {self.line.strip()}'
+
+
+
+# Link error #
+# Raised by the linker when the units don't make a program (a function
+# defined twice, no 'main'...)
+class LinkError(Exception):
+	pass
@@ -0,0 +1,142 @@
+from nodes import Op, Visitor, Integer
+
+
+# 32-bit arithmetic, the way the MIPS registers hold it #
+def wrap(value):
+	return ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+# Truncating division, rounds toward zero like 'div' #
+# None when the hardware result is undefined (division by zero, INT_MIN / -1)
+def div(a, b):
+	if b == 0 or (a == -0x80000000 and b == -1):
+		return None
+	
+	quotient = abs(a) // abs(b)
+	return quotient if (a < 0) == (b < 0) else -quotient
+
+
+# Remainder of 'div', has the sign of the dividend #
+def mod(a, b):
+	quotient = div(a, b)
+	return None if quotient is None else a - quotient * b
+
+
+# Compile-time evaluation of unary operators, indexed by opcode
+# Operands are already wrapped to 32 bits, the result is wrapped afterwards
+UNARY = {
+	Op.PLUS: lambda a: a,
+	Op.MINUS: lambda a: -a,
+	Op.BITFLIP: lambda a: ~a,
+	Op.NOT: lambda a: int(a == 0)
+}
+
+# Compile-time evaluation of binary operators, indexed by opcode
+# A None result means the operation must be left for run time
+BINARY = {
+	Op.MULT: lambda a, b: a * b,
+	Op.DIV: div,
+	Op.MOD: mod,
+	Op.ADD: lambda a, b: a + b,
+	Op.SUB: lambda a, b: a - b,
+	Op.RSHIFT: lambda a, b: a >> (b & 31),  # 'srav', arithmetic and only 5 bits of shift
+	Op.LSHIFT: lambda a, b: a << (b & 31),  # 'sllv'
+	Op.AND: lambda a, b: a & b,
+	Op.OR: lambda a, b: a | b,
+	Op.XOR: lambda a, b: a ^ b,
+	Op.EQUALS: lambda a, b: int(a == b),
+	Op.DIFF: lambda a, b: int(a != b),
+	Op.GREATER: lambda a, b: int(a > b),
+	Op.LESS: lambda a, b: int(a < b),
+	Op.GREATER_EQ: lambda a, b: int(a >= b),
+	Op.LESS_EQ: lambda a, b: int(a <= b)
+}
+
+
+
+class Folder(Visitor):
+	# Initialize constant folder #
+	# Evaluates constant subtrees at compile time, 'out' is the folded AST
+	def __init__(self, code, ast):
+		self.code = code
+		self.folded = 0  # Operations evaluated at compile time
+		self.out = ast
+		self(ast)
+	
+	
+	# Folds every expression of the program #
+	def __call__(self, ast):
+		self.visit(ast)
+	
+	
+	def visit_program(self, node):
+		for function in node.body:
+			self.visit(function)
+	
+	
+	def visit_function(self, node):
+		for statement in node.body:
+			self.visit(statement)
+	
+	
+	def visit_return(self, node):
+		if node.value is not None:
+			node.value = self.fold(node.value)
+	
+	
+	# Folds an expression #
+	# Post-order walk with an explicit stack, so deep expressions don't recurse
+	# Returns the folded node, operators with non-constant operands are kept
+	# (with their operands folded)
+	def fold(self, node):
+		done = []  # Folded operands
+		work = [(node, False)]
+		
+		while work:
+			node, ready = work.pop()
+			op = node.op
+			
+			if op == Op.INTEGER:
+				done.append(node)
+			
+			elif not ready:
+				work.append((node, True))
+				if op in UNARY:
+					work.append((node.operand, False))
+				else:
+					work.append((node.rhs, False))
+					work.append((node.lhs, False))
+			
+			# Unary operators
+			elif op in UNARY:
+				a = done.pop()
+				if a.op == Op.INTEGER:
+					self.folded += 1
+					done.append(Integer(wrap(UNARY[op](wrap(a.value)))))
+				
+				# Unary plus does nothing, even if the operand is not constant
+				elif op == Op.PLUS:
+					done.append(a)
+				
+				else:
+					node.operand = a
+					done.append(node)
+			
+			# Binary operators
+			else:
+				b = done.pop()
+				a = done.pop()
+				value = None
+				if a.op == Op.INTEGER and b.op == Op.INTEGER:
+					value = BINARY[op](wrap(a.value), wrap(b.value))
+				
+				if value is not None:
+					self.folded += 1
+					done.append(Integer(wrap(value)))
+				
+				else:
+					node.lhs = a
+					node.rhs = b
+					done.append(node)
+		
+		return done[0]
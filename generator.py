@@ -1,22 +1,15 @@
-class Generator:
-	# Initialize Generator #
-	def __init__(self, code, ast):
-		self.code = code
-		
-		# Various counters to keep each label unique
-		self.counters = {
-			'not': 0,
-			'equals': 0,
-			'diff': 0,
-			'greater': 0,
-			'less': 0,
-			'greater_eq': 0,
-			'less_eq': 0
-		}
-		
-		# For now, it can only compile a single file
-		self.out = [
-'''.entry reset
+import os
+from nodes import Op, NAMES, Visitor, to_postfix, from_postfix
+from selector import select, fallback, load
+from errors import CompileError
+
+
+# Registers used to evaluate expressions, the first ones are used first
+# '$v0' holds the result of the whole expression and '$v1' reloads spills
+REGISTERS = ('$t0', '$t1', '$t2', '$t3', '$t4', '$t5', '$t6', '$t7', '$t8', '$t9')
+
+# Program entry, calls 'main' and halts
+HEADER = '''.entry reset
 .text
 
 reset:
@@ -25,8 +18,77 @@ reset:
 	nop
 	mtc2 $zero, 0
 '''
-		]
+
+
+
+# Results of each function of a program, in source order #
+# Each function is generated on its own: 'generate(code, function)' is
+# called on each one, or with an 'executor' (a process or thread pool),
+# 'job((first, excerpt, flat))' by its workers on the flattened functions
+# (see 'nodes.to_postfix'), so deep trees can be pickled
+# Either way the results are the same, and errors raise in order
+def functions(code, program, generate, job, executor=None):
+	if executor is None:
+		return (generate(code, function) for function in program.body)
+	
+	chunksize = max(1, len(program.body) // (4 * (os.cpu_count() or 1)))
+	jobs = ((*excerpt, to_postfix(function)) for excerpt, function in zip(excerpts(code, program.body), program.body))
+	return executor.map(job, jobs, chunksize=chunksize)
+
+
+# Source of each function, for the messages of a worker #
+# Not the whole file: '(first, text)', the lines from the function's
+# header to the next one's, 'first' being the number of the first one
+# Statements outside of a function get no source
+def excerpts(code, body):
+	lines = code.split('\n')
+	starts = [node.y for node in body if node.op == Op.FUNCTION] + [len(lines) - 1]
+	idx = 0
+	for node in body:
+		if node.op != Op.FUNCTION:
+			yield 0, ''
+			continue
+		
+		idx += 1
+		yield node.y, '\n'.join(lines[node.y:starts[idx] + 1])
+
+
+# Generates a single function #
+# Returns its assembly and warnings
+# 'code' can be only part of the file, starting at line 'first'
+def generate_function(code, function, first=0):
+	generator = Generator(code, function, first=first)
+	return generator.out, generator.messages
+
+
+# 'generate_function' in a worker #
+def generate_job(job):
+	first, code, flat = job
+	return generate_function(code, from_postfix(flat), first)
+
+
+
+class Generator(Visitor):
+	# Initialize Generator #
+	# 'ast' is a program or a single function, functions are generated one by
+	# one, by the workers of 'executor' if there is one (see 'functions')
+	# 'first' is the line 'code' starts at, when it's only an excerpt of the
+	# file (see 'excerpts')
+	def __init__(self, code, ast, executor=None, first=0):
+		self.code = code
+		self.first = first
+		self.executor = executor
+		self.messages = []  # Warnings and errors, see 'abort'
 		
+		# Free registers, the last one is the next to be used
+		self.free = list(REGISTERS[::-1])
+		
+		# Pattern of each expression node, chosen by the instruction selector
+		self.tiles = {}
+		
+		self.out = []
+		
+		self.work = []
 		self(ast)
 	
 	
@@ -42,302 +104,158 @@ reset:
 			'i': '5mNOT IMPLEMENTED'
 		}[e]
 		
-		line = self.code.split('\n')[y]
+		lines = self.code.split('\n')
+		line = lines[y - self.first] if 0 <= y - self.first < len(lines) else ''
 		tabs = line[:x].count('\t')
 		line = line.replace('\t', '  ')
 		
-		print(f'[\033[1;3{error}\033[m]:', msg)
-		print(line)
-		print(' '*(x+tabs) + '^'*base)
-		print('Line:', y+1)
-		print('Offset:', x)
-		print()
+		self.messages.append('\n'.join((
+			f'[\033[1;3{error}\033[m]: {msg}',
+			line,
+			' '*(x+tabs) + '^'*base,
+			f'Line: {y+1}',
+			f'Offset: {x}'
+		)))
 		
 		if e != 'w':
-			exit(-1)
+			raise CompileError(msg, y+1, x, self.messages)
 	
 	
-	# Generates assembly code
+	# Generates assembly code #
+	# The AST is walked with an explicit work stack instead of recursion,
+	# so the nesting depth is only limited by memory
+	# Work items are assembly text to emit, or '(method, *args)' calls
+	# The calls are made in order, each one can schedule more work
 	def __call__(self, ast):
-		for node in ast:
-			match node[0]:
-				# Generate the program structure
-				case 'program':
-					self(node[-1])
-				
-				# Generate function structure
-				case 'function':
-					self.out.append(f'_{node[1]}:')
-					self(node[-1])
-					
-					# If a function does not end with an explicit return,
-					# raise a warning and add a return
-					if not node[-1] or node[-1][-1][0] != 'return':
-						self.abort('w', f"Function '{node[1]}' does not have a return statement",
-						           node[2][0], node[2][1], node[1])
-						self.out.append('\tjr $ra\n\tnop')
-				
-				# Generate function return
-				case 'return':
-					self(node[-1])
-					self.out.append('\tjr $ra')
-					self.out.append('\tnop')
-				
-				# Load integer constant
-				case 'integer':
-					self.out.append(f'\tli $v0, {node[1]}')
-				
-				# Bitflip (11000011 -> 00111100)
-				case 'bitflip':
-					self(node[-1])
-					self.out.append('\tnor $v0, $zero, $v0')
-				
-				# Negative (5 -> -5)
-				case 'minus':
-					self(node[-1])
-					self.out.append('\tsub $v0, $zero, $v0')
-				
-				# Positive (5 -> 5) (It sort of does nothing ¯⁠\⁠_⁠(⁠ツ⁠)⁠_⁠/⁠¯ )
-				case 'plus':
-					self(node[-1])
-				
-				# Not (5 -> 0, 0 -> 1)
-				case 'not':
-					count = self.counters['not']
-					self.counters['not'] += 1
-					self(node[-1])
-					self.out.append(f'''\tbeq $v0, $zero, not_true_{count}
-	nop
-	li $v0, 0
-	j not_end_{count}
-	nop
-not_true_{count}:
-	li $v0, 1
-not_end_{count}:''')
-
-				# Multiply (5 * 2 -> 10)
-				case 'mult':
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append('''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	mult $t0, $v0
-	mflo $v0''')
-				
-				# Divide (5 / 2 -> 2)
-				case 'div':
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append('''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	div $t0, $v0
-	mflo $v0''')
-
-				# Modulo (5 % 2 -> 1)
-				case 'mod':
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append('''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	div $t0, $v0
-	mfhi $v0''')
+		work = self.work
+		work.append((self.visit, ast, None))
+		while work:
+			item = work.pop()
+			if type(item) is str:
+				self.out.append(item)
+			else:
+				item[0](*item[1:])
 	
-				# Addition (5 + 2 -> 7)
-				case 'add':
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append('''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	add $v0, $t0, $v0''')
-				
-				# Subtraction (5 - 2 -> 3)
-				case 'sub':
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append('''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	sub $v0, $t0, $v0''')
-					
-				# Right shift (5 >> 2 -> 1)
-				case 'rshift':
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append('''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	srav $v0, $t0, $v0''')
-				
-				# Left shift (5 << 2 -> 20)
-				case 'lshift':
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append('''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	sllv $v0, $t0, $v0''')
 	
-				# Bitwise AND (0b101 & 0b011 -> 0b001)
-				case 'and':
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append('''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	and $v0, $t0, $v0''')
+	# Generate the program structure #
+	# The warnings of the functions before an error come with it
+	def visit_program(self, node, dest):
+		self.out.append(HEADER)
+		try:
+			for out, messages in functions(self.code, node, generate_function, generate_job, self.executor):
+				self.out += out
+				self.messages += messages
+		
+		except CompileError as e:
+			e.messages[:0] = self.messages
+			raise
 	
-				
-				# Bitwise OR (0b101 | 0b011 -> 0b111)
-				case 'or':
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append('''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	or $v0, $t0, $v0''')
 	
-				
-				# Bitwise XOR (0b101 ^ 0b011 -> 0b110)
-				case 'xor':
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append('''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	xor $v0, $t0, $v0''')
-				
-				
-				# Equals (5 == 2 -> 0)
-				case 'equals':
-					count = self.counters['equals']
-					self.counters['equals'] += 1
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append(f'''\tlw $t0, 4($sp)
-	beq $v0, $t0, equals_true_{count}
-	addi $sp, $sp, 4
-	beq $zero, $zero, equals_end_{count}
-	addi $v0, $zero, 0
-equals_true_{count}:
-	addi $v0, $zero, 1
-equals_end_{count}:''')
-				
-				
-				# Different (5 != 2 -> 1)
-				case 'diff':
-					count = self.counters['diff']
-					self.counters['diff'] += 1
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append(f'''\tlw $t0, 4($sp)
-	bne $v0, $t0, diff_true_{count}
-	addi $sp, $sp, 4
-	beq $zero, $zero, diff_end_{count}
-	addi $v0, $zero, 0
-diff_true_{count}:
-	addi $v0, $zero, 1
-diff_end_{count}:''')
-				
-				
-				# Greater (5 > 2 -> 1)
-				case 'greater':
-					count = self.counters['greater']
-					self.counters['greater'] += 1
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append(f'''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	sub $v0, $t0, $v0
-	blez $v0, greater_false_{count}
-	li $v0, 1
-	j greater_end_{count}
-	nop
-greater_false_{count}:
-	li $v0, 0
-greater_end_{count}:''')
-				
-				
-				# Less (5 < 2 -> 0)
-				case 'less':
-					count = self.counters['less']
-					self.counters['less'] += 1
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append(f'''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	sub $v0, $t0, $v0
-	bltz $v0, less_true_{count}
-	li $v0, 0
-	j less_end_{count}
-	nop
-less_true_{count}:
-	li $v0, 1
-less_end_{count}:''')
-				
-				
-				
-				# Greater Equals (5 >= 2 -> 1)
-				case 'greater_eq':
-					count = self.counters['greater_eq']
-					self.counters['greater_eq'] += 1
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
-	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append(f'''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	sub $v0, $t0, $v0
-	bgez $v0, greatereq_false_{count}
-	li $v0, 0
-	j greatereq_end_{count}
-	nop
-greatereq_false_{count}:
-	li $v0, 1
-greatereq_end_{count}:''')
-				
-				
-				# Less Equals (5 <= 2 -> 0)
-				case 'less_eq':
-					count = self.counters['less_eq']
-					self.counters['less_eq'] += 1
-					self([node[-1][0]])
-					self.out.append('''\tsw $v0, 0($sp)
+	# Generate function structure #
+	def visit_function(self, node, dest):
+		self.out.append(f'_{node.name}:')
+		
+		# If a function does not end with an explicit return,
+		# raise a warning and add a return
+		if not node.body or node.body[-1].op != Op.RETURN:
+			self.abort('w', f"Function '{node.name}' does not have a return statement",
+			           node.x, node.y, node.name)
+			self.work.append('\tjr $ra\n\tnop')
+		
+		self.work += ((self.visit, statement, None) for statement in node.body[::-1])
+	
+	
+	# Generate function return #
+	# The value is evaluated straight into '$v0'
+	def visit_return(self, node, dest):
+		self.work.append('\tnop')
+		self.work.append('\tjr $ra')
+		if node.value is not None:
+			self.tiles = select(node.value)
+			self.work.append((self.visit, node.value, '$v0'))
+	
+	
+	# Load integer constant #
+	def visit_integer(self, node, dest):
+		self.out.append(load(node.value).format(d=dest))
+	
+	
+	# Operations #
+	# Emits the pattern chosen by the instruction selector (see 'selector'),
+	# its operands that are not immediates are evaluated first
+	# A pattern that needs scratch registers is only used if there are enough
+	# free ones, otherwise it falls back to the register-register form
+	def visit_operation(self, node, dest):
+		tile = self.tiles[id(node)]
+		if len(self.free) < tile.scratch:
+			tile = fallback(node, self.tiles)
+		
+		regs = [child for child, kind in zip(node.children(), tile.kinds) if kind == 'reg']
+		if len(regs) == 1:
+			self.work.append((self.operation_end, node, tile, dest, [dest]))
+			self.work.append((self.visit, regs[0], dest))
+			return
+		
+		# The operand that needs more registers is evaluated first, straight into
+		# 'dest', then the other one goes into a free register (Sethi-Ullman)
+		if self.tiles[id(node.rhs)].need > self.tiles[id(node.lhs)].need:
+			first, second = node.rhs, node.lhs
+		else:
+			first, second = node.lhs, node.rhs
+		
+		self.work.append((self.operation_second, node, tile, dest, second))
+		self.work.append((self.visit, first, dest))
+	
+	visit_plus = visit_minus = visit_bitflip = visit_not = visit_operation
+	visit_mult = visit_div = visit_mod = visit_add = visit_sub = visit_operation
+	visit_rshift = visit_lshift = visit_and = visit_or = visit_xor = visit_operation
+	visit_equals = visit_diff = visit_greater = visit_less = visit_operation
+	visit_greater_eq = visit_less_eq = visit_operation
+	
+	
+	# Evaluates the second operand of an operation #
+	# With no free register left, the first operand is spilled to the stack
+	def operation_second(self, node, tile, dest, second):
+		if self.free:
+			reg = self.free.pop()
+			self.work.append((self.operation_spilled, node, tile, dest, second, reg))
+			self.work.append((self.visit, second, reg))
+		
+		else:
+			self.out.append(f'''\tsw {dest}, 0($sp)
 	addi $sp, $sp, -4''')
-					self([node[-1][1]])
-					self.out.append(f'''\tlw $t0, 4($sp)
-	addi $sp, $sp, 4
-	sub $v0, $t0, $v0
-	bgtz $v0, lesseq_true_{count}
-	li $v0, 1
-	j lesseq_end_{count}
-	nop
-lesseq_true_{count}:
-	li $v0, 0
-lesseq_end_{count}:''')
+			self.work.append((self.operation_spilled, node, tile, dest, second, None))
+			self.work.append((self.visit, second, dest))
+	
+	
+	# Puts both operands back in order #
+	def operation_spilled(self, node, tile, dest, second, reg):
+		# Reload the spilled operand
+		if reg is None:
+			self.out.append('''\tlw $v1, 4($sp)
+	addi $sp, $sp, 4''')
+			first, other = '$v1', dest
+		else:
+			first, other = dest, reg
+			self.free.append(reg)
+		
+		if second is node.rhs:
+			regs = [first, other]
+		else:
+			regs = [other, first]
+		
+		self.operation_end(node, tile, dest, regs)
+	
+	
+	# Combines the operands into 'dest' #
+	def operation_end(self, node, tile, dest, regs):
+		scratch = [self.free.pop() for _ in range(tile.scratch)]
+		operands = dict(zip('ab', tile.operands(node, regs)), **dict(zip('tu', scratch)))
+		if tile.template:
+			self.out.append(tile.template.format(d=dest, **operands))
+		self.free += scratch[::-1]
+	
 	
-				
-				# Panic (⁠٥⁠•⁠▽⁠•⁠)
-				case _:
-					self.abort('i', f"'{node[0]}' not implemented", 0, 0, '')
+	# Panic (⁠٥⁠•⁠▽⁠•⁠) #
+	def generic_visit(self, node, dest=None):
+		self.abort('i', f"'{NAMES[node.op]}' not implemented", 0, 0, '')
@@ -1,19 +1,69 @@
-class Generator:
+from nodes import Op, NAMES, Visitor, dispatch_table, from_postfix
+from generator import functions
+from errors import CompileError
+
+# Work stack marker, the left operand of a binary operator is done
+SAVE = object()
+
+# IR operator symbols, indexed by opcode
+# Unary and binary minus share '-', they are told apart by the operand count
+SYMBOLS = {
+	Op.MINUS: '-',
+	Op.BITFLIP: '~',
+	Op.NOT: '!',
+	Op.MULT: '*',
+	Op.DIV: '/',
+	Op.MOD: '%',
+	Op.ADD: '+',
+	Op.SUB: '-',
+	Op.RSHIFT: '>>',
+	Op.LSHIFT: '<<',
+	Op.AND: '&',
+	Op.OR: '|',
+	Op.XOR: '^',
+	Op.EQUALS: '==',
+	Op.DIFF: '!=',
+	Op.GREATER: '>',
+	Op.LESS: '<',
+	Op.GREATER_EQ: '>=',
+	Op.LESS_EQ: '<='
+}
+
+
+
+# Generates the IR of a single function #
+# Returns its IR text and tuples, and its warnings
+# 'code' can be only part of the file, starting at line 'first'
+def generate_function(code, function, first=0):
+	generator = Generator(code, function, first=first)
+	return generator.out, generator.mirror, generator.messages
+
+
+# 'generate_function' in a worker #
+def generate_job(job):
+	first, code, flat = job
+	return generate_function(code, from_postfix(flat), first)
+
+
+class Generator(Visitor):
 	# Initialize Generator
-	def __init__(self, code, ast):
+	# 'ast' is a program or a single function, functions are generated one by
+	# one (by the workers of 'executor' if there is one, see
+	# 'generator.functions'), so virtual registers are numbered per function
+	# 'first' is the line 'code' starts at, when it's only an excerpt of the
+	# file (see 'generator.excerpts')
+	def __init__(self, code, ast, executor=None, first=0):
 		self.code = code
+		self.first = first
+		self.executor = executor
+		self.messages = []  # Warnings and errors, see 'abort'
 		
-		# Various counters to keep labels unique
-		self.counters = {
-			'not': 0,
-			'equals': 0,
-			'diff': 0,
-			'greater': 0,
-			'less': 0,
-			'greater_eq': 0,
-			'less_eq': 0
-		}
-		
+		# 'out' is the IR as text, 'mirror' the same instructions as tuples:
+		#   (':_name',)                   function label
+		#   ('$t0', '=', 5)               load integer
+		#   ('$t1', '=', '~', '$t0')      unary operator
+		#   ('$t2', '=', '$t0', '+', '$t1') binary operator
+		#   ('ret', '$t2') or ('ret',)    return from function
 		self.out = []
 		self.mirror = []
 		self.registers = {}
@@ -34,114 +84,159 @@ class Generator:
 			'i': '5mNOT IMPLEMENTED'
 		}[e]
 		
-		line = self.code.split('\n')[y]
+		lines = self.code.split('\n')
+		line = lines[y - self.first] if 0 <= y - self.first < len(lines) else ''
 		tabs = line[:x].count('\t')
 		line = line.replace('\t', '  ')
 		
-		print(f'[\033[1;3{error}\033[m]:', msg)
-		print(line)
-		print(' '*(x+tabs) + '^'*base)
-		print('Line:', y+1)
-		print('Offset:', x)
-		print()
+		self.messages.append('\n'.join((
+			f'[\033[1;3{error}\033[m]: {msg}',
+			line,
+			' '*(x+tabs) + '^'*base,
+			f'Line: {y+1}',
+			f'Offset: {x}'
+		)))
 		
 		if e != 'w':
-			exit(-1)
+			raise CompileError(msg, y+1, x, self.messages)
 	
 	
 	# Generates intermediary representation
+	# The AST is walked with an explicit work stack instead of recursion,
+	# so the nesting depth is only limited by memory
+	# A node is pushed as '(node,)' to be finished once its operands are done
 	def __call__(self, ast):
-		for node in ast:
-			match node[0]:
-				# Generate the program structure
-				case 'program':
-					self(node[-1])
-				
-				
-				# Generate the function structure
-				case 'function':
-					self.out.append(f':_{node[1]}')
-					self.mirror.append((f':_{node[1]}'))
-					self(node[-1])
-				
-				
-				# Return from function
-				case 'return':
-					self(node[-1])
-					self.out.append(f'\tret {self.last_reg}')
-					self.mirror.append(('ret', self.last_reg))
-				
-				
-				# Loads an integer into a register
-				case 'integer':
-					reg = len(self.registers)
-					self.registers[reg] = ('integer', node[1])
-					self.out.append(f'\t$t{reg} = {node[1]}')
-					self.mirror.append((f'$t{reg}', '=', node[1]))
-					self.last_reg = f'$t{reg}'
-				
-				
-				# Bitflip (~0b0010 -> 0b1101)
-				case 'bitflip':
-					self(node[-1])
-					reg = len(self.registers)
-					self.registers[reg] = ('~', self.last_reg)
-					self.out.append(f'\t$t{reg} = ~{self.last_reg}')
-					self.mirror.append((f'$t{reg}', '=', '~', self.last_reg))
-					self.last_reg = f'$t{reg}'
-				
-				
-				# Negative (5 -> -5)
-				case 'minus':
-					self(node[-1])
-					reg = len(self.registers)
-					self.registers[reg] = ('-', self.last_reg)
-					self.out.append(f'\t$t{reg} = -{self.last_reg}')
-					self.mirror.append((f'$t{reg}', '=', '-', self.last_reg))
-					self.last_reg = f'$t{reg}'
-				
-				
-				# Positive (5 -> 5)
-				case 'plus':
-					self(node[-1])
-				
-				
-				# Not (5 -> 0, 0 -> 1)
-				case 'not':
-					self(node[-1])
-					reg = len(self.registers)
-					self.registers[reg] = ('!', self.last_reg)
-					self.out.append(f'\t$t{reg} = !{self.last_reg}')
-					self.mirror.append((f'$t{reg}', '=', '!', self.last_reg))
-					self.last_reg = f'$t{reg}'
-				
-				
-				# Addition (5 + 2 -> 7)
-				case 'add':
-					self([node[-1][0]])
-					a = self.last_reg
-					
-					self([node[-1][1]])
-					reg = len(self.registers)
-					self.registers[reg] = (a, '+', self.last_reg)
-					self.out.append(f'\t$t{reg} = {a} + {self.last_reg}')
-					self.mirror.append((f'$t{reg}', '=', a, '+', self.last_reg))
-					self.last_reg = f'$t{reg}'
-				
-				
-				# Subtraction (5 - 2 -> 3)
-				case 'sub':
-					self([node[-1][0]])
-					a = self.last_reg
-					
-					self([node[-1][1]])
-					reg = len(self.registers)
-					self.registers[reg] = (a, '-', self.last_reg)
-					self.out.append(f'\t$t{reg} = {a} - {self.last_reg}')
-					self.mirror.append((f'$t{reg}', '=', a, '-', self.last_reg))
-					self.last_reg = f'$t{reg}'
-				
-				
-				# Panic (⁠٥⁠•⁠▽⁠•⁠)
-				case _:
-					self.abort('i', f"'{node[0]}' not implemented", 0, 0, '')
+		dispatch = self.dispatch
+		finishers = self.finishers
+		work = [ast]
+		saved = []  # Registers of left operands, while the right one is generated
+		
+		while work:
+			node = work.pop()
+			
+			# Left operand done, keep its register
+			if node is SAVE:
+				saved.append(self.last_reg)
+			
+			# Operands are done, finish the node
+			elif type(node) is tuple:
+				finishers[node[0].op](self, node[0], saved)
+			
+			else:
+				dispatch[node.op](self, node, work)
+	
+	
+	# Generate the program structure #
+	# The warnings of the functions before an error come with it
+	def visit_program(self, node, work):
+		try:
+			for out, mirror, messages in functions(self.code, node, generate_function, generate_job, self.executor):
+				self.out += out
+				self.mirror += mirror
+				self.messages += messages
+		
+		except CompileError as e:
+			e.messages[:0] = self.messages
+			raise
+	
+	
+	# Generate the function structure #
+	def visit_function(self, node, work):
+		self.out.append(f':_{node.name}')
+		self.mirror.append((f':_{node.name}',))
+		work.append((node,))
+		work += node.body[::-1]
+	
+	
+	# Loads an integer into a register #
+	def visit_integer(self, node, work):
+		reg = len(self.registers)
+		self.registers[reg] = ('integer', node.value)
+		self.out.append(f'\t$t{reg} = {node.value}')
+		self.mirror.append((f'$t{reg}', '=', node.value))
+		self.last_reg = f'$t{reg}'
+	
+	
+	# Positive (5 -> 5) #
+	def visit_plus(self, node, work):
+		work.append(node.operand)
+	
+	
+	# Return and unary operators, finished after their operand #
+	def visit_return(self, node, work):
+		work.append((node,))
+		work += node.children()[::-1]
+	
+	visit_bitflip = visit_minus = visit_not = visit_return
+	
+	
+	# Binary operators, finished after both operands #
+	def visit_binary(self, node, work):
+		work.append((node,))
+		work.append(node.rhs)
+		work.append(SAVE)
+		work.append(node.lhs)
+	
+	visit_mult = visit_div = visit_mod = visit_add = visit_sub = visit_binary
+	visit_rshift = visit_lshift = visit_and = visit_or = visit_xor = visit_binary
+	visit_equals = visit_diff = visit_greater = visit_less = visit_binary
+	visit_greater_eq = visit_less_eq = visit_binary
+	
+	
+	# Panic (⁠٥⁠•⁠▽⁠•⁠) #
+	def generic_visit(self, node, work=None):
+		self.abort('i', f"'{NAMES[node.op]}' not implemented", 0, 0, '')
+	
+	
+	# End of function #
+	def finish_function(self, node, saved):
+		# If a function does not end with an explicit return,
+		# raise a warning and add a return
+		if not node.body or node.body[-1].op != Op.RETURN:
+			self.abort('w', f"Function '{node.name}' does not have a return statement",
+			           node.x, node.y, node.name)
+			self.out.append('\tret')
+			self.mirror.append(('ret',))
+	
+	
+	# Return from function #
+	def finish_return(self, node, saved):
+		if node.value is None:
+			self.out.append('\tret')
+			self.mirror.append(('ret',))
+		else:
+			self.out.append(f'\tret {self.last_reg}')
+			self.mirror.append(('ret', self.last_reg))
+	
+	
+	# Unary operators (~5, -5, !5) #
+	def finish_unary(self, node, saved):
+		symbol = SYMBOLS[node.op]
+		reg = len(self.registers)
+		self.registers[reg] = (symbol, self.last_reg)
+		self.out.append(f'\t$t{reg} = {symbol}{self.last_reg}')
+		self.mirror.append((f'$t{reg}', '=', symbol, self.last_reg))
+		self.last_reg = f'$t{reg}'
+	
+	finish_bitflip = finish_minus = finish_not = finish_unary
+	
+	
+	# Binary operators (5 + 2, 5 < 2...) #
+	def finish_binary(self, node, saved):
+		symbol = SYMBOLS[node.op]
+		a = saved.pop()
+		reg = len(self.registers)
+		self.registers[reg] = (a, symbol, self.last_reg)
+		self.out.append(f'\t$t{reg} = {a} {symbol} {self.last_reg}')
+		self.mirror.append((f'$t{reg}', '=', a, symbol, self.last_reg))
+		self.last_reg = f'$t{reg}'
+	
+	finish_mult = finish_div = finish_mod = finish_add = finish_sub = finish_binary
+	finish_rshift = finish_lshift = finish_and = finish_or = finish_xor = finish_binary
+	finish_equals = finish_diff = finish_greater = finish_less = finish_binary
+	finish_greater_eq = finish_less_eq = finish_binary
+
+
+
+# 'finish_<name>' methods, indexed by opcode
+Generator.finishers = dispatch_table(Generator, 'finish_', Generator.generic_visit)
@@ -1,172 +1,266 @@
+import re
+from array import array
+from enum import IntEnum
+from errors import CompileError
+
+
+# Token kinds #
+class Kind(IntEnum):
+	STATEMENT = 0
+	KEYWORD = 1
+	INTEGER = 2
+	IDENTIFIER = 3
+	OPEN_PAREN = 4
+	CLOSE_PAREN = 5
+	OPEN_BRACE = 6
+	CLOSE_BRACE = 7
+	SEMICOLON = 8
+	PLUS = 9
+	MINUS = 10
+	BITFLIP = 11
+	NOT = 12
+	STAR = 13
+	DIV = 14
+	MOD = 15
+	AND = 16
+	OR = 17
+	XOR = 18
+	RSHIFT = 19
+	LSHIFT = 20
+	EQUALS = 21
+	DIFF = 22
+	GREATER = 23
+	LESS = 24
+	GREATER_EQ = 25
+	LESS_EQ = 26
+
+
+# Kind members, indexed by kind number
+KINDS = tuple(Kind)
+
+# Token type names, indexed by kind
+NAMES = (
+	'statement',
+	'keyword',
+	'integer',
+	'identifier',
+	'open paren',
+	'close paren',
+	'open brace',
+	'close brace',
+	'semicolon',
+	'plus',
+	'minus',
+	'bitflip',
+	'not',
+	'star',
+	'div',
+	'mod',
+	'and',
+	'or',
+	'xor',
+	'rshift',
+	'lshift',
+	'equals',
+	'diff',
+	'greater',
+	'less',
+	'greater_eq',
+	'less_eq'
+)
+
+
+# Delimiters and operators, longest spelling first (maximal munch)
+SYMBOLS = {
+	'>>': Kind.RSHIFT,
+	'<<': Kind.LSHIFT,
+	'>=': Kind.GREATER_EQ,
+	'<=': Kind.LESS_EQ,
+	'==': Kind.EQUALS,
+	'!=': Kind.DIFF,
+	'(': Kind.OPEN_PAREN,
+	')': Kind.CLOSE_PAREN,
+	'{': Kind.OPEN_BRACE,
+	'}': Kind.CLOSE_BRACE,
+	';': Kind.SEMICOLON,
+	'+': Kind.PLUS,
+	'-': Kind.MINUS,
+	'~': Kind.BITFLIP,
+	'!': Kind.NOT,
+	'*': Kind.STAR,
+	'/': Kind.DIV,
+	'%': Kind.MOD,
+	'&': Kind.AND,
+	'|': Kind.OR,
+	'^': Kind.XOR,
+	'>': Kind.GREATER,
+	'<': Kind.LESS
+}
+
+# Master pattern, every character of the source matches exactly one group
+# Comments are matched first so that '/' and '*' inside them never become tokens
+# Each symbol has its own group ('s<kind>'), so no text is copied for them
+TOKEN_RE = re.compile(
+	r'(?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))'
+	r'|(?P<newline>\n)'
+	r'|(?P<space>[ \t]+)'
+	r'|(?P<word>[^\n\t (){};+\-~!*/%><&|^=]+)'
+	r'|' + '|'.join(f'(?P<s{int(kind)}>{re.escape(sym)})' for sym, kind in SYMBOLS.items()) +
+	r'|(?P<assign>=)',  # Lone '=' is not implemented yet, it's silently dropped
+	re.DOTALL
+)
+
+# Regex group -> token kind
+GROUPS = {f's{int(kind)}': kind for kind in SYMBOLS.values()}
+
+
+
+# Token #
+# The text of a token is not copied, 'start' and 'end' are offsets in the source
+# 'value' is only used by integers
+class Token:
+	__slots__ = ('kind', 'start', 'end', 'x', 'y', 'value')
+	
+	def __init__(self, kind, start, end, x, y, value=None):
+		self.kind = kind
+		self.start = start
+		self.end = end
+		self.x = x
+		self.y = y
+		self.value = value
+	
+	
+	def __repr__(self):
+		return f'Token({NAMES[self.kind]}, {self.start}:{self.end}, x={self.x}, y={self.y}, value={self.value})'
+	
+	
+	# Source text of the token #
+	def text(self, code):
+		return code[self.start:self.end]
+
+
+
+# Token store #
+# Tokens kept as parallel arrays (one column per field), instead of one
+# object per token. Integers that don't fit in 64 bits are kept aside
+class TokenStore:
+	def __init__(self, toks=()):
+		self.kinds = array('B')
+		self.starts = array('I')
+		self.ends = array('I')
+		self.xs = array('I')
+		self.ys = array('I')
+		self.values = array('q')
+		self.big = {}
+		self.extend(toks)
+	
+	
+	def __len__(self):
+		return len(self.kinds)
+	
+	
+	def __getitem__(self, idx):
+		if idx < 0: idx += len(self.kinds)
+		kind = KINDS[self.kinds[idx]]
+		value = self.big.get(idx, self.values[idx]) if kind == Kind.INTEGER else None
+		return Token(kind, self.starts[idx], self.ends[idx], self.xs[idx], self.ys[idx], value)
+	
+	
+	def __iter__(self):
+		big = self.big
+		integer = Kind.INTEGER
+		columns = zip(self.kinds, self.starts, self.ends, self.xs, self.ys, self.values)
+		for idx, (kind, start, end, x, y, value) in enumerate(columns):
+			if kind == integer:
+				yield Token(integer, start, end, x, y, big.get(idx, value))
+			else:
+				yield Token(KINDS[kind], start, end, x, y)
+	
+	
+	def append(self, tok):
+		value = tok.value or 0
+		if not -2**63 <= value < 2**63:
+			self.big[len(self.kinds)] = value
+			value = 0
+		
+		self.kinds.append(tok.kind)
+		self.starts.append(tok.start)
+		self.ends.append(tok.end)
+		self.xs.append(tok.x)
+		self.ys.append(tok.y)
+		self.values.append(value)
+	
+	
+	def extend(self, toks):
+		for tok in toks:
+			self.append(tok)
+
+
+
 class Lexer:
 	# Initialize lexer #
-	def __init__(self, code):
+	# With 'stream=True' nothing is tokenized up front, iterate over the
+	# lexer (or give it to the Parser) to produce the tokens on demand
+	def __init__(self, code, stream=False):
 		self.code = code
-		self.out = []  # [] is a faster constructor
-		self(self.remove_comments(code))
+		self.messages = []  # Warnings and errors, see 'abort'
+		self.out = TokenStore()
+		if not stream:
+			self(code)
 	
 	
-	# Remove comments from C code #
-	def remove_comments(self, code):
-		out = ''
-		char_last = ''
-		
-		comment = None
-		for char in code:
-			if comment is None and char_last == char == '/':
-				comment = '//'
-				out = out[:-1]
-				continue
-			
-			elif comment is None and char_last + char == '/*':
-				comment = '/*'
-				out = out[:-1]
-				char_last = char
-				continue
-			
-			# Line comment
-			elif comment == '//':
-				if char == '\n': comment = None
-				else: continue
-			
-			# Multi-line comment
-			elif comment == '/*':
-				if char_last + char == '*/':
-					comment = None
-					out += ' '
-				elif char in '\n\t': out += char
-				else: out += ' '
-				char_last = char
-				continue
-				
-			out += char
-			char_last = char
-		
-		return out
+	# Lazy token stream #
+	def __iter__(self):
+		return self.tokens(self.code)
 	
 	
-	# Tokenize
+	# Tokenize #
 	def __call__(self, code):
-		buffer = ''
-		buff_x = 0
-		x = y = 0
-		skip = 0
+		self.out.extend(self.tokens(code))
+	
+	
+	# Token generator #
+	# Single pass over the source, comments are skipped while tokenizing
+	def tokens(self, code):
+		groups = GROUPS
+		y = 0
+		line_start = 0  # Index of the first character of the current line
 		
-		for idx, char in enumerate(code + ' '):
-			# Skip the current character
-			if skip:
-				skip -= 1
-				x += 1
-				continue
-				
-			if char in '\n\t (){};+-~!*/%><&|^=':
-				# Identify token
-				self.match_buffer(buffer, buff_x, y)
-				buffer = ''
-				
-				match char:
-					case '\n':
-						x = -1
-						y += 1
-					
-					case '(':
-						self.out.append(('open paren', '(', '(', x, y))
-					
-					case ')':
-						self.out.append(('close paren', ')', ')', x, y))
-					
-					case '{':
-						self.out.append(('open brace', '{', '{', x, y))
-						
-					case '}':
-						self.out.append(('close brace', '}', '}', x, y))
-					
-					case ';':
-						self.out.append(('semicolon', ';', ';', x, y))
-					
-					case '+':
-						self.out.append(('plus', '+', '+', x, y))
-					
-					case '-':
-						self.out.append(('minus', '-', '-', x, y))
-					
-					case '~':
-						self.out.append(('bitflip', '~', '~', x, y))
-					
-					case '!':
-						if idx < len(code) and code[idx+1] == '=':
-							self.out.append(('diff', '!=', '!=', x, y))
-						
-						else:
-							self.out.append(('not', '!', '!', x, y))
-					
-					case '*':
-						self.out.append(('star', '*', '*', x, y))
-					
-					case '/':
-						self.out.append(('div', '/', '/', x, y))
-					
-					case '%':
-						self.out.append(('mod', '%', '%', x, y))
-					
-					case '&':
-						self.out.append(('and', '&', '&', x, y))
-					
-					case '|':
-						self.out.append(('or', '|', '|', x, y))
-					
-					case '^':
-						self.out.append(('xor', '^', '^', x, y))
-					
-					case '>':
-						if idx < len(code):
-							if code[idx+1] == '>':
-								self.out.append(('rshift', '>>', '>>', x, y))
-								skip += 1
-							
-							elif code[idx+1] == '=':
-								self.out.append(('greater_eq', '>=', '>=', x, y))
-								skip += 1
-							
-						if skip == 0:
-							self.out.append(('greater', '>', '>', x, y))
-					
-					case '<':
-						if idx < len(code):
-							if code[idx+1] == '<':
-								self.out.append(('lshift', '<<', '<<', x, y))
-								skip += 1
-							
-							elif code[idx+1] == '=':
-								self.out.append(('less_eq', '<=', '<=', x, y))
-								skip += 1
-							
-						if skip == 0:
-							self.out.append(('less', '<', '<', x, y))
-					
-					case '=':
-						if idx < len(code):
-							if code[idx+1] == '=':
-								self.out.append(('equals', '==', '==', x, y))
+		for m in TOKEN_RE.finditer(code):
+			group = m.lastgroup
 			
-			else:
-				if not buffer: buff_x = x
-				buffer += char
+			if group in groups:
+				start = m.start()
+				yield Token(groups[group], start, m.end(), start - line_start, y)
+			
+			elif group == 'word':
+				start = m.start()
+				yield self.match_buffer(m.group(), start, start - line_start, y)
+			
+			elif group == 'newline':
+				y += 1
+				line_start = m.end()
 			
-			x += 1
+			# Block comments may span several lines
+			elif group == 'comment':
+				text = m.group()
+				lines = text.count('\n')
+				if lines:
+					y += lines
+					line_start = m.start() + text.rindex('\n') + 1
 	
 	
 	# Token identifier #
-	def match_buffer(self, buff, x, y) -> None:
-		if not buff: return
+	def match_buffer(self, buff, start, x, y) -> Token:
+		end = start + len(buff)
 		
 		# Statement identifier
 		if buff in ('return',):
-			self.out.append(('statement', buff, buff, x, y))
+			return Token(Kind.STATEMENT, start, end, x, y)
 		
 		# Keyword identifier
 		elif buff in ('int',):
-			self.out.append(('keyword', buff, buff, x, y))
+			return Token(Kind.KEYWORD, start, end, x, y)
 		
 		# Integer identifier
 		elif buff[0].isdigit():
@@ -206,11 +300,11 @@ class Lexer:
 				except ValueError:
 					self.abort('e', 'Invalid integer constant', x, y, buff)
 			
-			self.out.append(('integer', val, buff, x, y))
+			return Token(Kind.INTEGER, start, end, x, y, val)
 		
 		# If the token cannot be identified, presume that the token is a C 'identifier'
 		else:
-			self.out.append(('identifier', buff, buff, x, y))
+			return Token(Kind.IDENTIFIER, start, end, x, y)
 	
 	
 	# Abort compilation (lexing phase) #
@@ -227,12 +321,46 @@ class Lexer:
 		tabs = line[:x].count('\t')
 		line = line.replace('\t', '  ')
 		
-		print(f'[\033[1;3{error}\033[m]:', msg)
-		print(line)
-		print(' '*(x+tabs) + '^'*base)
-		print('Line:', y+1)
-		print('Offset:', x)
-		print()
+		self.messages.append('\n'.join((
+			f'[\033[1;3{error}\033[m]: {msg}',
+			line,
+			' '*(x+tabs) + '^'*base,
+			f'Line: {y+1}',
+			f'Offset: {x}'
+		)))
 		
 		if e != 'w':
-			exit(-1)
+			raise CompileError(msg, y+1, x, self.messages)
+
+
+
+# Peekable token cursor #
+# Wraps a token list or generator with the 'pop()' / truthiness interface the
+# parser uses, holding only one token of lookahead
+class TokenStream:
+	__slots__ = ('toks', 'next', 'last')
+	
+	def __init__(self, toks):
+		self.toks = iter(toks)
+		self.next = next(self.toks, None)
+		self.last = None  # Last consumed token, for error messages
+	
+	
+	def __bool__(self):
+		return self.next is not None
+	
+	
+	# Next token, without consuming it #
+	def peek(self):
+		return self.next
+	
+	
+	# Consume the next token #
+	def pop(self):
+		tok = self.next
+		if tok is None:
+			raise IndexError('pop from empty token stream')
+		
+		self.next = next(self.toks, None)
+		self.last = tok
+		return tok
@@ -0,0 +1,86 @@
+import json
+import hashlib
+from nodes import from_postfix, Function
+from generator import HEADER
+from cache import compiler_version
+from errors import LinkError
+
+
+# Function the entry stub calls (see 'generator.HEADER')
+ENTRY = 'main'
+
+
+
+# Translation unit of a source file #
+# What a file compiles to on its own, until it's linked: 'file' its name,
+# 'symbols' the functions it defines ('[line, offset]' by name), 'asm' their
+# assembly (without the entry stub, the linker adds it once) and 'log' its
+# warnings and dumps
+# 'hash' of its content, 'version' of the compiler and 'pipeline' tell if
+# it's still up to date (see 'fresh')
+# 'ast' is the flattened AST (see 'nodes.to_postfix'), its top-level
+# statements (outside of any function) don't define a symbol
+def make_unit(fname, code, pipeline, asm, ast, log):
+	text = '\n'.join(asm)
+	if not text.startswith(HEADER):
+		raise ValueError('The assembly does not start with the entry stub')
+	
+	return {
+		'file': fname,
+		'hash': hashlib.sha256(code.encode()).hexdigest(),
+		'version': compiler_version(),
+		'pipeline': pipeline,
+		'symbols': {function.name: [function.y + 1, function.x] for function in from_postfix(ast).body
+		            if isinstance(function, Function)},
+		'asm': text[len(HEADER):].split('\n'),
+		'log': log
+	}
+
+
+# Is a unit up to date #
+# Its source, the compiler and the pipeline have not changed since
+def fresh(unit, code, pipeline):
+	return (unit['hash'] == hashlib.sha256(code.encode()).hexdigest()
+	        and unit['version'] == compiler_version() and unit['pipeline'] == pipeline)
+
+
+# Reads a unit, None if it's missing or unreadable #
+def read_unit(path):
+	try:
+		with open(path) as file:
+			return json.load(file)
+	except (OSError, ValueError):
+		return None
+
+
+
+class Linker:
+	# Initialize linker #
+	# Links 'units' (see 'make_unit') into a program: the entry stub, then the
+	# functions of each unit, in order
+	# A function defined by several units, or no 'main', raises LinkError
+	# 'out' is the assembly of the program and 'symbols' the unit that
+	# defines each function
+	def __init__(self, units):
+		self.symbols = {}
+		self.out = []
+		self(units)
+	
+	
+	# Links the units #
+	def __call__(self, units):
+		for unit in units:
+			for name, (line, offset) in unit['symbols'].items():
+				if name in self.symbols:
+					first = self.symbols[name]
+					line0, offset0 = first['symbols'][name]
+					raise LinkError(f"{unit['file']}:{line}:{offset}: Function '{name}' already defined at "
+					                f"'{first['file']}', line {line0}, offset {offset0}")
+				self.symbols[name] = unit
+		
+		if ENTRY not in self.symbols:
+			raise LinkError(f"Function '{ENTRY}' is not defined")
+		
+		# Each unit starts on a new line, right where the stub would end it
+		text = HEADER + ''.join('\n'.join(unit['asm']) for unit in units)
+		self.out = text.split('\n')
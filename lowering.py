@@ -0,0 +1,271 @@
+from nodes import Op
+from generator import REGISTERS, HEADER
+from selector import BINARY
+from generator_ir import SYMBOLS
+from strength import sequence
+from errors import CompileError
+
+
+# IR operator symbol -> opcode, the unary ones apart since '-' is in both
+UNARY_SYMBOLS = {SYMBOLS[op]: op for op in (Op.MINUS, Op.BITFLIP, Op.NOT)}
+BINARY_SYMBOLS = {symbol: op for op, symbol in SYMBOLS.items() if op not in (Op.MINUS, Op.BITFLIP, Op.NOT)}
+
+# Unary operations, indexed by opcode
+# '{d}' is the destination and '{a}' the operand
+UNARY = {
+	# Negative (5 -> -5)
+	Op.MINUS: '\tsub {d}, $zero, {a}',
+	
+	# Bitflip (11000011 -> 00111100)
+	Op.BITFLIP: '\tnor {d}, $zero, {a}',
+	
+	# Not (5 -> 0, 0 -> 1)
+	Op.NOT: '\tsltiu {d}, {a}, 1'
+}
+
+# Registers that reload spilled operands (first and second operand)
+# They are only live inside a single instruction
+SCRATCH = ('$v1', '$v0')
+
+# Frame size marker, replaced once the spill slots of the function are known
+FRAME = object()
+
+
+
+class Lowering:
+	# Initialize Lowering #
+	# Turns the IR of 'generator_ir' (its 'mirror' tuples) into assembly,
+	# mapping the virtual registers to '$t0'-'$t9' and spilling to the stack
+	# frame when they run out
+	def __init__(self, code, ir):
+		self.code = code
+		self.messages = []  # Warnings and errors, see 'abort'
+		
+		self.out = [HEADER]
+		self(ir)
+	
+	
+	# Abort compilation (lowering phase) #
+	def abort(self, e, msg, x, y, base):
+		# This should never be triggered unless the compiler is being updated
+		# If this ever get triggered on normal usage, there's something wrong
+		base = len(base)
+		
+		error = {
+			'e': '1mERROR',
+			'w': '3mWARNING',
+			'i': '5mNOT IMPLEMENTED'
+		}[e]
+		
+		lines = self.code.split('\n')
+		line = lines[y] if 0 <= y < len(lines) else ''
+		tabs = line[:x].count('\t')
+		line = line.replace('\t', '  ')
+		
+		self.messages.append('\n'.join((
+			f'[\033[1;3{error}\033[m]: {msg}',
+			line,
+			' '*(x+tabs) + '^'*base,
+			f'Line: {y+1}',
+			f'Offset: {x}'
+		)))
+		
+		if e != 'w':
+			raise CompileError(msg, y+1, x, self.messages)
+	
+	
+	# Lowers the IR, one function at a time #
+	def __call__(self, ir):
+		start = 0
+		for idx in range(1, len(ir) + 1):
+			if idx == len(ir) or len(ir[idx]) == 1 and ir[idx][0].startswith(':'):
+				if start < idx:
+					self.function(ir[start:idx])
+				start = idx
+	
+	
+	# Lowers a function #
+	def function(self, ir):
+		# Index of the last instruction that reads each virtual register
+		last_use = {}
+		for idx, inst in enumerate(ir):
+			for reg in self.operands(inst):
+				last_use[reg] = idx
+		
+		self.reduce(ir)
+		self.free = list(REGISTERS[::-1])
+		self.where = {}  # Virtual register -> physical register, spill slot or (constant,)
+		self.held = {}  # Virtual registers in a physical one, the spill candidates
+		self.slots = 0  # Spill slots of the frame
+		self.free_slots = []
+		out = []
+		
+		for idx, inst in enumerate(ir):
+			# Function label
+			if len(inst) == 1 and inst[0].startswith(':'):
+				out.append(f'_{inst[0][2:]}:')
+				out.append(FRAME)
+				continue
+			
+			# Return from function
+			if inst[0] == 'ret':
+				if len(inst) == 2:
+					reg = self.fetch(inst[1], '$v0', out)
+					if reg != '$v0':
+						out.append(f'\tadd $v0, $zero, {reg}')
+				out.append(FRAME)
+				out.append('\tjr $ra')
+				out.append('\tnop')
+				self.release(inst, idx, last_use)
+				continue
+			
+			# Constants of strength-reduced operations are not loaded
+			if inst[0] in self.deferred:
+				self.where[inst[0]] = (inst[2],)
+				continue
+			
+			# Scratch registers of a strength-reduced operation are taken before
+			# the operands are released, so they can't be the same
+			# Without enough of them, the constant is loaded after all
+			reduced = self.reduced.get(idx)  # (constant position, template, scratch)
+			if reduced and len(self.free) >= reduced[2]:
+				temps = [self.free.pop() for _ in range(reduced[2])]
+			else:
+				reduced = None
+			
+			operands = self.operands(inst)
+			regs = [None if reduced and pos == reduced[0] else self.fetch(reg, SCRATCH[pos], out)
+			        for pos, reg in enumerate(operands)]
+			self.release(inst, idx, last_use)
+			
+			# The result goes straight into '$v0' when it's returned right away
+			if idx + 1 < len(ir) and ir[idx + 1] == ('ret', inst[0]):
+				dest = '$v0'
+			else:
+				dest = self.allocate(last_use, out)
+			self.where[inst[0]] = dest
+			if dest in REGISTERS:
+				self.held[inst[0]] = dest
+			
+			# Load integer
+			if len(inst) == 3:
+				out.append(f'\tli {dest}, {inst[2]}')
+			
+			# Multiplication, division or modulo by a constant
+			elif reduced:
+				pos, template, scratch = reduced
+				out.append(template.format(d=dest, a=regs[1 - pos], **dict(zip('tu', temps))))
+				self.free += temps[::-1]
+			
+			# Unary operators
+			elif len(inst) == 4:
+				op = UNARY_SYMBOLS.get(inst[2])
+				if op is None:
+					self.abort('i', f"IR operator '{inst[2]}' not implemented", 0, 0, '')
+				out.append(UNARY[op].format(d=dest, a=regs[0]))
+			
+			# Binary operators
+			else:
+				op = BINARY_SYMBOLS.get(inst[3])
+				if op is None:
+					self.abort('i', f"IR operator '{inst[3]}' not implemented", 0, 0, '')
+				out.append(BINARY[op].format(d=dest, a=regs[0], b=regs[1]))
+		
+		# Now the frame size is known
+		# The first marker makes room for it, the others (returns) give it back
+		frame = self.slots * 4
+		for idx, line in enumerate(out):
+			if line is not FRAME:
+				self.out.append(line)
+			elif frame and idx == 1:
+				self.out.append(f'\taddi $sp, $sp, -{frame}')
+			elif frame:
+				self.out.append(f'\taddi $sp, $sp, {frame}')
+	
+	
+	# Finds the operations by a constant that can be strength-reduced #
+	# 'reduced' maps their index to (constant position, template, scratch)
+	# and 'deferred' holds the constants only they use, which are never loaded
+	def reduce(self, ir):
+		consts = {inst[0]: inst[2] for inst in ir if len(inst) == 3}
+		self.reduced = {}
+		loaded = set()  # Constants needed in a register
+		
+		for idx, inst in enumerate(ir):
+			operands = self.operands(inst)
+			found = None
+			if len(inst) == 5:
+				op = BINARY_SYMBOLS.get(inst[3])
+				for pos in ((1, 0) if op == Op.MULT else (1,)):
+					if operands[pos] in consts:
+						reduced = sequence(op, consts[operands[pos]])
+						if reduced is not None:
+							found = (pos, *reduced)
+							break
+			
+			if found:
+				self.reduced[idx] = found
+			loaded.update(reg for pos, reg in enumerate(operands)
+			              if reg in consts and (not found or pos != found[0]))
+		
+		self.reduced = {idx: found for idx, found in self.reduced.items()
+		                if self.operands(ir[idx])[found[0]] not in loaded}
+		self.deferred = {self.operands(ir[idx])[found[0]] for idx, found in self.reduced.items()}
+	
+	
+	# Virtual registers read by an instruction #
+	def operands(self, inst):
+		if inst[0] == 'ret':
+			return inst[1:]
+		if len(inst) == 4:
+			return (inst[3],)
+		if len(inst) == 5:
+			return (inst[2], inst[4])
+		return ()
+	
+	
+	# Physical register holding a virtual register #
+	# Spilled values and constants that were never loaded go into 'scratch'
+	# '$sp' points to the first free word, so slot 0 is at '4($sp)'
+	def fetch(self, reg, scratch, out):
+		loc = self.where[reg]
+		if type(loc) is int:
+			out.append(f'\tlw {scratch}, {loc * 4 + 4}($sp)')
+			return scratch
+		if type(loc) is tuple:
+			out.append(f'\tli {scratch}, {loc[0]}')
+			return scratch
+		return loc
+	
+	
+	# Frees the registers and slots read for the last time #
+	def release(self, inst, idx, last_use):
+		for reg in self.operands(inst):
+			if last_use[reg] == idx and reg in self.where:
+				loc = self.where.pop(reg)
+				if type(loc) is int:
+					self.free_slots.append(loc)
+				elif loc in REGISTERS:
+					self.free.append(loc)
+					del self.held[reg]
+	
+	
+	# Free physical register #
+	# With none left, the value used the furthest away is spilled to the frame
+	# Only the values held in registers are candidates, not every live one
+	def allocate(self, last_use, out):
+		if self.free:
+			return self.free.pop()
+		
+		victim = max(self.held, key=lambda reg: last_use.get(reg, -1))
+		
+		if self.free_slots:
+			slot = self.free_slots.pop()
+		else:
+			slot = self.slots
+			self.slots += 1
+		
+		loc = self.held.pop(victim)
+		out.append(f'\tsw {loc}, {slot * 4 + 4}($sp)')
+		self.where[victim] = slot
+		return loc
@@ -0,0 +1,287 @@
+from enum import IntEnum
+
+
+# Node opcodes #
+class Op(IntEnum):
+	PROGRAM = 0
+	FUNCTION = 1
+	RETURN = 2
+	INTEGER = 3
+	PLUS = 4
+	MINUS = 5
+	BITFLIP = 6
+	NOT = 7
+	MULT = 8
+	DIV = 9
+	MOD = 10
+	ADD = 11
+	SUB = 12
+	RSHIFT = 13
+	LSHIFT = 14
+	AND = 15
+	OR = 16
+	XOR = 17
+	EQUALS = 18
+	DIFF = 19
+	GREATER = 20
+	LESS = 21
+	GREATER_EQ = 22
+	LESS_EQ = 23
+
+
+# Op members, indexed by opcode
+OPS = tuple(Op)
+
+# Node names (the ones used by the old list AST), indexed by opcode
+NAMES = tuple(op.name.lower() for op in Op)
+
+# Opcodes of unary and binary operators
+UNARY_OPS = frozenset((Op.PLUS, Op.MINUS, Op.BITFLIP, Op.NOT))
+BINARY_OPS = frozenset(range(Op.MULT, Op.LESS_EQ + 1))
+
+
+
+# AST nodes #
+# Every node has an opcode ('op'), the fields depend on the node class
+class Node:
+	__slots__ = ('op',)
+	
+	def __repr__(self):
+		fields = ', '.join(repr(getattr(self, name)) for name in self.__slots__)
+		return f'{type(self).__name__}({fields})'
+	
+	
+	# Child nodes, in evaluation order #
+	def children(self):
+		return ()
+
+
+
+class Program(Node):
+	__slots__ = ('body',)
+	
+	def __init__(self, body=None):
+		self.op = Op.PROGRAM
+		self.body = [] if body is None else body
+	
+	
+	def children(self):
+		return self.body
+
+
+
+class Function(Node):
+	__slots__ = ('name', 'x', 'y', 'body')
+	
+	def __init__(self, name, x, y, body=None):
+		self.op = Op.FUNCTION
+		self.name = name
+		self.x = x
+		self.y = y
+		self.body = [] if body is None else body
+	
+	
+	def children(self):
+		return self.body
+
+
+
+# 'value' is None on an empty return
+class Return(Node):
+	__slots__ = ('value',)
+	
+	def __init__(self, value=None):
+		self.op = Op.RETURN
+		self.value = value
+	
+	
+	def children(self):
+		return () if self.value is None else (self.value,)
+
+
+
+class Integer(Node):
+	__slots__ = ('value',)
+	
+	def __init__(self, value):
+		self.op = Op.INTEGER
+		self.value = value
+
+
+
+class Unary(Node):
+	__slots__ = ('operand',)
+	
+	def __init__(self, op, operand):
+		self.op = op
+		self.operand = operand
+	
+	
+	def __repr__(self):
+		return f'Unary({NAMES[self.op]}, {self.operand!r})'
+	
+	
+	def children(self):
+		return (self.operand,)
+
+
+
+class Binary(Node):
+	__slots__ = ('lhs', 'rhs')
+	
+	def __init__(self, op, lhs, rhs):
+		self.op = op
+		self.lhs = lhs
+		self.rhs = rhs
+	
+	
+	def __repr__(self):
+		return f'Binary({NAMES[self.op]}, {self.lhs!r}, {self.rhs!r})'
+	
+	
+	def children(self):
+		return (self.lhs, self.rhs)
+
+
+
+# Methods of 'cls' named '<prefix><name>', indexed by opcode #
+def dispatch_table(cls, prefix, default):
+	return tuple(getattr(cls, prefix + name, default) for name in NAMES)
+
+
+
+# Visitor #
+# Subclasses define 'visit_<name>' methods ('visit_add', 'visit_integer'...)
+# and 'visit' dispatches on the opcode through a table built per class
+# Opcodes without a method go to 'generic_visit'
+class Visitor:
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		cls.dispatch = dispatch_table(cls, 'visit_', cls.generic_visit)
+	
+	
+	def visit(self, node, *args):
+		return self.dispatch[node.op](self, node, *args)
+	
+	
+	def generic_visit(self, node, *args):
+		raise NotImplementedError(f"'{NAMES[node.op]}' not implemented")
+
+
+
+# Converts an old list AST node into a Node #
+# ['program', [...]], ['function', name, (x, y), [...]], ['return', [expr]],
+# ['integer', value, []], [operator, [operand(s)]]
+def from_list(tree):
+	# Post-order with an explicit stack, so deep expressions don't recurse
+	done = []
+	work = [(tree, False)]
+	while work:
+		item, ready = work.pop()
+		name = item[0]
+		op = Op[name.upper()]
+		
+		if op == Op.INTEGER:
+			done.append(Integer(item[1]))
+			continue
+		
+		children = item[-1]
+		if not ready:
+			work.append((item, True))
+			work += ((child, False) for child in children[::-1])
+			continue
+		
+		args = done[len(done) - len(children):]
+		del done[len(done) - len(children):]
+		
+		if op == Op.PROGRAM:
+			done.append(Program(args))
+		elif op == Op.FUNCTION:
+			done.append(Function(item[1], item[2][0], item[2][1], args))
+		elif op == Op.RETURN:
+			done.append(Return(args[0] if args else None))
+		elif op in UNARY_OPS:
+			done.append(Unary(op, args[0]))
+		else:
+			done.append(Binary(op, *args))
+	
+	return done[0]
+
+
+# Converts a Node into the old list AST form #
+def to_list(node):
+	done = []
+	work = [(node, False)]
+	while work:
+		item, ready = work.pop()
+		children = item.children()
+		if not ready and children:
+			work.append((item, True))
+			work += ((child, False) for child in reversed(children))
+			continue
+		
+		args = done[len(done) - len(children):]
+		del done[len(done) - len(children):]
+		
+		op = item.op
+		if op == Op.INTEGER:
+			done.append(['integer', item.value, []])
+		elif op == Op.FUNCTION:
+			done.append(['function', item.name, (item.x, item.y), args])
+		else:
+			done.append([NAMES[op], args])
+	
+	return done[0]
+
+
+# Converts a Node into a flat post-order list #
+# Each node is a tuple, '(op, children count)' or, for integers and functions,
+# '(op, value)' and '(op, children count, name, x, y)'
+# Unlike the nested forms it can be pickled no matter how deep the tree is
+def to_postfix(node):
+	flat = []
+	work = [(node, False)]
+	while work:
+		item, ready = work.pop()
+		children = item.children()
+		if not ready and children:
+			work.append((item, True))
+			work += ((child, False) for child in reversed(children))
+			continue
+		
+		op = item.op
+		if op == Op.INTEGER:
+			flat.append((op, item.value))
+		elif op == Op.FUNCTION:
+			flat.append((op, len(children), item.name, item.x, item.y))
+		else:
+			flat.append((op, len(children)))
+	
+	return flat
+
+
+# Converts a flat post-order list back into a Node #
+def from_postfix(flat):
+	done = []
+	for item in flat:
+		op = item[0]
+		if op == Op.INTEGER:
+			done.append(Integer(item[1]))
+			continue
+		
+		count = item[1]
+		args = done[len(done) - count:]
+		del done[len(done) - count:]
+		
+		if op == Op.PROGRAM:
+			done.append(Program(args))
+		elif op == Op.FUNCTION:
+			done.append(Function(item[2], item[3], item[4], args))
+		elif op == Op.RETURN:
+			done.append(Return(args[0] if args else None))
+		elif op in UNARY_OPS:
+			done.append(Unary(op, args[0]))
+		else:
+			done.append(Binary(op, *args))
+	
+	return done[0]
@@ -1,46 +1,74 @@
+from lexer import Kind, TokenStream
+from nodes import Op, Program, Function, Return, Integer, Unary, Binary
+from errors import CompileError
+
 '''
-Type
-Value
-Base
+Token:
+Kind
+Start offset
+End offset
 X offset
 Y offset
+Value (integers only)
 '''
 
-# Operators
-OPERS = (
-	'plus',
-	'minus',
-	'bitflip',
-	'not',
-	'star',
-	'div',
-	'mod',
-	'add',
-	'sub',
-	'rshift',
-	'lshift',
-	'and',
-	'or',
-	'xor',
-	'equals',
-	'diff',
-	'greater',
-	'less',
-	'greater_eq',
-	'less_eq'
+# Operators, indexed by token kind
+OPERS = tuple(Kind.PLUS <= kind <= Kind.LESS_EQ for kind in Kind)
+
+# Tokens allowed inside an expression, indexed by token kind
+EXPRESSION = tuple(
+	OPERS[kind] or kind in (Kind.INTEGER, Kind.OPEN_PAREN, Kind.CLOSE_PAREN)
+	for kind in Kind
 )
 
+# Binding power of unary operators
+# Higher than any binary operator, so they always bond to the closest operand
+UNARY_POWER = 9
+
+# Unary operators (node opcode), indexed by token kind
+UNARY = tuple({
+	Kind.PLUS: Op.PLUS,
+	Kind.MINUS: Op.MINUS,
+	Kind.BITFLIP: Op.BITFLIP,
+	Kind.NOT: Op.NOT
+}.get(kind) for kind in Kind)
+
+# Binary operators (left power, right power, node opcode), indexed by token kind
+# A right power slightly above the left one makes the operator left-associative
+BINARY = tuple({
+	Kind.STAR: (8, 8.1, Op.MULT),
+	Kind.DIV: (8, 8.1, Op.DIV),
+	Kind.MOD: (8, 8.1, Op.MOD),
+	Kind.PLUS: (7, 7.1, Op.ADD),
+	Kind.MINUS: (7, 7.1, Op.SUB),
+	Kind.RSHIFT: (6, 6.1, Op.RSHIFT),
+	Kind.LSHIFT: (6, 6.1, Op.LSHIFT),
+	Kind.GREATER: (5, 5.1, Op.GREATER),
+	Kind.LESS: (5, 5.1, Op.LESS),
+	Kind.GREATER_EQ: (5, 5.1, Op.GREATER_EQ),
+	Kind.LESS_EQ: (5, 5.1, Op.LESS_EQ),
+	Kind.EQUALS: (4, 4.1, Op.EQUALS),
+	Kind.DIFF: (4, 4.1, Op.DIFF),
+	Kind.AND: (3, 3.1, Op.AND),
+	Kind.OR: (2, 2.1, Op.OR),
+	Kind.XOR: (1, 1.1, Op.XOR)
+}.get(kind) for kind in Kind)
+
 
 
 class Parser:
 	# Initialize parser #
-	def __init__(self, code, toks):
+	# 'toks' can be a token list, a streaming 'Lexer' or any token iterator
+	# 'fname' is the name of the source file, where its functions are defined
+	def __init__(self, code, toks, fname='<source>'):
 		self.code = code
-		self.out = [['program', []]]
-		self.node = self.out
+		self.fname = fname
+		self.messages = []  # Warnings and errors, see 'abort'
+		self.out = Program()
+		self.body = self.out.body  # Where the next statement goes
 		self.scope = []
 		self.functions = {}
-		self(toks[::-1])
+		self(TokenStream(toks))
 		
 		# Check if the code is properly closed
 		if self.scope:
@@ -61,361 +89,219 @@ class Parser:
 		tabs = line[:x].count('\t')
 		line = line.replace('\t', '  ')
 		
-		print(f'[\033[1;3{error}\033[m]:', msg)
-		print(line)
-		print(' '*(x+tabs) + '^'*base)
-		print('Line:', y+1)
-		print('Offset:', x)
-		print()
+		self.messages.append('\n'.join((
+			f'[\033[1;3{error}\033[m]: {msg}',
+			line,
+			' '*(x+tabs) + '^'*base,
+			f'Line: {y+1}',
+			f'Offset: {x}'
+		)))
 		
 		if e != 'w':
-			exit(-1)
+			raise CompileError(msg, y+1, x, self.messages)
+	
+	
+	# Abort compilation pointing at a token #
+	def abort_at(self, e, msg, tok):
+		self.abort(e, msg, tok.x, tok.y, tok.text(self.code))
 	
 	
 	# Parse #
 	def __call__(self, toks):
 		while toks:
-			tt, tv, tb, tx, ty = tok = toks.pop()
+			tok = toks.pop()
+			tt = tok.kind
 			
-			if tt == 'keyword':
+			if tt == Kind.KEYWORD:
 				self.create_function(tok, toks)
 			
 			# Close functions, blocks and stuff
-			elif tt == 'close brace':
+			elif tt == Kind.CLOSE_BRACE:
 				if not self.scope:
-					self.abort('e', "Unexpected token '}'", tx, ty, tb)
+					self.abort_at('e', "Unexpected token '}'", tok)
 				
 				scope = self.scope.pop()
-				self.node = scope[-1]
+				self.body = scope[-1]
 				
 				# Clean garbage
 				del scope
 			
 			# Handles statements
-			elif tt == 'statement':
-				if tv == 'return':
+			elif tt == Kind.STATEMENT:
+				tb = tok.text(self.code)
+				if tb == 'return':
 					if not toks:
-						self.abort('e', 'Missing expression', tx, ty, tb)
+						self.abort_at('e', 'Missing expression', tok)
+					
+					# Empty return
+					if toks.peek().kind == Kind.SEMICOLON:
+						toks.pop()
+						self.body.append(Return())
 					
-					expr = self.get_expression(tok, toks)
-					expr = self.bond(expr[::-1], 0)
-					self.node[-1][-1].append(['return', expr])
-					del expr
+					else:
+						expr = self.bond(toks)
+						self.end_expression(toks, Kind.SEMICOLON)
+						self.body.append(Return(expr))
+						del expr
 				
 				# Panic (⁠٥⁠•⁠▽⁠•⁠)
 				else:
-					self.abort('i', f"'{tb}' statement was not implemented", tx, ty, tb)
+					self.abort_at('i', f"'{tb}' statement was not implemented", tok)
 			
 			else:
-				self.abort('e', 'Invalid token', tx, ty, tb)
+				self.abort_at('e', 'Invalid token', tok)
 	
 	
 	# Creates a function #
 	def create_function(self, tok, toks):
 		if not toks:
-			self.abort('e', 'Missing name of function', tok[3], tok[4], tok[2])
+			self.abort_at('e', 'Missing name of function', tok)
 		
-		nt, nv, nb, nx, ny = toks.pop()
-		if nt != 'identifier':
+		name = toks.pop()
+		nb, nx, ny = name.text(self.code), name.x, name.y
+		if name.kind != Kind.IDENTIFIER:
 			self.abort('e', f'Expected identifier, got \'{nb}\'', nx, ny, nb)
 		
 		if not toks:
 			self.abort('e', 'Missing function parameters', nx, ny, nb)
 		
-		pt, pv, pb, px, py = toks.pop()
-		if pt != 'open paren':
-			self.abort('e', f"Expected '(', got '{pb}'", px, py, pb)
+		paren = toks.pop()
+		if paren.kind != Kind.OPEN_PAREN:
+			self.abort_at('e', f"Expected '(', got '{paren.text(self.code)}'", paren)
 		
 		if not toks:
-			self.abort('e', 'Missing parameter terminator', px, py, pb)
+			self.abort_at('e', 'Missing parameter terminator', paren)
 		
-		pt, pv, pb, px, py = toks.pop()
-		if pt != 'close paren':
-			self.abort('e', f"Parameter terminator should be a ')', got '{pb}'", px, py, pb)
+		paren = toks.pop()
+		if paren.kind != Kind.CLOSE_PAREN:
+			self.abort_at('e', f"Parameter terminator should be a ')', got '{paren.text(self.code)}'", paren)
 		
 		# Check if the function already exists
 		if nb in self.functions.keys():
-			name, x, y, *_ = self.functions[nb].values()
+			fname, x, y, *_ = self.functions[nb].values()
 			del _
 			self.abort('e', f"Function '{nb}' already defined at '{fname}', line {y+1}, offset {x}", nx, ny, nb)
 		
 		# Create the function
-		# 'main.c' is a dummy name
 		# ‘'type': 'int'’ is a dummy type
 		self.functions[nb] = {
-			'file': 'main.c',
+			'file': self.fname,
 			'x': nx,
 			'y': ny,
 			'type': 'int'
 		}
 		
-		self.node[-1][-1].append(
-			[
-				'function',
-				nb,
-				(nx, ny),
-			[]]
-		)
+		function = Function(nb, nx, ny)
+		self.body.append(function)
 		
 		# Setup function body
 		if not toks:
 			self.abort('e', 'Missing function body', nx, ny, nb)
 		
-		bt, bv, bb, bx, by = toks.pop()
-		if bt != 'open brace':
-			self.abort('e', f"Expecting '{'{'}', got '{bb}'", bx, by, bb)
+		brace = toks.pop()
+		if brace.kind != Kind.OPEN_BRACE:
+			self.abort_at('e', f"Expecting '{'{'}', got '{brace.text(self.code)}'", brace)
 		
-		self.scope.append(['function', nx, ny, nb, self.node])
-		self.node = self.node[-1][-1]
+		self.scope.append(['function', nx, ny, nb, self.body])
+		self.body = function.body
 	
 	
-	# Find expression boundaries and extract them #
-	def get_expression(self, parent, toks):
-		expr = []
-		# Group the tokens in a single expession
-		while True:
-			tt, tv, tb, tx, ty = tok = toks.pop()
-			if tt == 'semicolon':
-				break
-			
-			if tt not in ('integer', 'open paren', 'close paren') and tt not in OPERS:
-				self.abort('e', 'Invalid expression', tx, ty, tb)
-			
-			if not toks:
-				self.abort('e', 'Missing expression terminator', tx, ty, tb)
-			
-			expr.append(tok)
+	# Next token of an expression #
+	def expression_token(self, toks):
+		if not toks:
+			self.abort_at('e', 'Missing expression terminator', toks.last)
+		
+		tok = toks.pop()
+		if not EXPRESSION[tok.kind] and tok.kind != Kind.SEMICOLON:
+			self.abort_at('e', 'Invalid expression', tok)
 		
-		return expr
+		return tok
 	
 	
-	# "Atomic bonding" aproach (Pratt parsing) #
-	def bond(self, expr, min_power=0):
-		# Handles single integer costants
-		if len(expr) == 1:
-			tok = expr.pop()
-			if tok[0] != 'integer':
-				self.abort('e', 'Unexpected token', tok[3], tok[4], tok[2])
-			
-			return [['integer', tok[1], []]]
+	# Consume the token that closes an expression #
+	def end_expression(self, toks, kind):
+		tok = self.expression_token(toks)
+		if tok.kind == kind:
+			return
 		
-		# List of operators and their precedence order
-		# The list is created after the check for single integer conatants
-		# because they don't have operators, so, there's no need to generate
-		# the list of operators
-		ATOMS = {
-			'plus': {
-				'power': 9,
-				'binary': False
-			},
-			'minus': {
-				'power': 9,
-				'binary': False
-			},
-			'bitflip': {
-				'power': 9,
-				'binary': False
-			},
-			'not': {
-				'power': 9,
-				'binary': False
-			},
-			'star': {
-				'left': 8,
-				'right': 8.1,
-				'binary': True
-			},
-			'div': {
-				'left': 8,
-				'right': 8.1,
-				'binary': True
-			},
-			'mod': {
-				'left': 8,
-				'right': 8.1,
-				'binary': True
-			},
-			'add': {
-				'left': 7,
-				'right': 7.1,
-				'binary': True
-			},
-			'sub': {
-				'left': 7,
-				'right': 7.1,
-				'binary': True
-			},
-			'rshift': {
-				'left': 6,
-				'right': 6.1,
-				'binary': True
-			},
-			'lshift': {
-				'left': 6,
-				'right': 6.1,
-				'binary': True
-			},
-			'greater': {
-				'left': 5,
-				'right': 5.1,
-				'binary': True
-			},
-			'less': {
-				'left': 5,
-				'right': 5.1,
-				'binary': True
-			},
-			'greater_eq': {
-				'left': 5,
-				'right': 5.1,
-				'binary': True
-			},
-			'less_eq': {
-				'left': 5,
-				'right': 5.1,
-				'binary': True
-			},
-			'equals': {
-				'left': 4,
-				'right': 4.1,
-				'binary': True
-			},
-			'diff': {
-				'left': 4,
-				'right': 4.1,
-				'binary': True
-			},
-			'and': {
-				'left': 3,
-				'right': 3.1,
-				'binary': True
-			},
-			'or': {
-				'left': 2,
-				'right': 2.1,
-				'binary': True
-			},
-			'xor': {
-				'left': 1,
-				'right': 1.1,
-				'binary': True
-			}
-		}
+		if tok.kind == Kind.OPEN_PAREN:
+			self.abort_at('e', 'Expected an operator, got parenthesis', tok)
 		
-		out = []
-		lhs = None  # Left-hand side
-		rhs = None  # Right-hand side
+		elif tok.kind == Kind.CLOSE_PAREN:
+			self.abort_at('e', 'No matching open parenthesis', tok)
+		
+		elif tok.kind == Kind.SEMICOLON:
+			self.abort_at('e', 'No matching close parenthesis', tok)
+		
+		elif UNARY[tok.kind]:
+			self.abort_at('e', 'Cannot perform a binary operation using a unary operator', tok)
+		
+		else:
+			self.abort_at('e', 'Expected an operator', tok)
+	
+	
+	# "Atomic bonding" aproach (Pratt parsing) #
+	# Reads the expression straight from the token stream in a single pass
+	# Pending operators are kept in an explicit stack instead of recursion,
+	# so the nesting depth is only limited by memory
+	# Each entry is (right power, node opcode, left-hand side)
+	# Parentheses are entries with power -1, no operator can bond through them
+	def bond(self, toks):
+		stack = []
 		
-		while expr:
-			tok = expr.pop()
-			# For now, let's assume that only unary operators exist
-			if tok[0] in OPERS and type(tok) is tuple and not ATOMS[tok[0]]['binary']:
-				if not expr:
-					self.abort('e', 'Missing right-hand side operand', tok[3], tok[4], tok[2])
+		while True:
+			# Unary operators and open parentheses before the operand
+			tok = self.expression_token(toks)
+			kind = tok.kind
+			while kind != Kind.INTEGER:
+				if kind == Kind.OPEN_PAREN:
+					if toks and toks.peek().kind == Kind.CLOSE_PAREN:
+						self.abort_at('e', 'Missing expression inside parentheses', toks.peek())
 					
-				rhs = self.bond(expr, 999)
-				print(rhs, tok)
-				if type(rhs) is tuple:
-					expr.append([tok[0], rhs[0]])
-				else:
-					return [[tok[0], rhs]]
-			
-			# Checks for a opening parenthesis
-			elif tok[0] == 'open paren':
-				temp = self.parse_paren(expr)
-				if expr: expr.append(temp)
-				else: out.append(temp)
-				del temp
-			
-			# Checks for a closing parenthesis
-			elif tok[0] == 'close paren':
-				self.abort('e', 'No matching open parenthesis', tok[3], tok[4], tok[2])
-			
-			# Checks for binary operators
-			elif tok[0] == 'integer' or type(tok) is list:
-				# Stand-alone constants are handled outside this loop,
-				# so it's always guarranteed to be a following token 
-				op = expr.pop()
-				
-				# Checks if the following token is a parenthesis
-				if op[0] in ('open paren', 'close paren'):
-					self.abort('e', 'Expected an operator, got parenthesis', op[3], op[4], op[2])
+					stack.append((-1, None, tok))
 				
-				# This check should never be triggered unless during development
-				# If this ever get triggered, something is wrong
-				if op[0] not in ATOMS.keys():
-					self.abort('i', 'Operator not implemented', op[3], op[4], op[2])
-				
-				# Replace unary plus and unary minus to addition and subtraction
-				if op[0] in ('plus', 'minus'):
-					op = ({
-						'plus': 'add',
-						'minus': 'sub'
-					}[op[0]],) + op[1:]
-				
-				# Checks if the operator have a lower precedence than the last operator
-				if ATOMS[op[0]]['binary'] and ATOMS[op[0]]['left'] <= min_power:
-					expr.append(op)
-					if type(tok) is tuple:
-						return [['integer', tok[1], []]],
-					else:
-						return [tok],
+				elif UNARY[kind]:
+					if toks and toks.peek().kind == Kind.SEMICOLON:
+						self.abort_at('e', 'Missing right-hand side operand', tok)
+					
+					stack.append((UNARY_POWER, UNARY[kind], None))
 				
-				# Error checking
-				if op[0] not in OPERS:
-					self.abort('e', 'Trying to perform an operation using a non-operator element', op[3], op[4], op[2])
+				elif kind == Kind.CLOSE_PAREN:
+					self.abort_at('e', 'No matching open parenthesis', tok)
 				
-				if not ATOMS[op[0]]['binary']:
-					self.abort('e', 'Cannot perform a binary operation using a unary operator', op[3], op[4], op[2])
+				elif kind == Kind.SEMICOLON:
+					self.abort_at('e', 'Missing right-hand side operand', tok)
 				
-				# Try to resolve the right side of the operator
-				if type(tok) is tuple:
-					lhs = [['integer', tok[1], []]]
 				else:
-					lhs = [[tok[0], tok[1]]]
-				rhs = self.bond(expr, ATOMS[op[0]]['right'])
-				
-				if op[0] == 'star':
-					op = ({
-						'star': 'mult',
-					}[op[0]],) + op[1:]
+					self.abort_at('e', 'Unexpected token', tok)
 				
-				if type(rhs) is not tuple:
-					out.append([op[0], lhs + rhs])
-				else:
-					expr.append([op[0], lhs + rhs[0]])
+				tok = self.expression_token(toks)
+				kind = tok.kind
 			
-			# Checks for invalid elements
-			else:
-				self.abort('e', 'Invalid element', tok[3], tok[4], tok[2])
-		
-		return out
-	
-	
-	def parse_paren(self, expr):
-		# Creates a new expression out of the original one
-		expr2 = []
-		paren_count = 0
+			lhs = Integer(tok.value)
 			
-		while True:
-			# Raise an error if the expression has no matching close parenthesis
-			if not expr:
-				self.abort('e', 'No matching close parenthesis', tok[3], tok[4], tok[2])
+			# Binary operators and close parentheses after the operand
+			while True:
+				binary = BINARY[toks.peek().kind] if toks else None
+				left = binary[0] if binary else 0
 				
-			tok = expr.pop()
-			if tok[0] == 'open paren':
-				paren_count += 1
-			
-			elif tok[0] == 'close paren':
-				paren_count -= 1
-				if paren_count == -1: break
-			
-			expr2.append(tok)
-		
-		# Checks if the parentheses expression is empty
-		if not expr2:
-			self.abort('e', 'Missing expression inside parentheses', tok[3], tok[4], tok[2])
+				# Bond the pending operators that are stronger than the next one
+				while stack and stack[-1][0] >= left:
+					power, op, prev = stack.pop()
+					if prev is None:
+						lhs = Unary(op, lhs)
+					else:
+						lhs = Binary(op, prev, lhs)
+				
+				if binary:
+					toks.pop()
+					stack.append((binary[1], binary[2], lhs))
+					break
+				
+				# End of the whole expression
+				if not stack:
+					return lhs
 				
-		# Evaluates the parentheses expression
-		return self.bond(expr2[::-1])[0]
-		#print(expr[-1], len(expr[-1]))
+				# End of a parenthesized expression
+				self.end_expression(toks, Kind.CLOSE_PAREN)
+				stack.pop()
@@ -0,0 +1,267 @@
+import re
+
+
+# Line kinds that are not instructions, kept as they are
+LABEL = ':'
+RAW = ''  # Directives and blank lines
+
+# Instructions that jump, the next instruction is their delay slot
+BRANCHES = frozenset(('beq', 'bne', 'blez', 'bgtz', 'bltz', 'bgez', 'j', 'jal', 'jr', 'jalr'))
+
+# Instructions whose first operand is the only register written, without
+# any other effect (they can be removed when that register is dead)
+PURE = frozenset((
+	'li', 'lui', 'move', 'add', 'addu', 'addi', 'addiu', 'sub', 'subu',
+	'and', 'andi', 'or', 'ori', 'xor', 'xori', 'nor',
+	'slt', 'sltu', 'slti', 'sltiu', 'sll', 'srl', 'sra', 'sllv', 'srlv', 'srav',
+	'mflo', 'mfhi'
+))
+
+# Writes the first operand, but can't be removed freely
+WRITES_FIRST = PURE | {'lw'}
+
+# Register in a memory operand ('4($sp)' -> '$sp')
+MEMORY_RE = re.compile(r'.*\((\$\w+)\)')
+
+
+
+# Instruction #
+# A line of assembly: 'op' is the mnemonic (or LABEL / RAW) and 'args' the
+# operands (the label name, or the whole line for RAW)
+class Inst:
+	__slots__ = ('op', 'args')
+	
+	def __init__(self, op, args=()):
+		self.op = op
+		self.args = tuple(args)
+	
+	
+	def __repr__(self):
+		return f'Inst({self.op!r}, {self.args!r})'
+	
+	
+	def __str__(self):
+		if self.op == LABEL:
+			return f'{self.args[0]}:'
+		if self.op == RAW:
+			return self.args[0]
+		if self.args:
+			return f'\t{self.op} ' + ', '.join(self.args)
+		return f'\t{self.op}'
+	
+	
+	# Parses a line of assembly #
+	@classmethod
+	def parse(cls, line):
+		text = line.strip()
+		if not text or text.startswith('.'):
+			return cls(RAW, (line,))
+		if text.endswith(':'):
+			return cls(LABEL, (text[:-1],))
+		
+		op, _, args = text.partition(' ')
+		return cls(op, (arg.strip() for arg in args.split(',')) if args else ())
+	
+	
+	# Is an actual instruction (not a label or directive) #
+	def is_code(self):
+		return self.op != LABEL and self.op != RAW
+	
+	
+	# Is more than one machine instruction #
+	# 'li' of a constant that doesn't fit in 16 bits is two of them, and only
+	# the first one would end up in a delay slot
+	def is_wide(self):
+		if self.op != 'li':
+			return False
+		try:
+			value = int(self.args[1], 0)
+		except ValueError:
+			return True
+		return not -0x8000 <= value <= 0xffff
+	
+	
+	# Registers written #
+	def defs(self):
+		if self.op in WRITES_FIRST:
+			return (self.args[0],)
+		if self.op in ('jal', 'jalr'):
+			return ('$ra',)
+		return ()
+	
+	
+	# Registers read #
+	def uses(self):
+		if not self.is_code() or self.op in ('j', 'jal', 'li', 'lui', 'mflo', 'mfhi'):
+			return ()
+		
+		args = self.args[1:] if self.op in WRITES_FIRST else self.args
+		regs = []
+		for arg in args:
+			if arg.startswith('$'):
+				regs.append(arg)
+			else:
+				m = MEMORY_RE.match(arg)
+				if m:
+					regs.append(m.group(1))
+		return tuple(regs)
+
+
+
+# Peephole rules #
+# Each rule gets a window of consecutive lines and returns the lines that
+# replace it, or None when it doesn't apply
+# A window never starts in a delay slot, so rules may add or remove lines
+
+# 'addi $sp, $sp, -4' + 'addi $sp, $sp, 4' -> nothing
+# 'addi $sp, $sp, -4' + 'addi $sp, $sp, -8' -> 'addi $sp, $sp, -12'
+def merge_addi(a, b):
+	if a.op == b.op == 'addi' and a.args[0] == a.args[1] == b.args[0] == b.args[1]:
+		try:
+			value = int(a.args[2], 0) + int(b.args[2], 0)
+		except ValueError:
+			return None
+		
+		if value == 0:
+			return []
+		if -0x8000 <= value <= 0x7fff:
+			return [Inst('addi', (a.args[0], a.args[0], str(value)))]
+
+
+# 'sw $t0, 4($sp)' + 'lw $t1, 4($sp)' -> 'sw $t0, 4($sp)' + 'add $t1, $zero, $t0'
+def store_reload(a, b):
+	if a.op == 'sw' and b.op == 'lw' and a.args[1] == b.args[1]:
+		if a.args[0] == b.args[0]:
+			return [a]
+		return [a, Inst('add', (b.args[0], '$zero', a.args[0]))]
+
+
+# 'li $v0, 0' + 'li $v0, 1' -> 'li $v0, 1'
+# The first value is never read
+def dead_write(a, b):
+	if a.op in PURE and b.is_code() and b.op not in BRANCHES:
+		reg = a.args[0]
+		if reg in b.defs() and reg not in b.uses():
+			return [b]
+
+
+# 'add $t0, $zero, $t0' -> nothing
+def self_move(a):
+	if a.op in ('add', 'addu', 'or', 'xor') and a.args[0] in a.args[1:] and '$zero' in a.args[1:]:
+		return []
+	if a.op in ('addi', 'addiu', 'ori', 'xori') and a.args[0] == a.args[1] and a.args[2] == '0':
+		return []
+	if a.op == 'move' and a.args[0] == a.args[1]:
+		return []
+
+
+# 'beq $zero, $zero, label' -> 'j label'
+def branch_always(a):
+	if a.op == 'beq' and a.args[0] == a.args[1] == '$zero':
+		return [Inst('j', (a.args[2],))]
+
+
+# 'j label' + 'nop' + 'label:' -> 'label:'
+# Jumping to the next line does nothing, the delay slot is kept if it's used
+def jump_next(a, b, c):
+	if a.op == 'j' and c.op == LABEL and a.args[0] == c.args[0] and b.is_code() and b.op not in BRANCHES:
+		return [c] if b.op == 'nop' else [b, c]
+
+
+# 'j label' + 'nop' + 'li $v0, 1' -> 'j label' + 'nop'
+# Nothing after a jump runs until the next label
+def unreachable(a, b, c):
+	if (a.op == 'j' or a.op == 'jr') and b.is_code() and b.op not in BRANCHES and c.is_code():
+		return [a, b]
+
+
+# 'li $v0, 1' + 'j label' + 'nop' -> 'j label' + 'li $v0, 1'
+# Moves the instruction before a jump into its empty delay slot
+def fill_jump(a, b, c):
+	if (b.op == 'j' or b.op == 'jr') and c.op == 'nop' and a.is_code() and a.op not in BRANCHES:
+		if a.is_wide():
+			return None
+		if b.op == 'jr' and b.args[0] in a.defs():
+			return None
+		return [b, a]
+
+
+
+# Available rules and their window size, applied in this order
+RULES = {
+	'merge_addi': (2, merge_addi),
+	'store_reload': (2, store_reload),
+	'dead_write': (2, dead_write),
+	'self_move': (1, self_move),
+	'branch_always': (1, branch_always),
+	'jump_next': (3, jump_next),
+	'unreachable': (3, unreachable),
+	'fill_jump': (3, fill_jump)
+}
+
+# Rules of the compiler's pipeline, the delay slots are left to the scheduler
+# ('fill_jump' is for the peephole optimizer used on its own)
+SCHEDULED = tuple(name for name in RULES if name != 'fill_jump')
+
+
+
+class Peephole:
+	# Initialize peephole optimizer #
+	# 'asm' is the output of a generator (lines of assembly, a line may hold
+	# several instructions), 'rules' the names of the rules to apply (all of
+	# them by default)
+	# 'out' is the optimized assembly and 'hits' how many times each rule applied
+	def __init__(self, code, asm, rules=None):
+		self.code = code
+		self.rules = [(name, *RULES[name]) for name in (RULES if rules is None else rules)]
+		self.hits = {name: 0 for name, size, rule in self.rules}
+		self.out = []
+		self(asm)
+	
+	
+	# Optimizes the assembly #
+	# The rules slide over the instructions until none of them applies
+	# The instructions already passed are kept in 'done' and the ones left
+	# in 'todo', reversed, so rewriting a window or stepping back only
+	# touches the ends of the lists
+	def __call__(self, asm):
+		insts = [Inst.parse(line) for line in '\n'.join(asm).split('\n')]
+		
+		changed = True
+		while changed:
+			changed = False
+			done = []
+			todo = insts[::-1]
+			while todo:
+				size = self.apply(done, todo)
+				if size is None:
+					done.append(todo.pop())
+				else:
+					# Step back, the change may complete an earlier window
+					changed = True
+					for _ in range(min(size, len(done))):
+						todo.append(done.pop())
+			insts = done
+		
+		self.out = [str(inst) for inst in insts]
+	
+	
+	# Applies the first matching rule to the window starting the 'todo' list #
+	# Returns its window size, or None if no rule applied
+	def apply(self, done, todo):
+		# Never start a window in a delay slot
+		if done and done[-1].op in BRANCHES:
+			return None
+		
+		for name, size, rule in self.rules:
+			if len(todo) < size:
+				continue
+			
+			new = rule(*todo[:-size - 1:-1])
+			if new is not None:
+				del todo[-size:]
+				todo += reversed(new)
+				self.hits[name] += 1
+				return size
+		
+		return None
@@ -0,0 +1,226 @@
+from lexer import Lexer
+from parser import Parser
+from folder import Folder
+from generator import Generator
+from generator_ir import Generator as IRGenerator
+from lowering import Lowering
+from peephole import Peephole, SCHEDULED
+from scheduler import Scheduler
+from nodes import Op, NAMES
+from errors import CompileError
+from profiler import count_ast, count_asm
+from contextlib import nullcontext
+
+
+# Stages that can be dumped, in pipeline order
+# 'ir' and 'lowering' only run in the 'ir' pipeline, 'generator' in 'direct'
+STAGES = ('source', 'lexer', 'parser', 'folder', 'ir', 'lowering', 'generator', 'peephole', 'scheduler')
+
+# Phase of a compilation without a profiler, the record is thrown away
+UNTIMED = lambda name: nullcontext({})
+
+
+
+# AST text #
+# The AST spitted by the parser, one node per line, children indented
+# between braces
+# Iterative, so deep expressions don't recurse
+def format_ast(node):
+	lines = []
+	work = [(node, 0)]
+	while work:
+		item, depth = work.pop()
+		
+		# Closing brace
+		if type(item) is str:
+			lines.append(item)
+			continue
+		
+		match item.op:
+			case Op.INTEGER:
+				text = f'integer {item.value}'
+			
+			case Op.FUNCTION:
+				text = f'function {item.name} {(item.x, item.y)}'
+			
+			case _:
+				text = NAMES[item.op]
+		
+		children = item.children()
+		if children:
+			lines.append('  '*depth + text + ' {')
+			work.append(('  '*depth + '}', depth))
+			work += ((child, depth+1) for child in reversed(children))
+		else:
+			lines.append('  '*depth + text)
+	
+	return '\n'.join(lines)
+
+
+
+# Result of a compilation #
+# 'asm' are the lines of assembly, 'tokens' the lexer output (None if the
+# lexer streamed its tokens to the parser, see 'compile_source'), 'ast' the
+# parser output (folded in place by the folder), 'ir' the IR lines (None
+# in the 'direct' pipeline), 'messages' the formatted warnings, 'hits' and
+# 'filled' what the peephole optimizer and the scheduler did, and 'dumps'
+# the text of each stage asked for, indexed by stage
+class Result:
+	__slots__ = ('asm', 'tokens', 'ast', 'ir', 'messages', 'hits', 'filled', 'dumps')
+	
+	def __init__(self, asm, tokens, ast, ir, messages, hits, filled, dumps):
+		self.asm = asm
+		self.tokens = tokens
+		self.ast = ast
+		self.ir = ir
+		self.messages = messages
+		self.hits = hits
+		self.filled = filled
+		self.dumps = dumps
+
+
+
+# Compiles source code #
+# Code generation pipeline:
+#   'direct': AST -> assembly
+#   'ir':     AST -> three-address IR -> assembly
+# Nothing is printed, warnings go to 'messages' of the Result and errors
+# raise CompileError (with the warnings before them)
+# 'dump' names the stages (see STAGES, or 'all') whose output is wanted in
+# 'dumps', the text of the other ones is never built
+# 'profile' is a Profiler, that gets a record of each phase (nothing is
+# counted or timed without one)
+# Without 'fold', constant folding is skipped and the generators get every
+# operator (the only way to see their code, as all values are constant)
+# With an 'executor' (a process or thread pool), the functions are generated
+# by its workers, the output is the same
+# 'fname' is the name of the source file, for the messages
+# The lexer streams its tokens to the parser, unless they are kept for
+# 'tokens' of the Result (with 'tokens'), dumped or counted by 'profile'
+def compile_source(code, *, pipeline='direct', dump=(), profile=None, fold=True, executor=None, fname='<source>', tokens=False):
+	if pipeline not in ('direct', 'ir'):
+		raise ValueError(f"Unknown pipeline '{pipeline}'")
+	
+	dump = set(STAGES if dump == 'all' else dump)
+	unknown = dump.difference(STAGES)
+	if unknown:
+		raise ValueError(f"Unknown stage '{unknown.pop()}'")
+	
+	dumps = {}
+	messages = []
+	
+	# Without a profiler, the phases only go through an empty 'with'
+	phase = UNTIMED if profile is None else profile.phase
+	
+	try:
+		if 'source' in dump:
+			dumps['source'] = code.replace('\t', '  ')
+		
+		# Token broker
+		stream = not tokens and 'lexer' not in dump and profile is None
+		if stream:
+			lexer = Lexer(code, stream=True)
+		else:
+			with phase('lexer') as record:
+				lexer = Lexer(code)
+			if profile is not None:
+				record['tokens'] = len(lexer.out)
+				profile.add(record)
+			messages += lexer.messages
+			if 'lexer' in dump:
+				dumps['lexer'] = '\n'.join(str(tok) for tok in lexer.out)
+		
+		# AST synthesizer
+		with phase('parser') as record:
+			try:
+				parser = Parser(code, lexer if stream else lexer.out, fname)
+			
+			# Streaming, the lexer warnings so far come before a parser error
+			# (a lexer error already holds them)
+			except CompileError as e:
+				if stream and not (lexer.messages and e.messages[-1] is lexer.messages[-1]):
+					e.messages[:0] = lexer.messages
+				raise
+		if profile is not None:
+			record['nodes'], record['depth'] = count_ast(parser.out)
+			profile.add(record)
+		if stream:
+			messages += lexer.messages
+		messages += parser.messages
+		if 'parser' in dump:
+			dumps['parser'] = format_ast(parser.out)
+		
+		# Constant folding
+		ast = parser.out
+		if fold:
+			with phase('folder') as record:
+				folder = Folder(code, parser.out)
+			ast = folder.out
+			if profile is not None:
+				record['folded'] = folder.folded
+				record['nodes'], record['depth'] = count_ast(ast)
+				profile.add(record)
+			if 'folder' in dump:
+				dumps['folder'] = format_ast(ast)
+		
+		# Assembly generator
+		ir = None
+		if pipeline == 'ir':
+			with phase('generator_ir') as record:
+				generator = IRGenerator(code, ast, executor)
+			if profile is not None:
+				record['instructions'] = len(generator.mirror)
+				record['labels'] = sum(1 for inst in generator.mirror if len(inst) == 1)
+				profile.add(record)
+			messages += generator.messages
+			ir = generator.out
+			if 'ir' in dump:
+				dumps['ir'] = '\n'.join(ir)
+			
+			with phase('lowering') as record:
+				generator = Lowering(code, generator.mirror)
+			if profile is not None:
+				record['instructions'], record['labels'] = count_asm(generator.out)
+				profile.add(record)
+			messages += generator.messages
+			if 'lowering' in dump:
+				dumps['lowering'] = '\n'.join(generator.out)
+		
+		else:
+			with phase('generator') as record:
+				generator = Generator(code, ast, executor)
+			if profile is not None:
+				record['instructions'], record['labels'] = count_asm(generator.out)
+				profile.add(record)
+			messages += generator.messages
+			if 'generator' in dump:
+				dumps['generator'] = '\n'.join(generator.out)
+	
+	# Warnings of the phases that finished come first
+	except CompileError as e:
+		e.messages[:0] = messages
+		raise
+	
+	# Peephole optimization
+	with phase('peephole') as record:
+		peephole = Peephole(code, generator.out, SCHEDULED)
+	if profile is not None:
+		record['instructions'], record['labels'] = count_asm(peephole.out)
+		record['hits'] = sum(peephole.hits.values())
+		profile.add(record)
+	if 'peephole' in dump:
+		dumps['peephole'] = '\n'.join(f'{rule}: {hits}' for rule, hits in peephole.hits.items())
+	
+	# Delay slot scheduling
+	with phase('scheduler') as record:
+		scheduler = Scheduler(code, peephole.out)
+	if profile is not None:
+		record['instructions'], record['labels'] = count_asm(scheduler.out)
+		record['filled'] = scheduler.filled['before'] + scheduler.filled['target']
+		profile.add(record)
+	if 'scheduler' in dump:
+		filled = '\n'.join(f'{source}: {slots}' for source, slots in scheduler.filled.items())
+		dumps['scheduler'] = filled + '\n\n' + '\n'.join(scheduler.out)
+	
+	return Result(scheduler.out, None if stream else lexer.out, ast, ir, messages,
+	              peephole.hits, scheduler.filled, dumps)
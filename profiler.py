@@ -0,0 +1,96 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Profiler #
+# Records how each phase of a compilation went: wall and CPU time, and
+# what the pipeline adds to the record (token and node counts, AST depth,
+# instructions and labels emitted...)
+# Each record is a dict, kept in 'records' and given to 'callback' (if any)
+# once it's complete (see 'add')
+# With 'memory', the peak of memory allocated by each phase is measured too
+# (with tracemalloc, which slows everything down)
+class Profiler:
+	def __init__(self, callback=None, memory=False):
+		self.callback = callback
+		self.memory = memory
+		self.records = []
+	
+	
+	# Measures a phase #
+	# The record is given to the block, the counts are added to it after the
+	# phase (so counting isn't timed), then it's handed back to 'add'
+	@contextmanager
+	def phase(self, name):
+		record = {'phase': name}
+		
+		started = False
+		if self.memory:
+			if not tracemalloc.is_tracing():
+				tracemalloc.start()
+				started = True
+			tracemalloc.reset_peak()
+			base = tracemalloc.get_traced_memory()[0]
+		
+		wall = time.perf_counter()
+		cpu = time.process_time()
+		try:
+			yield record
+		
+		finally:
+			record['wall'] = time.perf_counter() - wall
+			record['cpu'] = time.process_time() - cpu
+			
+			if self.memory:
+				record['memory'] = tracemalloc.get_traced_memory()[1] - base
+				if started:
+					tracemalloc.stop()
+	
+	
+	# Keeps a complete record #
+	def add(self, record):
+		self.records.append(record)
+		if self.callback is not None:
+			self.callback(record)
+	
+	
+	# Report of every phase, with the totals #
+	# Made of plain lists, dicts and numbers, so it can go straight to JSON
+	def report(self):
+		return {
+			'phases': self.records,
+			'wall': sum(record['wall'] for record in self.records),
+			'cpu': sum(record['cpu'] for record in self.records)
+		}
+
+
+
+# Nodes and depth of an AST #
+# Iterative, so deep expressions don't recurse
+def count_ast(root):
+	nodes = depth = 0
+	work = [(root, 1)]
+	while work:
+		node, level = work.pop()
+		nodes += 1
+		depth = max(depth, level)
+		work += ((child, level + 1) for child in node.children())
+	
+	return nodes, depth
+
+
+# Instructions and labels of some assembly #
+# A line may hold several instructions
+def count_asm(asm):
+	instructions = labels = 0
+	for line in '\n'.join(asm).split('\n'):
+		text = line.strip()
+		if not text or text.startswith('.'):
+			continue
+		if text.endswith(':'):
+			labels += 1
+		else:
+			instructions += 1
+	
+	return instructions, labels
@@ -0,0 +1,206 @@
+import os
+import sys
+import glob
+import json
+import random
+import argparse
+from pipeline import compile_source
+from profiler import count_asm
+from simulator import Simulator
+from errors import CompileError, SimulationError
+
+
+# Metrics of each program, lower is better
+METRICS = ('instructions', 'labels', 'stack', 'executed', 'cycles')
+
+PIPELINES = ('direct', 'ir')
+
+# Operators of the synthetic expressions
+OPERATORS = ('+', '-', '*', '/', '%', '<<', '>>', '&', '|', '^', '==', '!=', '<', '>', '<=', '>=')
+
+
+
+# Synthetic programs #
+# Each one returns the source code, the same every time (their numbers come
+# from a seeded generator)
+
+# Complete binary tree of 4096 operands, needs more registers than there are
+def balanced():
+	rand = random.Random(1)
+	def tree(depth):
+		if not depth:
+			return str(rand.randint(1, 100))
+		return f'({tree(depth - 1)} {rand.choice(OPERATORS[:3])} {tree(depth - 1)})'
+	
+	return f'int main() {{\n\treturn {tree(12)};\n}}\n'
+
+
+# One expression of 2000 operands and every operator
+def long_expression():
+	rand = random.Random(2)
+	terms = [str(rand.randint(1, 1000))]
+	for _ in range(1999):
+		terms.append(rand.choice(OPERATORS))
+		terms.append(str(rand.randint(1, 1000)))
+	
+	return 'int main() {\n\treturn ' + ' '.join(terms) + ';\n}\n'
+
+
+# Multiplications, divisions and modulos by constants (strength reduction)
+def constants():
+	rand = random.Random(3)
+	factors = (2, 3, 5, 7, 10, 16, 100, 255, 1000, 65536, -4, -9)
+	terms = (f'({rand.randint(-50000, 50000)} {rand.choice("*/%")} {rand.choice(factors)})' for _ in range(500))
+	return 'int main() {\n\treturn ' + ' + '.join(terms) + ';\n}\n'
+
+
+# Comparisons and logical not, the branchy part of the generators
+def comparisons():
+	rand = random.Random(4)
+	terms = (f'!({rand.randint(0, 20)} {rand.choice(OPERATORS[10:])} {rand.randint(0, 20)})' for _ in range(500))
+	return 'int main() {\n\treturn ' + ' + '.join(terms) + ';\n}\n'
+
+
+PROGRAMS = {
+	'balanced': balanced,
+	'long': long_expression,
+	'constants': constants,
+	'comparisons': comparisons
+}
+
+
+
+# Metrics of a program #
+# Compiled without folding, or there would be nothing left to measure
+# Returns the metrics, and whether '$v0' matched the folded program's one
+def measure(code, pipeline):
+	asm = compile_source(code, pipeline=pipeline, fold=False).asm
+	run = Simulator(asm).out
+	expected = Simulator(compile_source(code, pipeline=pipeline).asm).out['v0']
+	
+	instructions, labels = count_asm(asm)
+	metrics = {
+		'instructions': instructions,
+		'labels': labels,
+		'stack': run['stack'],
+		'executed': run['instructions'],
+		'cycles': run['cycles']
+	}
+	return metrics, run['v0'] == expected
+
+
+
+# Runs the benchmarks #
+# Returns the results, indexed by '<pipeline>/<program>' (the corpus
+# programs by their path), and the keys of the ones that computed a wrong
+# value or failed
+def run(programs, pipelines, corpus='C', log=print):
+	codes = {}
+	if 'corpus' in programs:
+		for fname in sorted(glob.glob(os.path.join(corpus, '**', '*.c'), recursive=True)):
+			with open(fname) as file:
+				codes[os.path.relpath(fname, corpus)] = file.read()
+	
+	for name, make in PROGRAMS.items():
+		if name in programs:
+			codes[name] = make()
+	
+	results = {}
+	wrong = []
+	for pipeline in pipelines:
+		for name, code in codes.items():
+			key = f'{pipeline}/{name}'
+			try:
+				results[key], right = measure(code, pipeline)
+			except (CompileError, SimulationError) as e:
+				log(f'{key:<40}FAILED: {e}')
+				wrong.append(key)
+				continue
+			
+			if not right:
+				wrong.append(key)
+			log(row(key, results[key]))
+		
+		total = {metric: sum(results[key][metric] for key in results if key.startswith(pipeline + '/'))
+		         for metric in METRICS}
+		results[f'{pipeline}/total'] = total
+		log(row(f'{pipeline}/total', total))
+	
+	return results, wrong
+
+
+# Table row #
+def row(name, metrics):
+	return f'{name:<40}' + ''.join(f'{metrics[metric]:>14}' for metric in METRICS)
+
+
+def header():
+	return ' '*40 + ''.join(f'{metric:>14}' for metric in METRICS)
+
+
+
+# Metrics worse than the baseline #
+# Returns '(key, metric, old, new)' for the ones over 'threshold' times the
+# baseline (a metric that was zero regresses as soon as it isn't)
+def regressions(results, baseline, threshold):
+	flagged = []
+	for key, metrics in results.items():
+		for metric, new in metrics.items():
+			old = baseline.get(key, {}).get(metric)
+			if old is None:
+				continue
+			if new > old * threshold if old else new > 0:
+				flagged.append((key, metric, old, new))
+	
+	return flagged
+
+
+
+# Command line entry point #
+# Returns the exit status, 1 if anything was flagged or computed wrong
+def main(argv=None):
+	args = argparse.ArgumentParser(description='Measures the size and speed of the generated assembly.')
+	args.add_argument('-w', '--programs', default=','.join(('corpus', *PROGRAMS)),
+	                  help=f"comma separated (default: corpus,{','.join(PROGRAMS)})")
+	args.add_argument('-p', '--pipelines', default=','.join(PIPELINES),
+	                  help=f"comma separated (default: {','.join(PIPELINES)})")
+	args.add_argument('-o', '--output', metavar='FILE', help='save the results as JSON')
+	args.add_argument('-c', '--compare', metavar='FILE', help='compare with the results saved in FILE')
+	args.add_argument('-t', '--threshold', type=float, default=1.0,
+	                  help='growth over the baseline that counts as a regression (default: 1.0, any growth)')
+	args = args.parse_args(argv)
+	
+	print(header())
+	results, wrong = run(set(args.programs.split(',')), args.pipelines.split(','))
+	
+	if args.output:
+		with open(args.output, 'w') as file:
+			json.dump({'results': results}, file, indent='\t')
+	
+	status = 0
+	if wrong:
+		status = 1
+		print()
+		print('Wrong results:')
+		for key in wrong:
+			print(f'  {key}')
+	
+	if args.compare:
+		with open(args.compare) as file:
+			baseline = json.load(file)['results']
+		
+		flagged = regressions(results, baseline, args.threshold)
+		print()
+		if flagged:
+			status = 1
+			print(f'Regressions over {args.threshold}x the baseline:')
+			for key, metric, old, new in flagged:
+				print(f'  {key} {metric}: {old} -> {new}')
+		else:
+			print('No regressions over the baseline')
+	
+	return status
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,177 @@
+from peephole import Inst, LABEL, PURE, BRANCHES
+
+
+# Branches with a label target, and the ones that always jump
+TARGETED = frozenset(('beq', 'bne', 'blez', 'bgtz', 'bltz', 'bgez', 'j'))
+ALWAYS = frozenset(('j',))
+
+# Instructions that can be moved around, as long as their registers allow it
+MOVABLE = PURE | {'lw', 'sw', 'mult', 'multu', 'div', 'divu'}
+
+# How far back from a branch an instruction is looked for
+WINDOW = 8
+
+
+
+# Registers read by an instruction, memory and 'hi'/'lo' included #
+def reads(inst):
+	regs = set(inst.uses())
+	if inst.op == 'lw':
+		regs.add('memory')
+	elif inst.op in ('mflo', 'mfhi'):
+		regs.add('hilo')
+	return regs
+
+
+# Registers written by an instruction, memory and 'hi'/'lo' included #
+def writes(inst):
+	regs = set(inst.defs())
+	if inst.op == 'sw':
+		regs.add('memory')
+	elif inst.op in ('mult', 'multu', 'div', 'divu'):
+		regs.add('hilo')
+	return regs
+
+
+# Can go in a delay slot #
+def single(inst):
+	return inst.op in MOVABLE and not inst.is_wide()
+
+
+
+class Scheduler:
+	# Initialize delay slot scheduler #
+	# Fills the 'nop' after each branch or jump of 'asm' (lines of assembly)
+	# 'out' is the scheduled assembly and 'filled' how each slot was handled
+	def __init__(self, code, asm):
+		self.code = code
+		self.filled = {
+			'before': 0,  # An instruction from before the branch
+			'target': 0,  # The first instruction of the target
+			'nop': 0  # Nothing qualified
+		}
+		self.out = []
+		self(asm)
+	
+	
+	# Schedules the assembly #
+	def __call__(self, asm):
+		insts = [Inst.parse(line) for line in '\n'.join(asm).split('\n')]
+		insts = self.fill_before(insts)
+		insts = self.fill_target(insts)
+		self.filled['nop'] = sum(1 for idx, inst in enumerate(insts[:-1])
+		                         if inst.op in BRANCHES and insts[idx + 1].op == 'nop')
+		self.out = [str(inst) for inst in insts]
+	
+	
+	# Moves an instruction from before each branch into its delay slot #
+	# Going from the end, the instruction moved leaves a hole (None) that the
+	# loop steps over when it gets there, and the holes are dropped at the end
+	def fill_before(self, insts):
+		for idx in range(len(insts) - 2, -1, -1):
+			branch = insts[idx]
+			if branch is None:
+				continue
+			if branch.op not in BRANCHES or insts[idx + 1].op != 'nop':
+				continue
+			
+			source = self.find_before(insts, idx)
+			if source is not None:
+				insts[idx + 1] = insts[source]
+				insts[source] = None
+				self.filled['before'] += 1
+		
+		return [inst for inst in insts if inst is not None]
+	
+	
+	# Instruction before the branch at 'idx' that can go in its delay slot #
+	# It must be in the same basic block, and swapping it with the ones it
+	# passes (and the branch) can't change what any of them reads or writes
+	def find_before(self, insts, idx):
+		branch = insts[idx]
+		passed_reads = reads(branch)
+		passed_writes = writes(branch)
+		
+		for source in range(idx - 1, max(idx - WINDOW, 0) - 1, -1):
+			inst = insts[source]
+			
+			# Start of the basic block (a label, a directive, a branch or its slot)
+			if not inst.is_code() or inst.op in BRANCHES:
+				return None
+			if source and insts[source - 1].op in BRANCHES:
+				return None
+			
+			inst_reads = reads(inst)
+			inst_writes = writes(inst)
+			if single(inst) and not inst_writes & (passed_reads | passed_writes) and not inst_reads & passed_writes:
+				return source
+			
+			passed_reads |= inst_reads
+			passed_writes |= inst_writes
+		
+		return None
+	
+	
+	# Copies the first instruction of the target into the delay slot #
+	# The branch then goes to a new label right after that instruction
+	# For conditional branches, the copy also runs when the branch is not
+	# taken, so it must write a register the next instruction overwrites
+	def fill_target(self, insts):
+		labels = {inst.args[0]: idx for idx, inst in enumerate(insts) if inst.op == LABEL}
+		after = {}  # Target label -> index of the instruction copied from it
+		slots = {}  # Delay slot index -> instruction copied into it
+		
+		for idx, branch in enumerate(insts[:-1]):
+			if branch.op not in TARGETED or insts[idx + 1].op != 'nop':
+				continue
+			
+			target = branch.args[-1]
+			first = self.first_code(insts, labels.get(target))
+			if first is None:
+				continue
+			
+			inst = insts[first]
+			if not single(inst) or inst.op not in PURE:
+				continue
+			
+			# Not taken, the copy must be dead
+			if branch.op not in ALWAYS:
+				following = self.first_code(insts, idx + 1)
+				if following is None or following == first:
+					continue
+				
+				written = writes(inst)
+				if not written <= writes(insts[following]) or written & reads(insts[following]):
+					continue
+			
+			after[target] = first
+			slots[idx + 1] = inst
+			insts[idx] = Inst(branch.op, branch.args[:-1] + (f'{target}_slot',))
+		
+		# New labels go right after the copied instructions
+		labels = {}
+		for target, first in after.items():
+			labels.setdefault(first, []).append(Inst(LABEL, (f'{target}_slot',)))
+		
+		out = []
+		for idx, inst in enumerate(insts):
+			out.append(slots.get(idx, inst))
+			out += labels.get(idx, ())
+		
+		self.filled['target'] = len(slots)
+		return out
+	
+	
+	# Index of the first instruction after 'idx' (a label), skipping labels #
+	# None if there is none, or it's a branch
+	def first_code(self, insts, idx):
+		if idx is None:
+			return None
+		
+		idx += 1
+		while idx < len(insts) and insts[idx].op == LABEL:
+			idx += 1
+		
+		if idx == len(insts) or not insts[idx].is_code() or insts[idx].op in BRANCHES:
+			return None
+		return idx
@@ -0,0 +1,290 @@
+from nodes import Op, UNARY_OPS
+from folder import wrap
+from strength import sequence, load
+
+
+# Operand kinds #
+# 'reg' is an operand computed into a register, the others are integer
+# constants that fit in an instruction: kind -> (fits, immediate text)
+KINDS = {
+	'zero': (lambda v: v == 0, lambda v: '$zero'),  # Read from '$zero'
+	'imm16': (lambda v: -0x8000 <= v <= 0x7fff, lambda v: v),  # Signed 16 bits
+	'uimm16': (lambda v: 0 <= v <= 0xffff, lambda v: v),  # Unsigned 16 bits
+	'neg16': (lambda v: -0x8000 <= -v <= 0x7fff, lambda v: -v),  # Negated (x - 5 -> x + -5)
+	'inc16': (lambda v: -0x8000 <= v + 1 <= 0x7fff, lambda v: v + 1),  # Plus one (x <= 5 -> x < 6)
+	'shamt': (lambda v: True, lambda v: v & 31),  # Shift amount, only 5 bits
+	'const': (lambda v: True, lambda v: v)  # Any, for strength reduction
+}
+
+# Cycles of the slow instructions, the others take one
+CYCLES = {
+	'mult': 5,
+	'multu': 5,
+	'div': 37,
+	'divu': 37
+}
+
+
+# Strength reduction patterns, the template depends on the constant #
+def reduce_mult(value):
+	return sequence(Op.MULT, value)
+
+
+# The sequences read the other operand from '{a}', here it's '{b}'
+def reduce_mult_left(value):
+	reduced = sequence(Op.MULT, value)
+	return reduced and (reduced[0].replace('{a}', '{b}'), reduced[1])
+
+
+def reduce_div(value):
+	return sequence(Op.DIV, value)
+
+
+def reduce_mod(value):
+	return sequence(Op.MOD, value)
+
+
+# Instruction patterns, indexed by opcode #
+# Each pattern is (operand kinds, template), '{d}' is the destination and
+# '{a}', '{b}' the operands (registers or immediates)
+# A template may also be a function of the constant operand, that returns
+# '(template, scratch registers)' or None, scratch registers are '{t}', '{u}'
+# The cheapest pattern that matches is used, ties go to the first one
+PATTERNS = {
+	# Positive (5 -> 5) (It sort of does nothing ¯⁠\⁠_⁠(⁠ツ⁠)⁠_⁠/⁠¯ )
+	Op.PLUS: (
+		(('reg',), ''),
+	),
+	
+	# Negative (5 -> -5)
+	Op.MINUS: (
+		(('reg',), '\tsub {d}, $zero, {a}'),
+	),
+	
+	# Bitflip (11000011 -> 00111100)
+	Op.BITFLIP: (
+		(('reg',), '\tnor {d}, $zero, {a}'),
+	),
+	
+	# Not (5 -> 0, 0 -> 1)
+	Op.NOT: (
+		(('reg',), '\tsltiu {d}, {a}, 1'),
+	),
+	
+	# Multiply (5 * 2 -> 10)
+	Op.MULT: (
+		(('reg', 'const'), reduce_mult),
+		(('const', 'reg'), reduce_mult_left),
+		(('reg', 'reg'), '\tmult {a}, {b}\n\tmflo {d}')
+	),
+	
+	# Divide (5 / 2 -> 2)
+	Op.DIV: (
+		(('reg', 'const'), reduce_div),
+		(('reg', 'reg'), '\tdiv {a}, {b}\n\tmflo {d}')
+	),
+	
+	# Modulo (5 % 2 -> 1)
+	Op.MOD: (
+		(('reg', 'const'), reduce_mod),
+		(('reg', 'reg'), '\tdiv {a}, {b}\n\tmfhi {d}')
+	),
+	
+	# Addition (5 + 2 -> 7)
+	Op.ADD: (
+		(('reg', 'imm16'), '\taddi {d}, {a}, {b}'),
+		(('imm16', 'reg'), '\taddi {d}, {b}, {a}'),
+		(('reg', 'reg'), '\tadd {d}, {a}, {b}')
+	),
+	
+	# Subtraction (5 - 2 -> 3)
+	Op.SUB: (
+		(('reg', 'neg16'), '\taddi {d}, {a}, {b}'),
+		(('reg', 'reg'), '\tsub {d}, {a}, {b}')
+	),
+	
+	# Right shift (5 >> 2 -> 1)
+	Op.RSHIFT: (
+		(('reg', 'shamt'), '\tsra {d}, {a}, {b}'),
+		(('reg', 'reg'), '\tsrav {d}, {a}, {b}')
+	),
+	
+	# Left shift (5 << 2 -> 20)
+	Op.LSHIFT: (
+		(('reg', 'shamt'), '\tsll {d}, {a}, {b}'),
+		(('reg', 'reg'), '\tsllv {d}, {a}, {b}')
+	),
+	
+	# Bitwise AND (0b101 & 0b011 -> 0b001)
+	Op.AND: (
+		(('reg', 'uimm16'), '\tandi {d}, {a}, {b}'),
+		(('uimm16', 'reg'), '\tandi {d}, {b}, {a}'),
+		(('reg', 'reg'), '\tand {d}, {a}, {b}')
+	),
+	
+	# Bitwise OR (0b101 | 0b011 -> 0b111)
+	Op.OR: (
+		(('reg', 'uimm16'), '\tori {d}, {a}, {b}'),
+		(('uimm16', 'reg'), '\tori {d}, {b}, {a}'),
+		(('reg', 'reg'), '\tor {d}, {a}, {b}')
+	),
+	
+	# Bitwise XOR (0b101 ^ 0b011 -> 0b110)
+	Op.XOR: (
+		(('reg', 'uimm16'), '\txori {d}, {a}, {b}'),
+		(('uimm16', 'reg'), '\txori {d}, {b}, {a}'),
+		(('reg', 'reg'), '\txor {d}, {a}, {b}')
+	),
+	
+	# Comparisons are straight-line, without branches or labels
+	# 'slt' compares as signed, so they can't overflow like a subtraction
+	
+	# Equals (5 == 2 -> 0)
+	Op.EQUALS: (
+		(('reg', 'zero'), '\tsltiu {d}, {a}, 1'),
+		(('zero', 'reg'), '\tsltiu {d}, {b}, 1'),
+		(('reg', 'uimm16'), '\txori {d}, {a}, {b}\n\tsltiu {d}, {d}, 1'),
+		(('uimm16', 'reg'), '\txori {d}, {b}, {a}\n\tsltiu {d}, {d}, 1'),
+		(('reg', 'neg16'), '\taddiu {d}, {a}, {b}\n\tsltiu {d}, {d}, 1'),
+		(('reg', 'reg'), '\txor {d}, {a}, {b}\n\tsltiu {d}, {d}, 1')
+	),
+	
+	# Different (5 != 2 -> 1)
+	Op.DIFF: (
+		(('reg', 'zero'), '\tsltu {d}, $zero, {a}'),
+		(('zero', 'reg'), '\tsltu {d}, $zero, {b}'),
+		(('reg', 'uimm16'), '\txori {d}, {a}, {b}\n\tsltu {d}, $zero, {d}'),
+		(('uimm16', 'reg'), '\txori {d}, {b}, {a}\n\tsltu {d}, $zero, {d}'),
+		(('reg', 'neg16'), '\taddiu {d}, {a}, {b}\n\tsltu {d}, $zero, {d}'),
+		(('reg', 'reg'), '\txor {d}, {a}, {b}\n\tsltu {d}, $zero, {d}')
+	),
+	
+	# Greater (5 > 2 -> 1)
+	Op.GREATER: (
+		(('imm16', 'reg'), '\tslti {d}, {b}, {a}'),
+		(('reg', 'inc16'), '\tslti {d}, {a}, {b}\n\txori {d}, {d}, 1'),
+		(('reg', 'reg'), '\tslt {d}, {b}, {a}')
+	),
+	
+	# Less (5 < 2 -> 0)
+	Op.LESS: (
+		(('reg', 'imm16'), '\tslti {d}, {a}, {b}'),
+		(('inc16', 'reg'), '\tslti {d}, {b}, {a}\n\txori {d}, {d}, 1'),
+		(('reg', 'reg'), '\tslt {d}, {a}, {b}')
+	),
+	
+	# Greater Equals (5 >= 2 -> 1)
+	Op.GREATER_EQ: (
+		(('inc16', 'reg'), '\tslti {d}, {b}, {a}'),
+		(('reg', 'imm16'), '\tslti {d}, {a}, {b}\n\txori {d}, {d}, 1'),
+		(('reg', 'reg'), '\tslt {d}, {a}, {b}\n\txori {d}, {d}, 1')
+	),
+	
+	# Less Equals (5 <= 2 -> 0)
+	Op.LESS_EQ: (
+		(('reg', 'inc16'), '\tslti {d}, {a}, {b}'),
+		(('imm16', 'reg'), '\tslti {d}, {b}, {a}\n\txori {d}, {d}, 1'),
+		(('reg', 'reg'), '\tslt {d}, {b}, {a}\n\txori {d}, {d}, 1')
+	)
+}
+
+# Register-register templates of the binary operators, indexed by opcode
+# Every binary operator has one, so they can always be used
+BINARY = {op: template for op, patterns in PATTERNS.items()
+          for kinds, template in patterns if kinds == ('reg', 'reg')}
+
+
+
+# Cost of a template, in cycles #
+def cost(template):
+	return sum(CYCLES.get(line.split()[0], 1) for line in template.split('\n') if line.strip())
+
+
+# Pattern that matches a node, with its template #
+# The template is None when the kinds of the operands don't match
+def match(node, kinds, template):
+	children = node.children()
+	value = None
+	for child, kind in zip(children, kinds):
+		if kind == 'reg':
+			continue
+		if child.op != Op.INTEGER or not KINDS[kind][0](wrap(child.value)):
+			return None, None
+		value = wrap(child.value)
+	
+	if callable(template):
+		return template(value) or (None, None)
+	return template, 0
+
+
+
+# Tile #
+# The pattern chosen for a node: its operand kinds, template, scratch
+# registers, total cost (with the operands), and registers needed to
+# evaluate it (Sethi-Ullman number)
+class Tile:
+	__slots__ = ('kinds', 'template', 'scratch', 'cost', 'need')
+	
+	def __init__(self, kinds, template, scratch, cost, need):
+		self.kinds = kinds
+		self.template = template
+		self.scratch = scratch
+		self.cost = cost
+		self.need = need
+	
+	
+	# Text of the operands, registers for 'reg' ones #
+	def operands(self, node, regs):
+		regs = iter(regs)
+		return [next(regs) if kind == 'reg' else KINDS[kind][1](wrap(child.value))
+		        for child, kind in zip(node.children(), self.kinds)]
+
+
+
+# Tiles an expression tree #
+# Returns the cheapest Tile of each node, by 'id(node)'
+# Post-order walk with an explicit stack, so deep expressions don't recurse
+def select(root):
+	tiles = {}
+	work = [(root, False)]
+	while work:
+		node, ready = work.pop()
+		if node.op == Op.INTEGER:
+			template = load(node.value)
+			tiles[id(node)] = Tile((), template, 0, cost(template), 1)
+		
+		elif not ready:
+			work.append((node, True))
+			work += ((child, False) for child in node.children())
+		
+		else:
+			tiles[id(node)] = best(node, tiles)
+	
+	return tiles
+
+
+# Cheapest pattern of a node, its operands are already tiled #
+def best(node, tiles, patterns=None):
+	found = None
+	for kinds, template in patterns or PATTERNS[node.op]:
+		template, scratch = match(node, kinds, template)
+		if template is None:
+			continue
+		
+		regs = [tiles[id(child)] for child, kind in zip(node.children(), kinds) if kind == 'reg']
+		total = cost(template) + sum(child.cost for child in regs)
+		if found is None or total < found.cost:
+			if len(regs) == 2:
+				a, b = regs[0].need, regs[1].need
+				need = a + 1 if a == b else max(a, b)
+			else:
+				need = max([child.need for child in regs] + [1 + scratch])
+			found = Tile(kinds, template, scratch, total, need)
+	
+	return found
+
+
+# Register-register tile of a node, when there is no room for another one #
+def fallback(node, tiles):
+	kinds = ('reg',) if node.op in UNARY_OPS else ('reg', 'reg')
+	return best(node, tiles, [(kinds, BINARY.get(node.op) or PATTERNS[node.op][0][1])])
@@ -0,0 +1,172 @@
+import io
+import os
+import json
+import asyncio
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from client import SOCKET
+from compiler import arguments, prepare, compile_job, report, summary, write_profile, link
+from errors import LinkError, AssemblyError
+
+
+# Longest request accepted, in bytes (asyncio's default of 64 KiB is a few
+# thousand file names)
+MAX_REQUEST = 64 * 2**20
+
+
+
+class Server:
+	# Initialize compile server #
+	# Compiles the requests of 'client.py' with a pool of 'workers' processes,
+	# that keep the compiler loaded between requests
+	# Requests are served concurrently, sharing the pool
+	def __init__(self, path=SOCKET, workers=None):
+		self.path = path
+		self.executor = ProcessPoolExecutor(max_workers=workers)
+	
+	
+	# Serves until interrupted #
+	async def __call__(self):
+		# A socket left behind by a server that didn't stop cleanly
+		with contextlib.suppress(FileNotFoundError):
+			os.unlink(self.path)
+		
+		server = await asyncio.start_unix_server(self.handle, self.path, limit=MAX_REQUEST)
+		try:
+			async with server:
+				await server.serve_forever()
+		finally:
+			with contextlib.suppress(FileNotFoundError):
+				os.unlink(self.path)
+			self.executor.shutdown(cancel_futures=True)
+	
+	
+	# Serves a connection, one request #
+	async def handle(self, reader, writer):
+		try:
+			try:
+				argv, cwd = self.request(await reader.readline())
+			
+			# Too long, or not a request, the client is told why
+			except (ValueError, TypeError) as e:
+				await self.send(writer, out=f'Bad request to the compile server: {e}\n')
+				await self.send(writer, status=2)
+				return
+			
+			status = await self.compile(argv, cwd, writer)
+			await self.send(writer, status=status)
+		
+		# The client went away
+		except ConnectionError:
+			pass
+		
+		finally:
+			writer.close()
+	
+	
+	# Arguments and folder of a request line #
+	def request(self, line):
+		if not line:
+			raise ValueError('empty request')
+		
+		request = json.loads(line)
+		if type(request) is not dict or 'argv' not in request or 'cwd' not in request:
+			raise ValueError("expected 'argv' and 'cwd'")
+		
+		argv, cwd = request['argv'], request['cwd']
+		if type(argv) is not list or not all(type(arg) is str for arg in argv) or type(cwd) is not str:
+			raise TypeError("'argv' must be a list of strings and 'cwd' a string")
+		return argv, cwd
+	
+	
+	# Compiles a request, sending the output back as it's produced #
+	# Returns the exit status, like 'compiler.main'
+	async def compile(self, argv, cwd, writer):
+		# Bad arguments and '--help' print and exit
+		out = io.StringIO()
+		try:
+			with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+				args = arguments('client.py').parse_args(argv)
+		except SystemExit as e:
+			await self.send(writer, out=out.getvalue())
+			return e.code
+		
+		# Globbing the sources and creating the cache folder, like any file
+		# access, happens off the event loop so other clients go on
+		loop = asyncio.get_running_loop()
+		jobs, cache = await loop.run_in_executor(None, prepare, args, cwd)
+		if not jobs:
+			await self.send(writer, out='No source files found\n')
+			return 1
+		
+		# The files already go to the pool, their functions are not split further
+		if args.function_jobs > 1:
+			await self.send(writer, out='Ignoring --function-jobs, the server compiles the files with its own workers\n')
+		
+		# Every file is sent to the pool at once, the results are sent back
+		# in order, like the command line does
+		results = [loop.run_in_executor(self.executor, compile_job, job) for job in jobs]
+		
+		failed = hits = 0
+		profiles = {}
+		try:
+			for result in results:
+				fname, output, error, log, cached, profile = await result
+				hits += cached
+				failed += error is not None
+				
+				# Names relative to the client, like it gave them
+				if fname.startswith(os.path.join(cwd, '')):
+					fname = fname[len(os.path.join(cwd, '')):]
+				
+				text = report(fname, error, log)
+				if text:
+					await self.send(writer, out=text)
+				if profile is not None:
+					profiles[fname] = profile
+		
+		# Files of a client that went away are not compiled
+		except ConnectionError:
+			for result in results:
+				result.cancel()
+			raise
+		
+		if cache is not None:
+			await loop.run_in_executor(None, cache.trim)
+		if args.profile:
+			await loop.run_in_executor(None, write_profile, os.path.join(cwd, args.profile), profiles)
+		await self.send(writer, out=summary(len(jobs), failed, hits, cache, args.link) + '\n')
+		if failed:
+			return 1
+		
+		# The program, once every unit is there
+		if args.link is not None:
+			program = os.path.join(cwd, args.link)
+			try:
+				await loop.run_in_executor(None, link, [job[1] for job in jobs], program, args.format)
+			except (LinkError, AssemblyError, OSError) as e:
+				await self.send(writer, out=f'{args.link}: FAILED: {e}\n')
+				return 1
+			await self.send(writer, out=f'Linked {args.link}\n')
+		
+		return 0
+	
+	
+	# Sends a line of JSON #
+	async def send(self, writer, **answer):
+		writer.write(json.dumps(answer).encode() + b'\n')
+		await writer.drain()
+
+
+
+if __name__ == '__main__':
+	args = argparse.ArgumentParser(description="Compile server, for 'client.py'.")
+	args.add_argument('--socket', default=SOCKET, help=f'Unix socket to listen on (default: {SOCKET})')
+	args.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='worker processes (default: one per CPU)')
+	args = args.parse_args()
+	
+	try:
+		asyncio.run(Server(args.socket, args.jobs)())
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,388 @@
+import sys
+import argparse
+from peephole import Inst, LABEL, RAW
+from assembler import REGISTERS, MASK, s32, expand
+from errors import SimulationError
+
+
+# Cycles of each instruction, the ones missing take one (VR4300 latencies)
+COSTS = {
+	'mult': 5,
+	'multu': 5,
+	'div': 37,
+	'divu': 37
+}
+
+# Instructions executed before giving up, programs have no loops yet
+MAX_STEPS = 10_000_000
+
+
+
+# Instruction operands #
+# Registers become their number, immediates and memory offsets integers
+# and labels stay as they are (they are resolved once all are known)
+def operand(arg):
+	if arg in REGISTERS:
+		return REGISTERS[arg]
+	
+	# 'offset($reg)'
+	if arg.endswith(')'):
+		offset, _, base = arg[:-1].partition('(')
+		return (int(offset or '0', 0), REGISTERS[base])
+	
+	try:
+		return int(arg, 0)
+	except ValueError:
+		return arg
+
+
+
+class Simulator:
+	# Initialize simulator #
+	# Runs 'asm' (lines of assembly, as the generators emit it) from the
+	# '.entry' label until 'mtc2 $zero, 0', with branch delay slots
+	# 'costs' gives the cycles of each instruction (one if missing), and with
+	# 'trap', overflows of 'add', 'addi' and 'sub' raise SimulationError like
+	# the hardware exception (otherwise they wrap)
+	# 'out' has '$v0' at the end and what the run took: instructions,
+	# cycles, loads, stores, and the bytes of stack used
+	def __init__(self, asm, costs=None, trap=False, max_steps=MAX_STEPS):
+		self.costs = COSTS if costs is None else costs
+		self.trap = trap
+		self.max_steps = max_steps
+		self.out = {}
+		self(asm)
+	
+	
+	# Loads and runs the program #
+	def __call__(self, asm):
+		program, sources, entry = self.load(asm)
+		
+		regs = self.regs = [0] * 32
+		self.memory = {}
+		self.hi = self.lo = 0
+		self.loads = self.stores = 0
+		self.stack = None  # Top of the stack, the highest value '$sp' gets
+		self.low = None  # Lowest stack address accessed
+		
+		handlers = {op: getattr(self, 'op_' + op) for op in {inst[0] for inst in program}}
+		costs = self.costs
+		steps = cycles = 0
+		pc, npc = entry, entry + 1
+		
+		while True:
+			if not 0 <= pc < len(program):
+				raise SimulationError(f'Jumped outside of the program (address {pc * 4})')
+			
+			op, args = program[pc]
+			steps += 1
+			cycles += costs.get(op, 1)
+			if steps > self.max_steps:
+				raise SimulationError(f'Still running after {self.max_steps} instructions', sources[pc])
+			if op == 'mtc2':
+				break
+			
+			try:
+				target = handlers[op](pc, *args)
+			except SimulationError as e:
+				e.line = sources[pc]
+				raise
+			
+			regs[0] = 0
+			pc, npc = npc, npc + 1 if target is None else target
+		
+		stack = 0
+		if self.stack is not None and self.low is not None:
+			stack = max(0, self.stack + 4 - self.low)  # The top word is used too
+		
+		self.out = {
+			'v0': regs[2],
+			'instructions': steps,
+			'cycles': cycles,
+			'loads': self.loads,
+			'stores': self.stores,
+			'stack': stack
+		}
+	
+	
+	# Decodes the program #
+	# Returns the instructions as '(op, operands)', their source lines, and
+	# the index of the entry point
+	def load(self, asm):
+		program = []
+		sources = []
+		labels = {}
+		entry = 'reset'
+		
+		for line in '\n'.join(asm).split('\n'):
+			inst = Inst.parse(line)
+			if inst.op == RAW:
+				words = line.split()
+				if words and words[0] == '.entry' and len(words) > 1:
+					entry = words[1]
+				continue
+			
+			if inst.op == LABEL:
+				labels[inst.args[0]] = len(program)
+				continue
+			
+			if not hasattr(self, 'op_' + inst.op) and inst.op not in ('li', 'move'):
+				raise SimulationError(f"Unknown instruction '{inst.op}'", line)
+			
+			for real in expand(inst):
+				program.append((real.op, [operand(arg) for arg in real.args]))
+				sources.append(line)
+		
+		# Labels become instruction indexes
+		for idx, (op, args) in enumerate(program):
+			for pos, arg in enumerate(args):
+				if type(arg) is str:
+					if arg not in labels:
+						raise SimulationError(f"Unknown label '{arg}'", sources[idx])
+					args[pos] = labels[arg]
+		
+		if entry not in labels:
+			raise SimulationError(f"Entry point '{entry}' not found")
+		return program, sources, labels[entry]
+	
+	
+	# Word address of a memory operand #
+	def address(self, offset, base):
+		address = s32(self.regs[base] + offset)
+		if address & 3:
+			raise SimulationError(f'Unaligned access (address {address})')
+		
+		if base == 29 and self.stack is not None:
+			self.low = address if self.low is None else min(self.low, address)
+		return address
+	
+	
+	# Adds two values, trapping on overflow if asked #
+	def add(self, a, b):
+		value = a + b
+		if self.trap and s32(value) != value:
+			raise SimulationError('Integer overflow')
+		return s32(value)
+	
+	
+	# Writes a register, remembering where the stack starts #
+	# The stack grows down, so its top is the highest '$sp' seen; the first
+	# write alone could be the 'lui' half of a 'li'
+	def write(self, reg, value):
+		self.regs[reg] = value
+		if reg == 29 and (self.stack is None or value > self.stack):
+			self.stack = value
+	
+	
+	# Arithmetic #
+	# Each instruction gets its address ('pc', as an index) and operands, and
+	# returns the index of the jump target (None to go on)
+	
+	def op_add(self, pc, d, a, b):
+		self.write(d, self.add(self.regs[a], self.regs[b]))
+	
+	def op_addu(self, pc, d, a, b):
+		self.write(d, s32(self.regs[a] + self.regs[b]))
+	
+	def op_addi(self, pc, d, a, imm):
+		self.write(d, self.add(self.regs[a], s32(imm)))
+	
+	def op_addiu(self, pc, d, a, imm):
+		self.write(d, s32(self.regs[a] + imm))
+	
+	def op_sub(self, pc, d, a, b):
+		self.write(d, self.add(self.regs[a], -self.regs[b]))
+	
+	def op_subu(self, pc, d, a, b):
+		self.write(d, s32(self.regs[a] - self.regs[b]))
+	
+	def op_lui(self, pc, d, imm):
+		self.write(d, s32(imm << 16))
+	
+	def op_mult(self, pc, a, b):
+		product = self.regs[a] * self.regs[b]
+		self.lo, self.hi = s32(product), s32(product >> 32)
+	
+	def op_multu(self, pc, a, b):
+		product = (self.regs[a] & MASK) * (self.regs[b] & MASK)
+		self.lo, self.hi = s32(product), s32(product >> 32)
+	
+	# Division by zero doesn't trap, the results are the VR4300 ones
+	def op_div(self, pc, a, b):
+		x, y = self.regs[a], self.regs[b]
+		if y == 0:
+			self.lo, self.hi = (-1 if x >= 0 else 1), x
+			return
+		
+		quotient = abs(x) // abs(y)
+		if (x < 0) != (y < 0):
+			quotient = -quotient
+		self.lo, self.hi = s32(quotient), s32(x - quotient * y)
+	
+	def op_divu(self, pc, a, b):
+		x, y = self.regs[a] & MASK, self.regs[b] & MASK
+		if y == 0:
+			self.lo, self.hi = -1, s32(x)
+			return
+		self.lo, self.hi = s32(x // y), s32(x % y)
+	
+	def op_mflo(self, pc, d):
+		self.write(d, self.lo)
+	
+	def op_mfhi(self, pc, d):
+		self.write(d, self.hi)
+	
+	
+	# Logic and comparisons #
+	
+	def op_and(self, pc, d, a, b):
+		self.write(d, self.regs[a] & self.regs[b])
+	
+	def op_or(self, pc, d, a, b):
+		self.write(d, self.regs[a] | self.regs[b])
+	
+	def op_xor(self, pc, d, a, b):
+		self.write(d, self.regs[a] ^ self.regs[b])
+	
+	def op_nor(self, pc, d, a, b):
+		self.write(d, s32(~(self.regs[a] | self.regs[b])))
+	
+	def op_andi(self, pc, d, a, imm):
+		self.write(d, self.regs[a] & imm & 0xffff)
+	
+	def op_ori(self, pc, d, a, imm):
+		self.write(d, s32(self.regs[a] | imm & 0xffff))
+	
+	def op_xori(self, pc, d, a, imm):
+		self.write(d, s32(self.regs[a] ^ imm & 0xffff))
+	
+	def op_slt(self, pc, d, a, b):
+		self.write(d, int(self.regs[a] < self.regs[b]))
+	
+	def op_sltu(self, pc, d, a, b):
+		self.write(d, int(self.regs[a] & MASK < self.regs[b] & MASK))
+	
+	def op_slti(self, pc, d, a, imm):
+		self.write(d, int(self.regs[a] < s32(imm)))
+	
+	# The immediate is sign-extended, then compared as unsigned
+	def op_sltiu(self, pc, d, a, imm):
+		self.write(d, int(self.regs[a] & MASK < s32(imm) & MASK))
+	
+	
+	# Shifts #
+	
+	def op_sll(self, pc, d, a, shift):
+		self.write(d, s32(self.regs[a] << (shift & 31)))
+	
+	def op_srl(self, pc, d, a, shift):
+		self.write(d, s32((self.regs[a] & MASK) >> (shift & 31)))
+	
+	def op_sra(self, pc, d, a, shift):
+		self.write(d, self.regs[a] >> (shift & 31))
+	
+	def op_sllv(self, pc, d, a, b):
+		self.write(d, s32(self.regs[a] << (self.regs[b] & 31)))
+	
+	def op_srlv(self, pc, d, a, b):
+		self.write(d, s32((self.regs[a] & MASK) >> (self.regs[b] & 31)))
+	
+	def op_srav(self, pc, d, a, b):
+		self.write(d, self.regs[a] >> (self.regs[b] & 31))
+	
+	
+	# Memory #
+	
+	def op_lw(self, pc, d, memory):
+		self.loads += 1
+		self.write(d, self.memory.get(self.address(*memory), 0))
+	
+	def op_sw(self, pc, s, memory):
+		self.stores += 1
+		self.memory[self.address(*memory)] = self.regs[s]
+	
+	
+	# Branches and jumps #
+	# The target is taken after the delay slot (the next instruction)
+	
+	def op_beq(self, pc, a, b, label):
+		if self.regs[a] == self.regs[b]:
+			return label
+	
+	def op_bne(self, pc, a, b, label):
+		if self.regs[a] != self.regs[b]:
+			return label
+	
+	def op_blez(self, pc, a, label):
+		if self.regs[a] <= 0:
+			return label
+	
+	def op_bgtz(self, pc, a, label):
+		if self.regs[a] > 0:
+			return label
+	
+	def op_bltz(self, pc, a, label):
+		if self.regs[a] < 0:
+			return label
+	
+	def op_bgez(self, pc, a, label):
+		if self.regs[a] >= 0:
+			return label
+	
+	def op_j(self, pc, label):
+		return label
+	
+	# Returns after the delay slot, addresses are 4 bytes per instruction
+	def op_jal(self, pc, label):
+		self.write(31, (pc + 2) * 4)
+		return label
+	
+	def op_jr(self, pc, a):
+		return self.regs[a] // 4
+	
+	def op_jalr(self, pc, a):
+		target = self.regs[a] // 4
+		self.write(31, (pc + 2) * 4)
+		return target
+	
+	def op_nop(self, pc):
+		pass
+	
+	# Halts the program, the main loop stops before running it
+	def op_mtc2(self, pc, reg, selector):
+		pass
+
+
+
+# Command line entry point #
+# Runs assembly files, printing what each one took
+def main(argv=None):
+	args = argparse.ArgumentParser(description='Runs MIPS assembly from the compiler.')
+	args.add_argument('files', nargs='+', help='assembly files')
+	args.add_argument('--cost', action='append', default=[], metavar='OP=CYCLES',
+	                  help="cycles of an instruction, may be repeated (like '--cost div=69')")
+	args.add_argument('--trap', action='store_true', help="overflows of 'add', 'addi' and 'sub' stop the program")
+	args = args.parse_args(argv)
+	
+	costs = dict(COSTS)
+	for cost in args.cost:
+		op, _, cycles = cost.partition('=')
+		costs[op] = int(cycles)
+	
+	status = 0
+	for fname in args.files:
+		try:
+			with open(fname) as file:
+				sim = Simulator(file.read().split('\n'), costs, args.trap)
+		except (OSError, SimulationError) as e:
+			print(f'{fname}: FAILED: {e}')
+			status = 1
+			continue
+		
+		print(f'{fname}: ' + ', '.join(f'{key} {value}' for key, value in sim.out.items()))
+	
+	return status
+
+
+if __name__ == '__main__':
+	sys.exit(main())
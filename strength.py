@@ -0,0 +1,187 @@
+from nodes import Op
+from folder import wrap
+
+
+# Strength reduction #
+# Multiplications, divisions and remainders by a constant, rewritten as
+# shifts and adds, or as a multiply-high by a "magic number" (Hacker's Delight,
+# chapter 10), instead of the slow 'mult' / 'div'
+# The templates use '{d}' for the destination, '{a}' for the other operand
+# and '{t}', '{u}' for scratch registers ('{d}' may be the same as '{a}')
+# Constants are loaded with 'load', the selector's templates use it too
+
+
+# Template that loads a constant into '{d}' #
+# Without 'li', so big constants are split in 'lui' / 'ori' explicitly
+def load(value):
+	value = wrap(value)
+	if -0x8000 <= value <= 0x7fff:
+		return f'\taddiu {{d}}, $zero, {value}'
+	if 0 <= value <= 0xffff:
+		return f'\tori {{d}}, $zero, {value}'
+	
+	high = (value >> 16) & 0xffff
+	low = value & 0xffff
+	if not low:
+		return f'\tlui {{d}}, {high}'
+	return f'\tlui {{d}}, {high}\n\tori {{d}}, {{d}}, {low}'
+
+
+# Non-adjacent form of a number, as (sign, shift) terms #
+# 7 -> [(-1, 0), (1, 3)] (-1 + 8), no two terms have adjacent shifts
+def naf(value):
+	terms = []
+	shift = 0
+	while value:
+		if value & 1:
+			digit = 2 - (value & 3)  # 1 or -1
+			terms.append((digit, shift))
+			value -= digit
+		value >>= 1
+		shift += 1
+	return terms
+
+
+# Signed division magic number and shift, for 2 <= |divisor| < 2**31 #
+# Not for powers of two, those are just shifted
+def magic(divisor):
+	two31 = 0x80000000
+	ad = abs(divisor)
+	t = two31 + (divisor < 0)
+	anc = t - 1 - t % ad  # Absolute value of nc
+	p = 31
+	q1, r1 = divmod(two31, anc)  # 2**p / |nc|
+	q2, r2 = divmod(two31, ad)  # 2**p / |d|
+	
+	while True:
+		p += 1
+		q1, r1 = q1 * 2, r1 * 2
+		if r1 >= anc:
+			q1, r1 = q1 + 1, r1 - anc
+		
+		q2, r2 = q2 * 2, r2 * 2
+		if r2 >= ad:
+			q2, r2 = q2 + 1, r2 - ad
+		
+		delta = ad - r2
+		if q1 > delta or q1 == delta and r1 != 0:
+			break
+	
+	number = wrap(q2 + 1)
+	return (wrap(-number) if divisor < 0 else number), p - 32
+
+
+# Multiply by a constant #
+def multiply(value):
+	if value == 0:
+		return load(0), 0
+	
+	terms = naf(value)
+	
+	# 2**k or -2**k
+	if len(terms) == 1:
+		sign, shift = terms[0]
+		text = f'\tsll {{d}}, {{a}}, {shift}'
+		if sign < 0:
+			text += '\n\tsubu {d}, $zero, {d}'
+		return text, 0
+	
+	# 2**k +- 2**j
+	if len(terms) == 2:
+		(low_sign, low), (high_sign, high) = terms
+		text = f'\tsll {{t}}, {{a}}, {high}\n'
+		if low:
+			text += f'\tsll {{d}}, {{a}}, {low}\n'
+			low_reg = '{d}'
+		else:
+			low_reg = '{a}'
+		
+		if high_sign > 0 and low_sign > 0:
+			text += f'\taddu {{d}}, {{t}}, {low_reg}'
+		elif high_sign > 0:
+			text += f'\tsubu {{d}}, {{t}}, {low_reg}'
+		elif low_sign > 0:
+			text += f'\tsubu {{d}}, {low_reg}, {{t}}'
+		else:
+			text += f'\taddu {{d}}, {{t}}, {low_reg}\n\tsubu {{d}}, $zero, {{d}}'
+		return text, 1
+	
+	return None
+
+
+# Quotient of a signed division by a constant, rounded toward zero #
+# Leaves the quotient in '{q}', reading '{a}' and using '{s}' as scratch
+def quotient(value):
+	shift = abs(value).bit_length() - 1
+	
+	# 2**k, rounded toward zero by adding 2**k - 1 to negative dividends
+	if abs(value) == 1 << shift:
+		if shift == 1:
+			text = '\tsrl {s}, {a}, 31\n'
+		else:
+			text = f'\tsra {{s}}, {{a}}, 31\n\tsrl {{s}}, {{s}}, {32 - shift}\n'
+		text += f'\taddu {{s}}, {{a}}, {{s}}\n\tsra {{q}}, {{s}}, {shift}'
+		if value < 0:
+			text += '\n\tsubu {q}, $zero, {q}'
+		return text
+	
+	# Anything else, multiply-high by the magic number
+	number, shift = magic(value)
+	text = load(number).format(d='{s}') + '\n\tmult {a}, {s}\n\tmfhi {s}\n'
+	if value > 0 and number < 0:
+		text += '\taddu {s}, {s}, {a}\n'
+	elif value < 0 and number > 0:
+		text += '\tsubu {s}, {s}, {a}\n'
+	if shift:
+		text += f'\tsra {{s}}, {{s}}, {shift}\n'
+	
+	# Add 1 to negative quotients
+	return text + '\tsrl {q}, {s}, 31\n\taddu {q}, {s}, {q}'
+
+
+# Divide by a constant #
+def divide(value):
+	# Division by zero is left to the hardware
+	if value == 0:
+		return None
+	if value == 1:
+		return '\taddu {d}, $zero, {a}', 0
+	if value == -1:
+		return '\tsubu {d}, $zero, {a}', 0
+	
+	return quotient(value).format(q='{d}', s='{t}', a='{a}'), 1
+
+
+# Remainder of a division by a constant #
+# a - (a / c) * c, the sign of the divisor doesn't matter
+def remainder(value):
+	value = abs(value)
+	if value == 0:
+		return None
+	if value == 1:
+		return load(0), 0
+	
+	# 2**k, clear the low bits of the rounded dividend
+	shift = value.bit_length() - 1
+	if value == 1 << shift:
+		text = quotient(value).format(q='{t}', s='{t}', a='{a}')
+		return text + f'\n\tsll {{t}}, {{t}}, {shift}\n\tsubu {{d}}, {{a}}, {{t}}', 1
+	
+	text = quotient(value).format(q='{u}', s='{t}', a='{a}')
+	text += '\n' + load(value).format(d='{t}')
+	return text + '\n\tmult {u}, {t}\n\tmflo {t}\n\tsubu {d}, {a}, {t}', 2
+
+
+# Reduced sequence of an operation by a constant #
+# Returns '(template, scratch registers needed)', or None when there is
+# nothing better than the plain instruction
+# The constant is the right operand (either one for a multiplication)
+def sequence(op, value):
+	value = wrap(value)
+	if op == Op.MULT:
+		return multiply(value)
+	if op == Op.DIV:
+		return divide(value)
+	if op == Op.MOD:
+		return remainder(value)
+	return None
@@ -0,0 +1,149 @@
+import struct
+import unittest
+from folder import wrap
+from strength import load
+from peephole import Inst
+from assembler import Assembler, HEADER, MAGIC, ENTRYLESS, expand
+from pipeline import compile_source
+from simulator import Simulator
+from errors import AssemblyError
+from test_folder import EDGES, program, literal
+
+
+# Words of some lines of assembly, from the MIPS reference
+ENCODED = {
+	'add $t0, $t1, $t2': 0x012a4020,
+	'subu $v0, $zero, $t0': 0x00081023,
+	'slt $v0, $t0, $t1': 0x0109102a,
+	'sll $t0, $t1, 4': 0x00094100,
+	'sra $t0, $t1, 31': 0x000947c3,
+	'srav $t0, $t1, $t2': 0x01494007,
+	'mult $t0, $t1': 0x01090018,
+	'div $t0, $t1': 0x0109001a,
+	'mflo $v0': 0x00001012,
+	'mfhi $v0': 0x00001010,
+	'jr $ra': 0x03e00008,
+	'addi $sp, $sp, -4': 0x23bdfffc,
+	'addiu $v0, $zero, -1': 0x2402ffff,
+	'sltiu $v0, $v0, 1': 0x2c420001,
+	'andi $t0, $t1, 65535': 0x3128ffff,
+	'lui $t0, 4660': 0x3c081234,
+	'ori $t0, $t0, 22136': 0x35085678,
+	'lw $t0, 4($sp)': 0x8fa80004,
+	'sw $t0, -4($sp)': 0xafa8fffc,
+	'mtc2 $zero, 0': 0x48800000,
+	'nop': 0
+}
+
+# Immediates just out of their range
+OUT_OF_RANGE = ('addi $t0, $t0, 32768', 'addiu $t0, $t0, -32769', 'ori $t0, $t0, -1',
+                'andi $t0, $t0, 65536', 'lui $t0, 65536', 'sll $t0, $t0, 32', 'lw $t0, 32768($sp)')
+
+
+
+# Words of some lines #
+def words(*lines, **options):
+	return Assembler('', ['\t' + line if not line.endswith(':') else line for line in lines], **options).out
+
+
+
+class EncodingTest(unittest.TestCase):
+	def test_encodings(self):
+		for line, word in ENCODED.items():
+			with self.subTest(line=line):
+				self.assertEqual(words(line), [word])
+	
+	
+	def test_out_of_range(self):
+		for line in OUT_OF_RANGE:
+			with self.subTest(line=line):
+				self.assertRaises(AssemblyError, words, line)
+	
+	
+	def test_unknown(self):
+		self.assertRaises(AssemblyError, words, 'frob $t0')
+		self.assertRaises(AssemblyError, words, 'add $t0, $t1')
+		self.assertRaises(AssemblyError, words, 'add $t0, $t1, $x9')
+	
+	
+	# 'li' expands like 'load' does, one word when 16 bits are enough #
+	def test_li(self):
+		for value in EDGES + (0x7fff, 0x8000, -0x8000, -0x8001, 0xffff, 0x10000, 0x12340000, 0x12345678):
+			with self.subTest(value=value):
+				real = '\n'.join(str(inst) for inst in expand(Inst.parse(f'\tli $t0, {value}')))
+				self.assertEqual(real, load(value).format(d='$t0'))
+				self.assertEqual(len(words(f'li $t0, {value}')), real.count('\n') + 1)
+
+
+
+class BranchTest(unittest.TestCase):
+	# Offsets in words from the delay slot, forward and backward #
+	def test_branch(self):
+		self.assertEqual(words('beq $t0, $zero, end', 'nop', 'nop', 'end:')[0], 0x11000002)
+		self.assertEqual(words('loop:', 'nop', 'beq $zero, $zero, loop', 'nop')[1], 0x1000fffe)
+		self.assertEqual(words('bgez $t0, end', 'nop', 'end:')[0], 0x05010001)
+		self.assertEqual(words('bltz $t0, end', 'nop', 'end:')[0], 0x05000001)
+	
+	
+	# Jumps hold the word address of their target #
+	def test_jump(self):
+		self.assertEqual(words('j end', 'nop', 'end:')[0], 0x08000002)
+		self.assertEqual(words('jal end', 'nop', 'end:', base=0x400000)[0], 0x0c100002)
+	
+	
+	def test_unknown_label(self):
+		self.assertRaises(AssemblyError, words, 'beq $t0, $zero, nowhere', 'nop')
+		self.assertRaises(AssemblyError, words, 'j nowhere', 'nop')
+
+
+
+class ImageTest(unittest.TestCase):
+	# Jumps to undefined labels are left for the linker with 'extern' #
+	def test_relocations(self):
+		assembler = Assembler('', ['\tnop', '\tjal _f', '\tnop'], extern=True)
+		self.assertEqual(assembler.out, [0, 0x0c000000, 0])
+		self.assertEqual(assembler.relocations, [(4, '_f')])
+		self.assertRaises(AssemblyError, assembler.flat)
+	
+	
+	# Header, words, then the symbols and the relocations #
+	def test_object(self):
+		assembler = Assembler('', ['.entry start', 'start:', '\tjal _f', '\tnop'], base=0x100, extern=True)
+		image = assembler.object()
+		
+		magic, entry, count, symbols, relocations = HEADER.unpack_from(image)
+		self.assertEqual((magic, entry, count, symbols, relocations), (MAGIC, 0x100, 2, 1, 1))
+		self.assertEqual(list(struct.unpack_from('>2I', image, HEADER.size)), [0x0c000000, 0])
+		
+		offset = HEADER.size + 8
+		names = []
+		for _ in range(symbols + relocations):
+			address, size = struct.unpack_from('>IH', image, offset)
+			offset += 6
+			names.append((address, image[offset:offset + size].decode()))
+			offset += size
+		self.assertEqual(names, [(0x100, 'start'), (0x100, '_f')])
+		self.assertEqual(offset, len(image))
+		
+		self.assertEqual(HEADER.unpack_from(Assembler('', ['\tnop']).object())[1], ENTRYLESS)
+	
+	
+	# The flat image of a compiled program is its words, big-endian #
+	def test_flat(self):
+		for value in EDGES:
+			asm = compile_source(program(f'{literal(value)} + 0'), fold=False).asm
+			assembler = Assembler('', asm)
+			image = assembler.flat()
+			with self.subTest(value=value):
+				self.assertEqual(len(image), 4 * len(assembler.out))
+				self.assertEqual(list(struct.unpack(f'>{len(assembler.out)}I', image)), assembler.out)
+				self.assertEqual(Simulator(asm).out['v0'], wrap(value))
+	
+	
+	def test_flat_entry(self):
+		self.assertRaises(AssemblyError, Assembler('', ['\tnop', '.entry start', 'start:', '\tnop']).flat)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,97 @@
+import os
+import time
+import pickle
+import tempfile
+import unittest
+from cache import Cache, SUFFIX, TEMP, STALE
+
+
+
+class CacheTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.TemporaryDirectory()
+		self.cache = Cache(self.folder.name)
+	
+	
+	def tearDown(self):
+		self.folder.cleanup()
+	
+	
+	# Files of the cache folder with an extension #
+	def files(self, suffix):
+		return [name for _, _, files in os.walk(self.folder.name) for name in files if name.endswith(suffix)]
+	
+	
+	# The key changes with the source, the options and the compiler #
+	def test_key(self):
+		key = self.cache.key('int main() {}', pipeline='direct')
+		self.assertEqual(key, self.cache.key('int main() {}', pipeline='direct'))
+		self.assertNotEqual(key, self.cache.key('int main() { }', pipeline='direct'))
+		self.assertNotEqual(key, self.cache.key('int main() {}', pipeline='ir'))
+		
+		self.cache.version = 'other'
+		self.assertNotEqual(key, self.cache.key('int main() {}', pipeline='direct'))
+	
+	
+	def test_put_get(self):
+		key = self.cache.key('code')
+		self.assertIsNone(self.cache.get(key))
+		self.cache.put(key, {'asm': ['nop']})
+		self.assertEqual(self.cache.get(key), {'asm': ['nop']})
+		self.assertEqual(self.files(TEMP), [])
+	
+	
+	# A failed write leaves neither an entry nor its temporary file #
+	def test_put_failed(self):
+		key = self.cache.key('code')
+		with self.assertRaises((pickle.PicklingError, AttributeError, TypeError)):
+			self.cache.put(key, lambda: None)
+		self.assertIsNone(self.cache.get(key))
+		self.assertEqual(self.files(''), [])
+	
+	
+	# An unreadable entry is a miss #
+	def test_corrupt(self):
+		key = self.cache.key('code')
+		self.cache.put(key, 'entry')
+		with open(self.cache.path(key), 'wb') as file:
+			file.write(b'not a pickle')
+		self.assertIsNone(self.cache.get(key))
+	
+	
+	# The least recently used entries go first, a hit counts as a use #
+	def test_trim(self):
+		keys = [self.cache.key(str(idx)) for idx in range(4)]
+		now = time.time()
+		for idx, key in enumerate(keys):
+			self.cache.put(key, 'x' * 1000)
+			os.utime(self.cache.path(key), (now - 100 + idx, now - 100 + idx))
+		self.cache.get(keys[0])
+		
+		size = os.path.getsize(self.cache.path(keys[0]))
+		self.cache.max_size = 2 * size
+		self.assertEqual(self.cache.trim(), 2)
+		self.assertEqual([self.cache.get(key) is not None for key in keys], [True, False, False, True])
+		self.assertEqual(len(self.files(SUFFIX)), 2)
+	
+	
+	# Temporary files left by a dead writer are removed, not the fresh ones #
+	def test_trim_temp(self):
+		folder = os.path.join(self.folder.name, 'ab')
+		os.makedirs(folder)
+		old = os.path.join(folder, 'old' + TEMP)
+		new = os.path.join(folder, 'new' + TEMP)
+		for path in (old, new):
+			with open(path, 'wb') as file:
+				file.write(b'x' * 1000)
+		then = time.time() - STALE - 1
+		os.utime(old, (then, then))
+		
+		self.assertEqual(self.cache.trim(), 0)
+		self.assertFalse(os.path.exists(old))
+		self.assertTrue(os.path.exists(new))
+
+
+
+if __name__ == '__main__':
+	unittest.main()
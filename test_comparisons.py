@@ -0,0 +1,46 @@
+import unittest
+from test_folder import EDGES, literal, folded, run
+
+
+# The edges, and the ends of the 16-bit immediates
+VALUES = EDGES + (0x7fff, 0x8000, -0x8000, -0x8001, 0xffff, 0x10000)
+
+COMPARISONS = ('==', '!=', '<', '>', '<=', '>=')
+
+
+
+class ComparisonTest(unittest.TestCase):
+	# Checks both pipelines against the folded value #
+	def check(self, expr):
+		expected = folded(expr)
+		for pipeline in ('direct', 'ir'):
+			with self.subTest(expr=expr, pipeline=pipeline):
+				self.assertEqual(run(expr, pipeline), expected)
+	
+	
+	# Constant right or left operand, the immediate forms #
+	def test_immediate(self):
+		for op in COMPARISONS:
+			for a in VALUES:
+				for b in VALUES:
+					self.check(f'({literal(a)} | 0) {op} {literal(b)}')
+					self.check(f'{literal(a)} {op} ({literal(b)} | 0)')
+	
+	
+	# Both operands in registers, 'slt' can't overflow like a subtraction #
+	def test_registers(self):
+		for op in COMPARISONS:
+			for a in EDGES:
+				for b in EDGES:
+					self.check(f'({literal(a)} | 0) {op} ({literal(b)} | 0)')
+	
+	
+	def test_not(self):
+		for a in VALUES:
+			self.check(f'!({literal(a)} | 0)')
+			self.check(f'!!({literal(a)} | 0)')
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from nodes import Op
+from folder import wrap, div, mod
+from pipeline import compile_source
+from simulator import Simulator
+
+
+# Constants where 32-bit arithmetic goes wrong
+EDGES = (0, 1, -1, 2, -2, 16, -0x10000, -0x80000000, 0x7fffffff)
+
+OPERATORS = ('+', '-', '*', '/', '%', '<<', '>>', '&', '|', '^', '==', '!=', '<', '>', '<=', '>=')
+
+
+
+# Source of a program returning 'expr' #
+def program(expr):
+	return f'int main() {{\n\treturn {expr};\n}}\n'
+
+
+# Constant, as the lexer reads it (INT_MIN has no literal) #
+def literal(value):
+	return '(-2147483647 - 1)' if value == -0x80000000 else f'({value})'
+
+
+# Value of the folded program, None if it's not a constant #
+def folded(expr):
+	node = compile_source(program(expr)).ast.body[0].body[0].value
+	return node.value if node.op == Op.INTEGER else None
+
+
+# '$v0' of the program compiled without folding #
+def run(expr, pipeline):
+	return Simulator(compile_source(program(expr), pipeline=pipeline, fold=False).asm).out['v0']
+
+
+
+class ArithmeticTest(unittest.TestCase):
+	# Values wrap around to 32-bit signed #
+	def test_wrap(self):
+		self.assertEqual(wrap(0x7fffffff), 0x7fffffff)
+		self.assertEqual(wrap(0x80000000), -0x80000000)
+		self.assertEqual(wrap(0xffffffff), -1)
+		self.assertEqual(wrap(-0x80000001), 0x7fffffff)
+		self.assertEqual(wrap(1 << 40), 0)
+	
+	
+	# Division rounds toward zero, the remainder has the sign of the dividend #
+	def test_div_mod(self):
+		self.assertEqual((div(7, 2), mod(7, 2)), (3, 1))
+		self.assertEqual((div(-7, 2), mod(-7, 2)), (-3, -1))
+		self.assertEqual((div(7, -2), mod(7, -2)), (-3, 1))
+		self.assertEqual((div(-7, -2), mod(-7, -2)), (3, -1))
+		self.assertEqual((div(-0x80000000, 1), mod(-0x80000000, 1)), (-0x80000000, 0))
+	
+	
+	# Undefined on the hardware, left for run time #
+	def test_undefined(self):
+		self.assertIsNone(div(5, 0))
+		self.assertIsNone(mod(5, 0))
+		self.assertIsNone(div(-0x80000000, -1))
+		self.assertIsNone(mod(-0x80000000, -1))
+		self.assertIsNone(folded('5 / 0'))
+		self.assertIsNone(folded('(-2147483647 - 1) / -1'))
+
+
+
+class FolderTest(unittest.TestCase):
+	# Folded and generated code agree on every operator #
+	def test_binary(self):
+		for op in OPERATORS:
+			for a in EDGES:
+				for b in EDGES:
+					if op in '/%' and (b == 0 or (a, b) == (-0x80000000, -1)):
+						continue
+					
+					expr = f'{literal(a)} {op} {literal(b)}'
+					expected = folded(expr)
+					for pipeline in ('direct', 'ir'):
+						with self.subTest(expr=expr, pipeline=pipeline):
+							self.assertEqual(run(expr, pipeline), expected)
+	
+	
+	def test_unary(self):
+		for op in '-~!+':
+			for a in EDGES:
+				expr = f'{op}{literal(a)}'
+				expected = folded(expr)
+				for pipeline in ('direct', 'ir'):
+					with self.subTest(expr=expr, pipeline=pipeline):
+						self.assertEqual(run(expr, pipeline), expected)
+	
+	
+	# Big literals wrap like the registers do #
+	def test_literals(self):
+		self.assertEqual(folded('-2147483648'), -0x80000000)
+		self.assertEqual(folded('0x7fffffff + 1'), -0x80000000)
+		for pipeline in ('direct', 'ir'):
+			self.assertEqual(run('2147483648', pipeline), -0x80000000)
+			self.assertEqual(run('0xffffffff', pipeline), -1)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
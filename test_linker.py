@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from nodes import to_postfix
+from linker import Linker, make_unit, fresh, read_unit
+from pipeline import compile_source
+from simulator import Simulator
+from compiler import summary
+from errors import LinkError
+from test_folder import EDGES, literal
+
+
+# Unit of a source #
+def unit(fname, code, pipeline='direct'):
+	result = compile_source(code, pipeline=pipeline)
+	return make_unit(fname, code, pipeline, result.asm, to_postfix(result.ast), '')
+
+
+
+class LinkerTest(unittest.TestCase):
+	# The functions of every unit follow the stub, 'main' runs #
+	def test_link(self):
+		for value in EDGES:
+			units = [unit('a.c', 'int f() {\n\treturn 1;\n}\n'),
+			         unit('b.c', f'int main() {{\n\treturn {literal(value)};\n}}\n')]
+			linker = Linker(units)
+			with self.subTest(value=value):
+				self.assertEqual(linker.symbols['f']['file'], 'a.c')
+				self.assertEqual(linker.symbols['main']['file'], 'b.c')
+				self.assertEqual(Simulator(linker.out).out['v0'], value)
+	
+	
+	# A function defined twice names both places #
+	def test_duplicate(self):
+		units = [unit('a.c', 'int main() {\n\treturn 1;\n}\n'),
+		         unit('b.c', '\nint main() {\n\treturn 2;\n}\n')]
+		with self.assertRaises(LinkError) as error:
+			Linker(units)
+		self.assertIn("b.c:2:4: Function 'main' already defined at 'a.c', line 1, offset 4", str(error.exception))
+	
+	
+	def test_no_main(self):
+		self.assertRaises(LinkError, Linker, [unit('a.c', 'int f() {\n\treturn 1;\n}\n')])
+	
+	
+	# Statements outside of a function define nothing #
+	def test_symbols(self):
+		code = 'return 3;\nint f() {\n\treturn 1;\n}\nint g() {\n\treturn 2;\n}\n'
+		self.assertEqual(unit('a.c', code)['symbols'], {'f': [2, 4], 'g': [5, 4]})
+	
+	
+	def test_stub(self):
+		self.assertRaises(ValueError, make_unit, 'a.c', '', 'direct', ['_main:'], to_postfix(compile_source('').ast), '')
+
+
+
+class FreshTest(unittest.TestCase):
+	# Up to date until the source, the pipeline or the compiler change #
+	def test_fresh(self):
+		code = 'int main() {\n\treturn 1;\n}\n'
+		current = unit('a.c', code)
+		self.assertTrue(fresh(current, code, 'direct'))
+		self.assertFalse(fresh(current, code.replace('1', '2'), 'direct'))
+		self.assertFalse(fresh(current, code, 'ir'))
+		
+		current['version'] = 'other'
+		self.assertFalse(fresh(current, code, 'direct'))
+	
+	
+	def test_read_unit(self):
+		with tempfile.TemporaryDirectory() as folder:
+			path = os.path.join(folder, 'a.obj')
+			self.assertIsNone(read_unit(path))
+			with open(path, 'w') as file:
+				file.write('{not json')
+			self.assertIsNone(read_unit(path))
+	
+	
+	# Units reused as they were are not counted as compiled #
+	def test_summary(self):
+		self.assertEqual(summary(2, 0, 2, None, 'prog.s'), '0 compiled, 0 failed, 2 unchanged')
+		self.assertEqual(summary(3, 1, 1, None, 'prog.s'), '1 compiled, 1 failed, 1 unchanged')
+		self.assertEqual(summary(2, 0, 0, None), '2 compiled, 0 failed')
+
+
+
+if __name__ == '__main__':
+	unittest.main()
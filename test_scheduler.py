@@ -0,0 +1,27 @@
+import unittest
+from scheduler import Scheduler
+
+
+
+class FillBeforeTest(unittest.TestCase):
+	# An instruction from before a jump goes in its delay slot #
+	def test_fill_before(self):
+		sched = Scheduler('', ['_main:', '\tli $t0, 1', '\taddi $v0, $zero, 3', '\tjr $ra', '\tnop'])
+		self.assertEqual(sched.out[-2:], ['\tjr $ra', '\taddi $v0, $zero, 3'])
+		self.assertEqual(sched.filled['before'], 1)
+		self.assertEqual(sched.filled['nop'], 0)
+	
+	
+	# Slots of consecutive blocks are filled from their own block #
+	def test_fill_before_blocks(self):
+		asm = ['_f:', '\taddi $t1, $zero, 2', '\tjal _g', '\tnop',
+		       '\taddi $v0, $zero, 3', '\tjr $ra', '\tnop']
+		sched = Scheduler('', asm)
+		self.assertEqual(sched.out, ['_f:', '\tjal _g', '\taddi $t1, $zero, 2',
+		                             '\tjr $ra', '\taddi $v0, $zero, 3'])
+		self.assertEqual(sched.filled['before'], 2)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from nodes import Integer
+from folder import wrap
+from generator import HEADER
+from selector import KINDS, load, select
+from pipeline import compile_source
+from simulator import Simulator
+from test_folder import EDGES, program, literal, folded, run
+
+
+# The edges, and the ends of the 16-bit immediates
+VALUES = EDGES + (0x7fff, 0x8000, -0x8000, -0x8001, 0xffff, 0x10000, 0x12340000, 0x12345678)
+
+# Immediate kind of the constant right operand of each operator
+IMMEDIATE = {
+	'+': 'imm16',
+	'-': 'neg16',
+	'&': 'uimm16',
+	'|': 'uimm16',
+	'^': 'uimm16',
+	'<<': 'shamt',
+	'>>': 'shamt',
+	'<': 'imm16',
+	'>=': 'imm16',
+	'<=': 'inc16',
+	'>': 'inc16'
+}
+
+
+
+# Tile chosen for 'lhs op value', 'lhs' not being constant #
+# Without folding a negative constant is a unary minus, so it's put as is
+def tile(lhs, op, value):
+	node = compile_source(program(f'{lhs} {op} 0'), fold=False).ast.body[0].body[0].value
+	node.rhs = Integer(wrap(value))
+	return select(node)[id(node)]
+
+
+
+class LoadTest(unittest.TestCase):
+	# One instruction when 16 bits are enough, 'lui' + 'ori' otherwise #
+	def test_load(self):
+		for value in VALUES + (0xffffffff, 0x80000000, 0x10001):
+			template = load(value)
+			asm = [HEADER, '_main:', template.format(d='$v0'), '\tjr $ra', '\tnop']
+			lines = template.split('\n')
+			
+			with self.subTest(value=value):
+				self.assertEqual(Simulator(asm).out['v0'], wrap(value))
+				self.assertNotIn('li', [line.split()[0] for line in lines])
+				
+				small = -0x8000 <= wrap(value) <= 0xffff or not value & 0xffff
+				self.assertEqual(len(lines), 1 if small else 2)
+	
+	
+	# No 'li' left in the direct pipeline but the stack pointer's #
+	def test_no_li(self):
+		for value in VALUES:
+			asm = compile_source(program(literal(value)), fold=False).asm
+			self.assertEqual(sum(1 for line in asm for inst in line.split('\n') if inst.split()[:1] == ['li']), 1)
+
+
+
+class ImmediateTest(unittest.TestCase):
+	# The immediate form is used exactly when the constant fits #
+	def test_forms(self):
+		for op, kind in IMMEDIATE.items():
+			for value in VALUES:
+				with self.subTest(op=op, value=value):
+					fits = KINDS[kind][0](wrap(value))
+					self.assertEqual(tile('(1 | 0)', op, value).kinds == ('reg', kind), fits)
+	
+	
+	# Equality against zero reads '$zero' #
+	def test_zero(self):
+		for op in ('==', '!='):
+			self.assertEqual(tile('(5 | 0)', op, 0).kinds, ('reg', 'zero'))
+			self.assertEqual(tile('(5 | 0)', op, 7).kinds, ('reg', 'uimm16'))
+			self.assertEqual(tile('(5 | 0)', op, -7).kinds, ('reg', 'neg16'))
+			self.assertEqual(tile('(5 | 0)', op, 0x12345678).kinds, ('reg', 'reg'))
+	
+	
+	# Immediate forms compute the folded value at the ends of their range #
+	def test_run(self):
+		for op in list(IMMEDIATE) + ['==', '!=']:
+			for a in (0, -1, 0x7fff, -0x8000, 0x7fffffff, -0x80000000):
+				for b in VALUES:
+					expr = f'({literal(a)} | 0) {op} {literal(b)}'
+					expected = folded(expr)
+					for pipeline in ('direct', 'ir'):
+						with self.subTest(expr=expr, pipeline=pipeline):
+							self.assertEqual(run(expr, pipeline), expected)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
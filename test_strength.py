@@ -0,0 +1,76 @@
+import unittest
+from nodes import Op
+from strength import naf, magic, sequence
+from test_folder import EDGES, literal, folded, run
+
+
+# Constants the sequences depend on: powers of two, sums and differences
+# of two of them, and ones that need a magic number
+CONSTANTS = EDGES + (-16, 3, 5, 6, 7, -7, 10, 641, 0x40000000, -0x40000000, 0x7ffffffe)
+
+# Dividends, the edges and a few others
+DIVIDENDS = EDGES + (7, -7, 100, -100, 0x12345678, -0x7ffffffe)
+
+SYMBOLS = {Op.MULT: '*', Op.DIV: '/', Op.MOD: '%'}
+
+
+
+class SequenceTest(unittest.TestCase):
+	# The terms add back up to the number, none are adjacent #
+	def test_naf(self):
+		for value in CONSTANTS + (0xffffffff, 0x55555555):
+			terms = naf(value)
+			self.assertEqual(sum(sign << shift for sign, shift in terms), value)
+			shifts = [shift for sign, shift in terms]
+			self.assertTrue(all(b - a > 1 for a, b in zip(shifts, shifts[1:])))
+	
+	
+	# Multiply-high by the magic number, then shift, is the quotient #
+	def test_magic(self):
+		for divisor in (3, 5, 6, 7, -7, 10, 641, 0x7fffffff, -0x7fffffff):
+			number, shift = magic(divisor)
+			for a in DIVIDENDS:
+				high = (a * number) >> 32
+				if divisor > 0 and number < 0:
+					high += a
+				elif divisor < 0 and number > 0:
+					high -= a
+				q = high >> shift
+				q += q < 0
+				with self.subTest(a=a, divisor=divisor):
+					self.assertEqual(q, int(a / divisor))
+	
+	
+	# Constants go through 'load', never the 'li' pseudo-instruction #
+	def test_no_li(self):
+		for op in SYMBOLS:
+			for value in CONSTANTS:
+				reduced = sequence(op, value)
+				if reduced is not None:
+					self.assertNotIn('li', [line.split()[0] for line in reduced[0].split('\n')])
+
+
+
+class ReducedTest(unittest.TestCase):
+	# Reduced and folded values agree, constant on either side of '*' #
+	def test_run(self):
+		for op, symbol in SYMBOLS.items():
+			for value in CONSTANTS:
+				for a in DIVIDENDS:
+					if op != Op.MULT and (value == 0 or (a, value) == (-0x80000000, -1)):
+						continue
+					
+					exprs = [f'({literal(a)} | 0) {symbol} {literal(value)}']
+					if op == Op.MULT:
+						exprs.append(f'{literal(value)} * ({literal(a)} | 0)')
+					
+					for expr in exprs:
+						expected = folded(expr)
+						for pipeline in ('direct', 'ir'):
+							with self.subTest(expr=expr, pipeline=pipeline):
+								self.assertEqual(run(expr, pipeline), expected)
+
+
+
+if __name__ == '__main__':
+	unittest.main()